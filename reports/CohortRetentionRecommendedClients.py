@@ -0,0 +1,110 @@
+# reports/CohortRetentionRecommendedClients.py
+#------------------------------------------------------------------------------------
+# This script generates the cohort retention report of recommended clients.
+# Clients are grouped by the month of their first transaction with a distributor, and
+# the report shows the share of each cohort still borrowing 1 to N months later.
+# The retention is computed by src/cohorts.py; the report writes it as a table (CSV)
+# and as heatmaps, one overall and one per distributor, with the non-interactive
+# Agg backend when run as a plugin or without a display.
+#
+# Author: ekastel
+# Date: 2025-06-27
+#------------------------------------------------------------------------------------
+
+import os
+import sys
+import matplotlib
+
+# Select the non-interactive backend before pyplot is imported
+HEADLESS = (
+    __name__ != "__main__"
+    or "--headless" in sys.argv
+    or (sys.platform.startswith('linux') and not os.environ.get('DISPLAY'))
+)
+if HEADLESS:
+    matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+import seaborn as sns
+from pathlib import Path
+
+# Make the shared report data layer importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from config import REPORTS_OUTPUT_DIR, CHART_FORMATS, COHORT_MAX_OFFSET
+import cohorts
+import reportdata
+from reportregistry import register_report
+
+OUTPUT_PREFIX = 'Cohort_Retention'
+CHART_TITLE = 'Retention of Recommended Clients by Cohort'
+
+# Function to draw a retention heatmap
+def plot_retention_heatmap(matrix, title=CHART_TITLE):
+    """Draws the cohorts x months-since-first-transaction heatmap and returns the figure."""
+    fig, ax = plt.subplots(figsize=(14, max(4, 0.45 * len(matrix) + 2)))
+    # Month 0 is always 100%, so the heatmap starts at month +1
+    sns.heatmap(
+        matrix.drop(columns=0, errors='ignore'),
+        annot=True, fmt='.0%', cmap='Blues', vmin=0, vmax=1,
+        cbar_kws={'format': matplotlib.ticker.PercentFormatter(1.0)},
+        linewidths=0.5, ax=ax
+    )
+    ax.set_title(title, fontsize=16, fontweight='bold')
+    ax.set_xlabel('Months Since First Transaction')
+    ax.set_ylabel('Cohort (First Transaction Month)')
+    fig.tight_layout()
+    return fig
+
+# Function to render the retention report
+def render_retention_report(data, output_dir, formats=CHART_FORMATS, max_offset=COHORT_MAX_OFFSET):
+    """Writes the retention table and the heatmaps into output_dir and returns their paths."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    retention_table = cohorts.build_retention_table(data, max_offset)
+    if retention_table.empty:
+        print("No recommended clients with transactions. Skipping the cohort report.")
+        return []
+
+    table_path = output_dir / f"{OUTPUT_PREFIX}.csv"
+    retention_table.to_csv(table_path, index=False, float_format='%.4f')
+    output_paths = [table_path]
+
+    distributor_names = data.load_table('dim_distributor').set_index('IDDISTRIBUIDOR')['NombreDistribuidor']
+    for distributor in retention_table['IDDISTRIBUIDOR'].unique():
+        if distributor == 'All':
+            name, title = OUTPUT_PREFIX, CHART_TITLE
+        else:
+            name = f"{OUTPUT_PREFIX}_distributor_{distributor}"
+            title = f"{CHART_TITLE} - {distributor_names.get(distributor, distributor)}"
+        fig = plot_retention_heatmap(cohorts.retention_matrix(retention_table, distributor), title)
+        for file_format in formats:
+            output_path = output_dir / f"{name}.{file_format}"
+            fig.savefig(output_path, dpi=150)
+            output_paths.append(output_path)
+        plt.close(fig)
+
+    print(f"Rendered {len(output_paths)} cohort retention file(s) into {output_dir}.")
+    return output_paths
+
+# Report plugin
+@register_report(
+    'cohort_retention',
+    depends_on=['fact_transactions', 'dim_client', 'dim_distributor'],
+    params={'formats': CHART_FORMATS, 'max_offset': COHORT_MAX_OFFSET}
+)
+def cohort_retention_report(data, output_dir):
+    """Renders the cohort retention table and heatmaps into output_dir."""
+    return render_retention_report(data, output_dir)
+
+
+if __name__ == "__main__":
+    try:
+        if HEADLESS:
+            render_retention_report(reportdata, REPORTS_OUTPUT_DIR)
+        else:
+            retention_table = cohorts.build_retention_table(reportdata)
+            plot_retention_heatmap(cohorts.retention_matrix(retention_table))
+            plt.show()
+    except FileNotFoundError as e:
+        print(f"Error: File not found {e.filename}. Please run the ETL script first.")
+        exit()
@@ -2,69 +2,200 @@
 #------------------------------------------------------------------------------------
 # This script generates a dual-axis time series plot showing the monthly performance of loans
 # in terms of total loan amount and number of transactions.
-# It uses data from the processed data directory and visualizes it using Matplotlib and Seaborn.
+# It uses data from the shared report data layer and visualizes it using Matplotlib and Seaborn.
+# The report is registered as a plugin so the orchestrator can run it in-process.
+# In headless mode (plugin, --headless, or no display available) it uses the non-interactive
+# Agg backend and renders one variant per distributor, client category and year, besides the
+# overall chart, reusing a single figure template and writing PNG/SVG/PDF files.
 #
 # Author: ekastel
 # Date: 2025-06-27
 #------------------------------------------------------------------------------------
 
+import os
+import re
+import sys
+import matplotlib
+
+# Select the non-interactive backend before pyplot is imported
+HEADLESS = (
+    __name__ != "__main__"
+    or "--headless" in sys.argv
+    or (sys.platform.startswith('linux') and not os.environ.get('DISPLAY'))
+)
+if HEADLESS:
+    matplotlib.use('Agg')
+
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
 import matplotlib.ticker as mticker
 
-# Path configuration
-BASE_DIR = Path(__file__).resolve().parent
-PROCESSED_DATA_DIR = BASE_DIR / "data" / "processed"
-
-# Ensure the processed data directory exists
-try:
-    fact_transactions = pd.read_csv(PROCESSED_DATA_DIR / "fact_transactions.csv")
-    dim_time = pd.read_csv(PROCESSED_DATA_DIR / "dim_time.csv")
-except FileNotFoundError as e:
-    print(f"Error: File not found {e.filename}. Please run the ETL script first.")
-    exit()
-
-# Merge facts with the time dimension
-time_series_data = pd.merge(fact_transactions, dim_time, on='IDTiempo')
-
-# Create a 'YearMonth' column for proper monthly aggregation and sorting
-time_series_data['YearMonth'] = pd.to_datetime(time_series_data['FechaCompleta']).dt.to_period('M')
-
-# Group by month and calculate aggregates
-monthly_performance = time_series_data.groupby('YearMonth').agg(
-    TotalLoanAmount=('MontoPrestamo', 'sum'),
-    NumberOfTransactions=('CantidadTransacciones', 'sum')
-).reset_index()
-
-# Convert 'YearMonth' to string for plotting
-monthly_performance['YearMonth'] = monthly_performance['YearMonth'].astype(str)
-
-# Set a professional plot style
-sns.set_style("whitegrid")
-fig, ax1 = plt.subplots(figsize=(14, 7))
-
-# Plot 1: Bar chart for Total Loan Amount (left Y-axis)
-color_bars = 'skyblue'
-ax1.set_xlabel('Month')
-ax1.set_ylabel('Total Loan Amount ($)', color=color_bars, fontsize=12, fontweight='bold')
-ax1.bar(monthly_performance['YearMonth'], monthly_performance['TotalLoanAmount'], color=color_bars, label='Total Loan Amount')
-ax1.tick_params(axis='y', labelcolor=color_bars)
-ax1.yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, p: f'${x:,.0f}'))
-plt.xticks(rotation=45)
-
-# Create the second Y-axis that shares the same X-axis
-ax2 = ax1.twinx()
-
-# Plot 2: Line chart for Number of Transactions (right Y-axis)
-color_line = 'darkorange'
-ax2.set_ylabel('Number of Transactions', color=color_line, fontsize=12, fontweight='bold')
-ax2.plot(monthly_performance['YearMonth'], monthly_performance['NumberOfTransactions'], color=color_line, marker='o', linestyle='-', linewidth=2, label='Number of Transactions')
-ax2.tick_params(axis='y', labelcolor=color_line)
-
-# Final customizations
-plt.title('Monthly Loan Performance: Amount vs. Volume', fontsize=16, fontweight='bold')
-fig.legend(loc="upper left", bbox_to_anchor=(0.1, 0.9))
-plt.tight_layout() # Adjust layout to make room for labels
-plt.show()
\ No newline at end of file
+# Make the shared report data layer importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from config import REPORTS_OUTPUT_DIR, CHART_FORMATS, MONTHLY_CHART_VARIANTS
+import reportdata
+from reportregistry import register_report
+
+OUTPUT_PREFIX = 'Monthly_Loan_Performance'
+CHART_TITLE = 'Monthly Loan Performance: Amount vs. Volume'
+
+# Columns of the joined facts used to split the chart into variants
+VARIANT_COLUMNS = {
+    'distributor': 'IDDISTRIBUIDOR',
+    'category': 'CategoriaCliente',
+    'year': 'Año'
+}
+# Dimension table and column naming the variant values that are keys
+VARIANT_LABELS = {
+    'distributor': ('dim_distributor', 'NombreDistribuidor')
+}
+
+# Function to aggregate the facts by month
+def build_monthly_performance(data, group_column=None):
+    """Returns the total loan amount and number of transactions per month.
+
+    With group_column, the months are aggregated for every value of that column
+    in a single groupby, and the column is kept in the result.
+    """
+    time_series_data = data.facts_full()
+
+    # Create a 'YearMonth' column for proper monthly aggregation and sorting
+    # (assigned on a copy, the joined view is shared with the other reports)
+    time_series_data = time_series_data.assign(YearMonth=time_series_data['FechaCompleta'].dt.to_period('M'))
+
+    # Group by month and calculate aggregates
+    keys = ['YearMonth'] if group_column is None else [group_column, 'YearMonth']
+    monthly_performance = time_series_data.groupby(keys, observed=True).agg(
+        TotalLoanAmount=('MontoPrestamo', 'sum'),
+        NumberOfTransactions=('CantidadTransacciones', 'sum')
+    ).reset_index()
+
+    # Convert 'YearMonth' to string for plotting
+    monthly_performance['YearMonth'] = monthly_performance['YearMonth'].astype(str)
+    return monthly_performance
+
+
+class MonthlyChartTemplate:
+    """The dual-axis figure, styled once and redrawn with the data of each variant."""
+
+    def __init__(self):
+        # Set a professional plot style
+        sns.set_style("whitegrid")
+        self.fig, self.ax1 = plt.subplots(figsize=(14, 7))
+
+        # Left Y-axis: Total Loan Amount (bars)
+        self.color_bars = 'skyblue'
+        self.ax1.set_xlabel('Month')
+        self.ax1.set_ylabel('Total Loan Amount ($)', color=self.color_bars, fontsize=12, fontweight='bold')
+        self.ax1.tick_params(axis='y', labelcolor=self.color_bars)
+        self.ax1.yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, p: f'${x:,.0f}'))
+
+        # Create the second Y-axis that shares the same X-axis
+        self.ax2 = self.ax1.twinx()
+
+        # Right Y-axis: Number of Transactions (line)
+        self.color_line = 'darkorange'
+        self.ax2.set_ylabel('Number of Transactions', color=self.color_line, fontsize=12, fontweight='bold')
+        self.ax2.tick_params(axis='y', labelcolor=self.color_line)
+        self.legend = None
+
+    def draw(self, monthly_performance, title=CHART_TITLE):
+        """Replaces the plotted data with monthly_performance and returns the figure."""
+        # Remove the data of the previous variant, keeping the axes styling
+        # (removing the bar containers also drops their bars and legend entries)
+        for artist in list(self.ax1.containers) + list(self.ax2.lines):
+            artist.remove()
+        if self.legend is not None:
+            self.legend.remove()
+
+        # Months are plotted at numeric positions, so each variant only shows its own months
+        positions = range(len(monthly_performance))
+        self.ax1.bar(positions, monthly_performance['TotalLoanAmount'], color=self.color_bars, label='Total Loan Amount')
+        self.ax1.set_xticks(positions, monthly_performance['YearMonth'], rotation=45)
+        self.ax2.plot(positions, monthly_performance['NumberOfTransactions'], color=self.color_line, marker='o', linestyle='-', linewidth=2, label='Number of Transactions')
+        for ax in (self.ax1, self.ax2):
+            ax.relim()
+            ax.autoscale_view()
+
+        # Final customizations
+        self.ax2.set_title(title, fontsize=16, fontweight='bold')
+        self.legend = self.fig.legend(loc="upper left", bbox_to_anchor=(0.1, 0.9))
+        self.fig.tight_layout() # Adjust layout to make room for labels
+        return self.fig
+
+    def save(self, output_dir, name, formats=CHART_FORMATS):
+        """Saves the current figure in every format and returns the written paths."""
+        output_paths = []
+        for file_format in formats:
+            output_path = Path(output_dir) / f"{name}.{file_format}"
+            self.fig.savefig(output_path, dpi=150)
+            output_paths.append(output_path)
+        return output_paths
+
+    def close(self):
+        plt.close(self.fig)
+
+# Function to draw the dual-axis plot
+def plot_monthly_performance(monthly_performance):
+    """Draws the monthly amount (bars) vs. volume (line) plot and returns the figure."""
+    return MonthlyChartTemplate().draw(monthly_performance)
+
+# Function to build a file name from a variant value
+def _slug(value):
+    return re.sub(r'[^0-9A-Za-z]+', '_', str(value)).strip('_')
+
+# Function to render every variant of the chart
+def render_variants(data, output_dir, variants=MONTHLY_CHART_VARIANTS, formats=CHART_FORMATS):
+    """Renders the overall chart and one chart per value of each variant into output_dir."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    template = MonthlyChartTemplate()
+    output_paths = []
+    try:
+        template.draw(build_monthly_performance(data))
+        output_paths += template.save(output_dir, OUTPUT_PREFIX, formats)
+
+        for variant in variants:
+            column = VARIANT_COLUMNS[variant]
+            labels = {}
+            if variant in VARIANT_LABELS:
+                # Distinct keys may share a name, so the charts are split by key and only show the name
+                table, label_column = VARIANT_LABELS[variant]
+                labels = data.load_table(table).set_index(column)[label_column].to_dict()
+            monthly_by_value = build_monthly_performance(data, group_column=column)
+            for value, monthly_performance in monthly_by_value.groupby(column, observed=True, sort=True):
+                label = labels.get(value, value)
+                template.draw(monthly_performance, title=f"{CHART_TITLE} - {label}")
+                name = f"{OUTPUT_PREFIX}_{variant}_{_slug(value)}"
+                if variant in VARIANT_LABELS:
+                    name += f"_{_slug(label)}"
+                output_paths += template.save(output_dir, name, formats)
+    finally:
+        template.close()
+
+    print(f"Rendered {len(output_paths)} chart file(s) into {output_dir}.")
+    return output_paths
+
+# Report plugin
+@register_report(
+    'monthly_loan_performance',
+    depends_on=['fact_transactions', 'dim_client', 'dim_distributor', 'dim_time'],
+    params={'formats': CHART_FORMATS, 'variants': MONTHLY_CHART_VARIANTS}
+)
+def monthly_loan_performance_report(data, output_dir):
+    """Renders the monthly performance charts into output_dir."""
+    return render_variants(data, output_dir)
+
+
+if __name__ == "__main__":
+    try:
+        if HEADLESS:
+            render_variants(reportdata, REPORTS_OUTPUT_DIR)
+        else:
+            plot_monthly_performance(build_monthly_performance(reportdata))
+            plt.show()
+    except FileNotFoundError as e:
+        print(f"Error: File not found {e.filename}. Please run the ETL script first.")
+        exit()
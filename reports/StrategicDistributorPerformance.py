@@ -2,73 +2,107 @@
 #------------------------------------------------------------------------
 # This script generates an interactive scatter plot to visualize the performance of distributors
 # based on the number of active recommended clients and their conversion rates.
+# It uses data from the shared report data layer, and is registered as a plugin so the
+# orchestrator can run it in-process. The plugin (or --export) writes the chart as HTML, plus
+# static images when kaleido is available, through plotlyexport.py; above a configurable number
+# of distributors the scatter switches to WebGL so the chart stays interactive.
 #
 # Author: ekastel
 # Date: 2025-06-27
 #------------------------------------------------------------------------
 
+import sys
 import pandas as pd
 import plotly.express as px
 from pathlib import Path
 
-# Ensure the script is run from the correct directory
-BASE_DIR = Path(__file__).resolve().parent
-PROCESSED_DATA_DIR = BASE_DIR / "data" / "processed"
+# Make the shared report data layer importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from config import REPORTS_OUTPUT_DIR, CHART_FORMATS, PLOTLY_JS_MODE, WEBGL_POINT_THRESHOLD
+import plotlyexport
+import reportdata
+from reportregistry import register_report
 
-# Load the processed data files
-try:
-    dim_client = pd.read_csv(PROCESSED_DATA_DIR / "dim_client.csv")
-    dim_distributor = pd.read_csv(PROCESSED_DATA_DIR / "dim_distributor.csv")
-    fact_transactions = pd.read_csv(PROCESSED_DATA_DIR / "fact_transactions.csv")
-except FileNotFoundError as e:
-    print(f"Error: File not found {e.filename}. Please run the ETL script first.")
-    exit()
+OUTPUT_NAME = 'Strategic_Distributor_Performance'
 
-# Filter for recommended clients only
-recommended_clients = dim_client[dim_client['EsRecomendado'] == True]
+# Function to compute the performance of each distributor
+def build_distributor_performance(data):
+    """Returns the recommended volume, amount and conversion rate per distributor."""
+    recommended_clients = data.recommended_clients()
+    recommended_transactions = data.recommended_facts()
+    dim_distributor = data.load_table('dim_distributor')
 
-# Total number of recommended clients for each distributor
-total_recommended_per_distributor = recommended_clients.groupby('IDDISTRIBUIDOR').size().reset_index(name='TotalRecommended')
+    # Total number of recommended clients for each distributor
+    total_recommended_per_distributor = recommended_clients.groupby('IDDISTRIBUIDOR').size().reset_index(name='TotalRecommended')
 
-# Join transactions with client info to filter by recommended status
-recommended_transactions = pd.merge(fact_transactions, recommended_clients, on='IDCLIENTE')
+    # Group by distributor to calculate performance metrics
+    distributor_performance = recommended_transactions.groupby('IDDISTRIBUIDOR').agg(
+        RecommendedAmount=('MontoPrestamo', 'sum'),
+        ActiveRecommendedClients=('IDCLIENTE', 'nunique')
+    ).reset_index()
 
-# Group by distributor to calculate performance metrics
-distributor_performance = recommended_transactions.groupby('IDDISTRIBUIDOR').agg(
-    RecommendedAmount=('MontoPrestamo', 'sum'),
-    ActiveRecommendedClients=('IDCLIENTE', 'nunique')
-).reset_index()
+    # Join all metrics into a final performance table
+    final_performance = pd.merge(distributor_performance, total_recommended_per_distributor, on='IDDISTRIBUIDOR', how='left')
+    final_performance = pd.merge(final_performance, dim_distributor, on='IDDISTRIBUIDOR')
 
-# Join all metrics into a final performance table
-final_performance = pd.merge(distributor_performance, total_recommended_per_distributor, on='IDDISTRIBUIDOR', how='left')
-final_performance = pd.merge(final_performance, dim_distributor, on='IDDISTRIBUIDOR')
+    # Safely calculate the conversion rate
+    final_performance['ConversionRate'] = (final_performance['ActiveRecommendedClients'] / final_performance['TotalRecommended']).fillna(0)
+    return final_performance
 
-# Safely calculate the conversion rate
-final_performance['ConversionRate'] = (final_performance['ActiveRecommendedClients'] / final_performance['TotalRecommended']).fillna(0)
+# Function to draw the bubble chart
+def plot_distributor_performance(final_performance):
+    """Draws the volume vs. conversion rate bubble chart and returns the figure."""
+    # WebGL keeps thousands of bubbles interactive; SVG looks sharper for a few
+    render_mode = 'webgl' if len(final_performance) > WEBGL_POINT_THRESHOLD else 'svg'
 
-# Ensure the conversion rate is a percentage
-fig = px.scatter(
-    final_performance,
-    x="ActiveRecommendedClients",
-    y="ConversionRate",
-    size="RecommendedAmount",
-    color="NombreDistribuidor",
-    hover_name="NombreDistribuidor",
-    text="NombreDistribuidor",  # Display the name on the bubble
-    size_max=60, # Adjust the max size of the bubbles
-    template="plotly_white" # A clean, professional theme
-)
+    # Ensure the conversion rate is a percentage
+    fig = px.scatter(
+        final_performance,
+        x="ActiveRecommendedClients",
+        y="ConversionRate",
+        size="RecommendedAmount",
+        color="NombreDistribuidor",
+        hover_name="NombreDistribuidor",
+        text="NombreDistribuidor",  # Display the name on the bubble
+        size_max=60, # Adjust the max size of the bubbles
+        template="plotly_white", # A clean, professional theme
+        render_mode=render_mode
+    )
+
+    # Customize the plot for better readability
+    fig.update_traces(textposition='top center') # Set text position
+    fig.update_layout(
+        title_text="<b>Strategic Distributor Performance</b>",
+        xaxis_title="<b>Active Recommended Clients</b> (Volume)",
+        yaxis_title="<b>Conversion Rate</b> (Effectiveness)",
+        yaxis_tickformat=".0%", # Format Y-axis as percentage
+        legend_title="<b>Distributors</b>",
+        showlegend=False # Hide legend since names are on the bubbles
+    )
+    return fig
 
-# Customize the plot for better readability
-fig.update_traces(textposition='top center') # Set text position
-fig.update_layout(
-    title_text="<b>Strategic Distributor Performance</b>",
-    xaxis_title="<b>Active Recommended Clients</b> (Volume)",
-    yaxis_title="<b>Conversion Rate</b> (Effectiveness)",
-    yaxis_tickformat=".0%", # Format Y-axis as percentage
-    legend_title="<b>Distributors</b>",
-    showlegend=False # Hide legend since names are on the bubbles
+# Report plugin
+@register_report(
+    'strategic_distributor_performance',
+    depends_on=['fact_transactions', 'dim_client', 'dim_distributor', 'dim_time'],
+    params={'formats': CHART_FORMATS, 'js_mode': PLOTLY_JS_MODE, 'webgl_threshold': WEBGL_POINT_THRESHOLD}
 )
+def strategic_distributor_performance_report(data, output_dir):
+    """Exports the bubble chart (HTML, and static images when possible) into output_dir."""
+    fig = plot_distributor_performance(build_distributor_performance(data))
+    return plotlyexport.export_figures({OUTPUT_NAME: fig}, output_dir)
+
+
+if __name__ == "__main__":
+    try:
+        final_performance = build_distributor_performance(reportdata)
+    except FileNotFoundError as e:
+        print(f"Error: File not found {e.filename}. Please run the ETL script first.")
+        exit()
 
-print("Showing interactive plot...")
-fig.show()
\ No newline at end of file
+    fig = plot_distributor_performance(final_performance)
+    if "--export" in sys.argv:
+        plotlyexport.export_figures({OUTPUT_NAME: fig}, REPORTS_OUTPUT_DIR)
+    else:
+        print("Showing interactive plot...")
+        fig.show()
@@ -0,0 +1,159 @@
+# src/attachments.py
+#--------------------------------------------------------------------------------
+# This module packages report files as email attachments with a bounded size.
+# The files are streamed, block by block, into compressed zip archives on disk;
+# when the next file would push an archive past the configured message size, a
+# new archive (part) is started, and a file larger than a whole part is split
+# into numbered pieces (name.001, name.002...) stored in consecutive parts.
+# Every part becomes one email. Its attachment is base64-encoded in chunks
+# straight from the archive file, and a manifest saying which part holds which
+# file (or piece) travels with every part.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import base64
+import hashlib
+import json
+import math
+import shutil
+import time
+import zipfile
+from email.mime.base import MIMEBase
+from email.mime.text import MIMEText
+
+from config import MAIL_MAX_MESSAGE_MB, MAIL_COMPRESSION_LEVEL
+
+MANIFEST_FILENAME = "manifest.json"
+COPY_BLOCK_BYTES = 1024 * 1024
+# 57 input bytes make one 76-character base64 line
+BASE64_CHUNK_BYTES = 57 * 1024
+
+# Function to compute the raw archive size that fits in a message
+def max_archive_bytes(max_message_mb=MAIL_MAX_MESSAGE_MB):
+    """Returns the largest archive that fits in a message once base64-encoded.
+
+    Base64 grows the data by 4/3 (plus line breaks); 5% is kept for the headers,
+    the body, the manifest and the zip overhead.
+    """
+    return int(max_message_mb * 1024 ** 2 * 0.95 * 57 / 78)
+
+# Function to hash a file
+def _sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BLOCK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to copy a byte range of a file into an archive entry
+def _write_entry(archive, arcname, file_path, offset, length):
+    """Streams length bytes of file_path, from offset, into a new archive entry."""
+    with open(file_path, 'rb') as src, archive.open(arcname, 'w', force_zip64=True) as dst:
+        src.seek(offset)
+        remaining = length
+        while remaining > 0:
+            block = src.read(min(COPY_BLOCK_BYTES, remaining))
+            if not block:
+                break
+            dst.write(block)
+            remaining -= len(block)
+
+# Function to package files into size-bounded archives
+def package_files(file_paths, package_dir, name='Reports', max_part_bytes=None):
+    """Writes the files into one or more zip archives of at most max_part_bytes each.
+
+    Returns the manifest: {'parts': [{'archive', 'entries': [...]}], 'files': [...]},
+    where every file lists its size, SHA-256 and the pieces it was split into.
+    """
+    max_part_bytes = max_part_bytes or max_archive_bytes()
+    package_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'parts': [], 'files': []}
+    archive = None
+
+    def start_part():
+        part_number = len(manifest['parts']) + 1
+        archive_path = package_dir / f"{name}_part{part_number:02d}.zip"
+        manifest['parts'].append({'part': part_number, 'archive': archive_path.name, 'entries': []})
+        return zipfile.ZipFile(archive_path, 'w', compression=zipfile.ZIP_DEFLATED,
+                               compresslevel=MAIL_COMPRESSION_LEVEL)
+
+    try:
+        for file_path in file_paths:
+            size = file_path.stat().st_size
+            num_pieces = max(1, math.ceil(size / max_part_bytes))
+            pieces = []
+            for piece in range(num_pieces):
+                offset = piece * max_part_bytes
+                length = min(max_part_bytes, size - offset)
+                # Start a new part when this piece would not fit in the current one
+                if archive is None or (manifest['parts'][-1]['entries'] and archive.fp.tell() + length > max_part_bytes):
+                    if archive is not None:
+                        archive.close()
+                    archive = start_part()
+                arcname = file_path.name if num_pieces == 1 else f"{file_path.name}.{piece + 1:03d}"
+                _write_entry(archive, arcname, file_path, offset, length)
+                manifest['parts'][-1]['entries'].append(arcname)
+                pieces.append({'entry': arcname, 'part': manifest['parts'][-1]['part']})
+            manifest['files'].append({
+                'name': file_path.name, 'size': size, 'sha256': _sha256(file_path), 'pieces': pieces
+            })
+    finally:
+        if archive is not None:
+            archive.close()
+
+    for part in manifest['parts']:
+        part['size'] = (package_dir / part['archive']).stat().st_size
+    with open(package_dir / f"{name}_{MANIFEST_FILENAME}", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+# Function to attach a file encoded in chunks
+def file_attachment(file_path, filename=None, subtype='zip'):
+    """Returns a base64 MIME part of the file, encoded block by block from disk."""
+    encoded_lines = []
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(BASE64_CHUNK_BYTES), b''):
+            encoded_lines.append(base64.encodebytes(block).decode('ascii'))
+    part = MIMEBase('application', subtype)
+    part.set_payload(''.join(encoded_lines))
+    part['Content-Transfer-Encoding'] = 'base64'
+    part.add_header('Content-Disposition', 'attachment', filename=filename or file_path.name)
+    return part
+
+# Function to describe the manifest in plain text
+def manifest_summary(manifest):
+    """Returns a human-readable list of which part holds which file."""
+    lines = []
+    for part in manifest['parts']:
+        lines.append(f"Part {part['part']} of {len(manifest['parts'])} ({part['archive']}):")
+        lines.extend(f"  - {entry}" for entry in part['entries'])
+    split_files = [file for file in manifest['files'] if len(file['pieces']) > 1]
+    if split_files:
+        lines.append("")
+        lines.append("Split files: join their pieces in order, e.g. cat name.001 name.002 > name")
+    return "\n".join(lines)
+
+# Function to build the messages of a package
+def build_part_messages(manifest, package_dir, new_message):
+    """Yields one message per part, building each only when it is about to be sent.
+
+    new_message(part_number, num_parts) must return the MIMEMultipart to which
+    the manifest text, the part's archive and the manifest file are attached.
+    """
+    num_parts = len(manifest['parts'])
+    manifest_json = json.dumps(manifest, indent=2)
+    for part in manifest['parts']:
+        msg = new_message(part['part'], num_parts)
+        msg.attach(MIMEText("Contents of this delivery:\n\n" + manifest_summary(manifest), 'plain'))
+        msg.attach(file_attachment(package_dir / part['archive']))
+        manifest_part = MIMEText(manifest_json, 'plain')
+        manifest_part.add_header('Content-Disposition', 'attachment', filename=MANIFEST_FILENAME)
+        msg.attach(manifest_part)
+        yield msg
+
+# Function to delete a package
+def remove_package(package_dir):
+    """Deletes the archives and the manifest of a package."""
+    shutil.rmtree(package_dir, ignore_errors=True)
@@ -0,0 +1,174 @@
+# src/biexport.py
+#--------------------------------------------------------------------------------
+# This script exports the star schema in a layout made for BI incremental refresh.
+# The facts are split into one file per month of transaction date, with stable
+# names (facts/fact_transactions_YYYY-MM.csv), so the BI tool can map each file
+# to a refresh partition. Every column has one unambiguous format: dates as
+# YYYY-MM-DD, IDs as integers (empty when missing), amounts with two decimals,
+# flags as true/false; the manifest also carries the column types.
+# A partition is only rewritten when its content changed: each one is
+# fingerprinted from its rows, and the manifest lists the partitions that
+# changed or disappeared since the previous export, so the dashboards
+# (reports/*.pbix) only have to reload those.
+# Run it with:  python src/biexport.py [--full]
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+
+from config import BI_EXPORT_DIR
+import reportdata
+
+FACTS_DIR = BI_EXPORT_DIR / "facts"
+MANIFEST_FILE = BI_EXPORT_DIR / "manifest.json"
+FACT_PARTITION_PATTERN = "fact_transactions_{period}.csv"
+
+# Column types of the exported tables, as declared in the manifest
+SCHEMA = {
+    'fact_transactions': {
+        'Fecha': 'date', 'IDTiempo': 'int64', 'IDCLIENTE': 'int64', 'IDDISTRIBUIDOR': 'int64',
+        'MontoPrestamo': 'decimal', 'CantidadTransacciones': 'int64'
+    },
+    'dim_client': {'IDCLIENTE': 'int64', 'IDDISTRIBUIDOR': 'int64', 'CategoriaCliente': 'text', 'EsRecomendado': 'boolean'},
+    'dim_distributor': {'IDDISTRIBUIDOR': 'int64', 'NombreDistribuidor': 'text', 'Telefono': 'text'},
+    'dim_time': {'IDTiempo': 'int64', 'FechaCompleta': 'date', 'Año': 'int64', 'Mes': 'int64', 'Dia': 'int64'},
+}
+CSV_OPTIONS = {'index': False, 'date_format': '%Y-%m-%d', 'float_format': '%.2f', 'lineterminator': '\n'}
+
+# Function to give the columns of a table their export types
+def _typed(df, table):
+    """Returns the schema columns of df, in schema order, with one format per type."""
+    typed = pd.DataFrame(index=df.index)
+    for column, kind in SCHEMA[table].items():
+        values = df[column]
+        if kind == 'date':
+            typed[column] = pd.to_datetime(values)
+        elif kind == 'int64':
+            typed[column] = values.astype('Int64')
+        elif kind == 'decimal':
+            typed[column] = values.astype('float64').round(2)
+        elif kind == 'boolean':
+            typed[column] = values.map({True: 'true', False: 'false'})
+        else:
+            typed[column] = values.astype('string')
+    return typed
+
+# Function to fingerprint the rows of a table
+def fingerprint(df):
+    """Returns a SHA-256 of the values of df, without rendering it to text."""
+    digest = hashlib.sha256(','.join(df.columns).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+# Function to write an exported file
+def _write_csv(df, file_path):
+    """Writes df atomically, so the BI tool never reads a half-written file."""
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = file_path.with_name(file_path.name + ".tmp")
+    df.to_csv(tmp_path, **CSV_OPTIONS)
+    tmp_path.replace(file_path)
+
+# Function to read the previous manifest
+def load_manifest():
+    """Returns the manifest of the previous export, or an empty one."""
+    try:
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'partitions': {}, 'dimensions': {}}
+
+# Function to export one table if it changed
+def _export_table(df, file_path, previous, full, exported_at):
+    """Writes the table when its fingerprint changed; returns (manifest entry, changed)."""
+    digest = fingerprint(df)
+    changed = full or previous is None or previous['fingerprint'] != digest or not file_path.exists()
+    if changed:
+        _write_csv(df, file_path)
+    entry = {
+        'file': file_path.relative_to(BI_EXPORT_DIR).as_posix(),
+        'rows': len(df),
+        'fingerprint': digest,
+        'updated': exported_at if changed else previous['updated']
+    }
+    return entry, changed
+
+# Function to export the star schema
+def export(full=False):
+    """Exports the dimensions and the monthly fact partitions; returns the manifest.
+
+    Only the tables and partitions whose rows changed are rewritten, unless full is set.
+    """
+    started = time.perf_counter()
+    exported_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    previous = load_manifest()
+    manifest = {
+        'exported': exported_at,
+        'previous_export': previous.get('exported'),
+        'format': {'type': 'csv', 'encoding': 'utf-8', 'delimiter': ',', 'date_format': 'YYYY-MM-DD',
+                   'decimal_separator': '.', 'missing': ''},
+        'schema': SCHEMA,
+        'dimensions': {},
+        'partitions': {},
+        'changed': [],
+        'removed': []
+    }
+
+    for table in ('dim_client', 'dim_distributor', 'dim_time'):
+        df = _typed(reportdata.load_table(table), table)
+        entry, changed = _export_table(df, BI_EXPORT_DIR / f"{table}.csv",
+                                       previous['dimensions'].get(table), full, exported_at)
+        manifest['dimensions'][table] = entry
+        if changed:
+            manifest['changed'].append(table)
+
+    facts = reportdata.load_table('fact_transactions')
+    facts = facts.assign(Fecha=pd.to_datetime(facts['IDTiempo'].astype(str), format='%Y%m%d'))
+    facts = _typed(facts, 'fact_transactions')
+    # Partitions in date order, and rows in a stable order inside each one
+    facts = facts.sort_values(['Fecha', 'IDCLIENTE', 'IDDISTRIBUIDOR'], kind='stable')
+    periods = facts['Fecha'].dt.strftime('%Y-%m')
+    for period, partition in facts.groupby(periods, sort=True):
+        file_path = FACTS_DIR / FACT_PARTITION_PATTERN.format(period=period)
+        entry, changed = _export_table(partition.reset_index(drop=True), file_path,
+                                       previous['partitions'].get(period), full, exported_at)
+        # The calendar month the partition covers, as incremental refresh filters it
+        month = pd.Period(period, freq='M')
+        entry['range_start'] = month.start_time.strftime('%Y-%m-%d')
+        entry['range_end'] = month.end_time.strftime('%Y-%m-%d')
+        manifest['partitions'][period] = entry
+        if changed:
+            manifest['changed'].append(period)
+
+    # Months that no longer have facts
+    for period, entry in previous['partitions'].items():
+        if period not in manifest['partitions']:
+            (BI_EXPORT_DIR / entry['file']).unlink(missing_ok=True)
+            manifest['removed'].append(period)
+
+    BI_EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = MANIFEST_FILE.with_name(MANIFEST_FILE.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp_path.replace(MANIFEST_FILE)
+
+    print(f"BI export: {len(manifest['partitions'])} partition(s), changed: "
+          f"{', '.join(manifest['changed']) or 'none'}; removed: {', '.join(manifest['removed']) or 'none'} "
+          f"({time.perf_counter() - started:.2f}s).")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exports the star schema as monthly partitions for BI incremental refresh.")
+    parser.add_argument('--full', action='store_true', help="Rewrite every table and partition.")
+    args = parser.parse_args()
+    export(full=args.full)
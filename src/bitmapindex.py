@@ -0,0 +1,340 @@
+# src/bitmapindex.py
+#--------------------------------------------------------------------------------
+# This module keeps bitmap indexes over the rows of the transactions fact table
+# for its low-cardinality attributes: recommended flag, client category,
+# distributor, year and month. Each value of an attribute keeps the rows it
+# matches in a compressed container: the sorted row positions when the value is
+# rare (under one row in 32, e.g. one distributor among hundreds), or a bitmap
+# packed eight rows per byte (np.packbits layout) when it is frequent, so an
+# attribute never costs more than about 4 bytes per row, whatever its cardinality.
+# A filter is the union of the containers of the accepted values of each
+# attribute, intersected across attributes: position lists are intersected
+# directly and tested against the bitmaps, and bitmaps are ANDed together.
+# The indexes are saved next to the processed outputs as a base segment plus one
+# segment per batch of appended facts (so an append only writes its own rows),
+# compacted back into a single segment beyond BITMAP_MAX_SEGMENTS. A manifest
+# records the size and modification time of the fact file they describe; an
+# index whose fact file changed since is rebuilt.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import json
+import os
+import tempfile
+from functools import reduce
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import BITMAP_INDEX_DIR, BITMAP_MAX_SEGMENTS, FACT_TRANSACTIONS_FILE, DIM_CLIENT_FILE
+
+ATTRIBUTES = ['recommended', 'category', 'distributor', 'year', 'month']
+MANIFEST_FILENAME = "manifest.json"
+SEGMENT_PATTERN = "segment_{first_row:012d}.npz"
+
+# Values matching fewer rows than this share keep positions (4 bytes each) instead of a bitmap (1/8 byte per row)
+SPARSE_SHARE = 1 / 32
+
+# Function to derive the indexed attributes of fact rows
+def fact_attributes(fact_df, client_dim_df):
+    """Returns {attribute: Series aligned with the fact rows}."""
+    clients = client_dim_df.set_index('IDCLIENTE')
+    time_keys = fact_df['IDTiempo']
+    return {
+        'recommended': fact_df['IDCLIENTE'].map(clients['EsRecomendado']),
+        'category': fact_df['IDCLIENTE'].map(clients['CategoriaCliente']),
+        'distributor': fact_df['IDDISTRIBUIDOR'],
+        'year': time_keys // 10000,
+        'month': time_keys // 100 % 100
+    }
+
+# Function to get the dtype of row positions
+def _position_dtype(num_rows):
+    return np.uint32 if num_rows <= np.iinfo(np.uint32).max else np.int64
+
+# Function to group row positions by value
+def _rows_by_value(series, first_row, dtype):
+    """Returns {value: sorted positions (first_row + i) of the rows holding it}; missing values are skipped."""
+    codes, uniques = pd.factorize(series, sort=True)
+    order = np.argsort(codes, kind='stable')
+    num_missing = int((codes < 0).sum())
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    positions = (order[num_missing:] + first_row).astype(dtype)
+    return dict(zip(pd.Index(uniques).tolist(), np.split(positions, np.cumsum(counts)[:-1])))
+
+# Function to replace a file atomically
+def _write_atomically(file_path, write, mode='wb'):
+    """Calls write(f) on a uniquely named temporary file next to file_path, then renames it.
+
+    Concurrent writers (e.g. the ETL and a report worker rebuilding the index at
+    the same time) each write their own temporary file, so a rename never moves
+    another writer's partial file into place.
+    """
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    encoding = None if 'b' in mode else 'utf-8'
+    with tempfile.NamedTemporaryFile(mode, encoding=encoding, dir=file_path.parent,
+                                     prefix=f"{file_path.name}.", suffix=".tmp", delete=False) as f:
+        tmp_path = Path(f.name)
+        try:
+            write(f)
+        except BaseException:
+            f.close()
+            os.unlink(tmp_path)
+            raise
+    tmp_path.replace(file_path)
+
+# Function to test the bits of a set of rows
+def _test_bits(bitmap, positions):
+    """Returns the mask of the positions whose bit is set in the packed bitmap."""
+    return (bitmap[positions >> 3] & (0x80 >> (positions & 7))) != 0
+
+
+class BitmapIndex:
+    """Compressed row containers per value of each indexed attribute of the fact rows.
+
+    A container is either the sorted row positions (an integer array) or a
+    packed bitmap (a uint8 array) of the rows holding the value.
+    """
+
+    def __init__(self, num_rows=0, containers=None):
+        self.num_rows = num_rows
+        self.containers = containers or {}
+
+    @classmethod
+    def build(cls, fact_df, client_dim_df):
+        """Indexes every row of fact_df."""
+        return cls().append(fact_df, client_dim_df)
+
+    def append(self, fact_df, client_dim_df, compress=True):
+        """Indexes the rows of fact_df as the next rows of the fact table.
+
+        Without compress, the new rows are only kept as positions (the layout of an appended segment).
+        """
+        first_row = self.num_rows
+        self.num_rows += len(fact_df)
+        dtype = _position_dtype(self.num_rows)
+        for attribute, series in fact_attributes(fact_df, client_dim_df).items():
+            self._merge(attribute, _rows_by_value(series, first_row, dtype), compress)
+        return self
+
+    def _merge(self, attribute, rows_by_value, compress=True):
+        """Adds rows (all after the rows already indexed) to the containers of an attribute."""
+        containers = self.containers.setdefault(attribute, {})
+        num_bytes = (self.num_rows + 7) // 8
+        dtype = _position_dtype(self.num_rows)
+        for value, positions in rows_by_value.items():
+            old = containers.get(value)
+            if old is None:
+                containers[value] = positions.astype(dtype, copy=False)
+            elif old.dtype != np.uint8:
+                containers[value] = np.concatenate([old.astype(dtype, copy=False), positions.astype(dtype, copy=False)])
+            else:
+                # The bytes of the new rows start as zero bits (the padding bits of the old last byte are zero too)
+                bitmap = np.zeros(num_bytes, dtype=np.uint8)
+                bitmap[:len(old)] = old
+                np.bitwise_or.at(bitmap, positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8))
+                containers[value] = bitmap
+        if not compress:
+            return
+        for value, container in containers.items():
+            if container.dtype == np.uint8:
+                if len(container) < num_bytes:
+                    containers[value] = np.concatenate([container, np.zeros(num_bytes - len(container), np.uint8)])
+            elif len(container) >= self.num_rows * SPARSE_SHARE:
+                bits = np.zeros(self.num_rows, dtype=bool)
+                bits[container] = True
+                containers[value] = np.packbits(bits)
+
+    def _match(self, attribute, values):
+        """Returns ('rows', positions) or ('bitmap', packed bitmap) of the rows with one of the values."""
+        if attribute not in self.containers:
+            raise KeyError(f"Attribute '{attribute}' is not indexed.")
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        containers = [self.containers[attribute][value] for value in values if value in self.containers[attribute]]
+        bitmaps = [container for container in containers if container.dtype == np.uint8]
+        position_lists = [container for container in containers if container.dtype != np.uint8]
+        if not bitmaps:
+            # The values of an attribute match disjoint rows
+            positions = np.concatenate(position_lists) if position_lists else np.zeros(0, np.int64)
+            return 'rows', np.sort(positions) if len(position_lists) > 1 else positions
+        bitmap = reduce(np.bitwise_or, bitmaps)
+        if position_lists:
+            bitmap = bitmap.copy() if len(bitmaps) == 1 else bitmap
+            positions = np.concatenate(position_lists)
+            np.bitwise_or.at(bitmap, positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8))
+        return 'bitmap', bitmap
+
+    def rows(self, **where):
+        """Returns the positions of the fact rows matching every filter, e.g.
+        rows(recommended=True, category=['Oro', 'Platino']).
+
+        Each filter maps an attribute to a value or a list of accepted values.
+        """
+        if not where:
+            return np.arange(self.num_rows)
+        matches = [self._match(attribute, values) for attribute, values in where.items()]
+        position_lists = [result for kind, result in matches if kind == 'rows']
+        bitmaps = [result for kind, result in matches if kind == 'bitmap']
+        if not position_lists:
+            return np.flatnonzero(np.unpackbits(reduce(np.bitwise_and, bitmaps), count=self.num_rows))
+        positions = reduce(lambda left, right: np.intersect1d(left, right, assume_unique=True), position_lists)
+        for bitmap in bitmaps:
+            positions = positions[_test_bits(bitmap, positions)]
+        return positions.astype(np.int64)
+
+    def bitmap(self, **where):
+        """Returns the packed bitmap of the rows matching every filter."""
+        bits = np.zeros(self.num_rows, dtype=bool)
+        bits[self.rows(**where)] = True
+        return np.packbits(bits)
+
+    def count(self, **where):
+        """Returns the number of fact rows matching every filter."""
+        return len(self.rows(**where))
+
+    def nbytes(self):
+        """Returns the memory taken by the containers."""
+        return sum(container.nbytes for containers in self.containers.values() for container in containers.values())
+
+    def save(self, file_path, first_row=0):
+        """Writes the containers as a compressed .npz segment, atomically.
+
+        Per attribute, the values are stored with a flag telling whether their
+        container is a bitmap; position lists are concatenated with their offsets.
+        """
+        arrays = {'num_rows': np.array(self.num_rows), 'first_row': np.array(first_row)}
+        for attribute, containers in self.containers.items():
+            values = list(containers)
+            dense = np.array([containers[value].dtype == np.uint8 for value in values], dtype=bool)
+            sparse = [containers[value] for value, is_dense in zip(values, dense) if not is_dense]
+            arrays[f'{attribute}__values'] = np.array(values).astype(str if attribute == 'category' else np.int64)
+            arrays[f'{attribute}__dense'] = dense
+            arrays[f'{attribute}__positions'] = (
+                np.concatenate(sparse) if sparse else np.zeros(0, _position_dtype(self.num_rows))
+            )
+            arrays[f'{attribute}__offsets'] = np.cumsum([0] + [len(positions) for positions in sparse])
+            arrays[f'{attribute}__bitmaps'] = np.array(
+                [containers[value] for value, is_dense in zip(values, dense) if is_dense], dtype=np.uint8
+            ).reshape(int(dense.sum()), -1 if dense.any() else 0)
+        _write_atomically(file_path, lambda f: np.savez_compressed(f, **arrays))
+
+    @classmethod
+    def load(cls, file_path):
+        """Reads a segment written by save()."""
+        with np.load(file_path) as arrays:
+            containers = {}
+            for attribute in ATTRIBUTES:
+                if f'{attribute}__values' not in arrays:
+                    continue
+                values = arrays[f'{attribute}__values']
+                if attribute == 'recommended':
+                    values = values.astype(bool)
+                dense = arrays[f'{attribute}__dense']
+                positions = np.split(arrays[f'{attribute}__positions'], arrays[f'{attribute}__offsets'][1:-1])
+                bitmaps = iter(arrays[f'{attribute}__bitmaps'])
+                positions = iter(positions)
+                containers[attribute] = {
+                    value: next(bitmaps) if is_dense else next(positions)
+                    for value, is_dense in zip(values.tolist(), dense.tolist())
+                }
+            return cls(int(arrays['num_rows']), containers)
+
+# Function to describe the fact file an index was built from
+def fact_file_fingerprint(fact_file=FACT_TRANSACTIONS_FILE):
+    """Returns [size, mtime_ns] of the fact file, or None when it is missing."""
+    try:
+        stat = fact_file.stat()
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+# Function to read the manifest of the saved index
+def _read_manifest(index_dir):
+    with open(index_dir / MANIFEST_FILENAME, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# Function to write the manifest of the saved index
+def _write_manifest(index_dir, num_rows, segments, fact_file):
+    """Records the segments and the fact file they describe, then deletes the other segments."""
+    manifest = {'num_rows': num_rows, 'segments': segments, 'fact_file': fact_file_fingerprint(fact_file)}
+    _write_atomically(index_dir / MANIFEST_FILENAME, lambda f: json.dump(manifest, f, indent=2), mode='w')
+    for segment_path in index_dir.glob("segment_*.npz"):
+        if segment_path.name not in segments:
+            segment_path.unlink(missing_ok=True)
+
+# Function to save an index as a single segment
+def save_index(index, index_dir=BITMAP_INDEX_DIR, fact_file=FACT_TRANSACTIONS_FILE):
+    """Writes the index as one base segment, replacing the saved one."""
+    segment = SEGMENT_PATTERN.format(first_row=0)
+    index.save(index_dir / segment)
+    _write_manifest(index_dir, index.num_rows, [segment], fact_file)
+
+# Function to read the saved index
+def read_index(index_dir=BITMAP_INDEX_DIR):
+    """Reads the base segment and merges the appended ones into it."""
+    manifest = _read_manifest(index_dir)
+    segments = iter(manifest['segments'])
+    index = BitmapIndex.load(index_dir / next(segments))
+    for segment in segments:
+        delta = BitmapIndex.load(index_dir / segment)
+        index.num_rows = delta.num_rows
+        for attribute, containers in delta.containers.items():
+            index._merge(attribute, containers)
+    return index
+
+# Function to rebuild the index file from the processed outputs
+def build_index_file(fact_df=None, client_dim_df=None, index_dir=BITMAP_INDEX_DIR, fact_file=FACT_TRANSACTIONS_FILE):
+    """Indexes the whole fact table and saves the index; returns it."""
+    print("Building the fact bitmap indexes...")
+    if fact_df is None:
+        fact_df = pd.read_csv(fact_file, usecols=['IDTiempo', 'IDCLIENTE', 'IDDISTRIBUIDOR'],
+                              dtype={'IDDISTRIBUIDOR': 'Int64'})
+    if client_dim_df is None:
+        client_dim_df = pd.read_csv(DIM_CLIENT_FILE, dtype={'CategoriaCliente': 'string', 'EsRecomendado': 'bool'})
+    index = BitmapIndex.build(fact_df, client_dim_df)
+    save_index(index, index_dir, fact_file)
+    print(f"Bitmap indexes saved to {index_dir} ({index.num_rows:,} rows, {index.nbytes() / 1024 ** 2:,.1f} MB).")
+    return index
+
+# Function to extend the index file with appended facts
+def append_to_index_file(fact_df, client_dim_df, index_dir=BITMAP_INDEX_DIR, fact_file=FACT_TRANSACTIONS_FILE):
+    """Indexes facts just appended to the fact file into a new segment of the saved index.
+
+    The index is rebuilt when it is missing, and compacted into one segment
+    when it has more than BITMAP_MAX_SEGMENTS.
+    """
+    try:
+        manifest = _read_manifest(index_dir)
+    except (OSError, ValueError):
+        return build_index_file(index_dir=index_dir, fact_file=fact_file)
+    if len(manifest['segments']) >= BITMAP_MAX_SEGMENTS:
+        index = read_index(index_dir).append(fact_df, client_dim_df)
+        save_index(index, index_dir, fact_file)
+        print(f"Bitmap indexes extended with {len(fact_df):,} rows and compacted.")
+        return index
+
+    first_row = manifest['num_rows']
+    delta = BitmapIndex(num_rows=first_row).append(fact_df, client_dim_df, compress=False)
+    segment = SEGMENT_PATTERN.format(first_row=first_row)
+    delta.save(index_dir / segment, first_row=first_row)
+    _write_manifest(index_dir, delta.num_rows, manifest['segments'] + [segment], fact_file)
+    print(f"Bitmap indexes extended with {len(fact_df):,} rows.")
+    return delta
+
+# Function to get an index that matches the fact table
+def load_index(num_rows, index_dir=BITMAP_INDEX_DIR, fact_file=FACT_TRANSACTIONS_FILE):
+    """Returns the saved index when it was built from the current fact file, else a rebuilt one."""
+    try:
+        manifest = _read_manifest(index_dir)
+        if manifest['fact_file'] == fact_file_fingerprint(fact_file) and manifest['num_rows'] == num_rows:
+            return read_index(index_dir)
+        print("The bitmap indexes are out of date with the fact table. Rebuilding them.")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, StopIteration) as e:
+        print(f"WARNING: Could not read the bitmap indexes ({e}). Rebuilding them.")
+    return build_index_file(index_dir=index_dir, fact_file=fact_file)
@@ -0,0 +1,120 @@
+# src/checkpoint.py
+#--------------------------------------------------------------------------------
+# This module checkpoints the outputs of each ETL stage so that a failed run can
+# be resumed from the first stage that did not complete, instead of repeating
+# the slow Excel extract and every transform.
+# Checkpoints are compressed pickles grouped by run ID, and old runs are removed
+# according to the retention policy defined in config.py.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import json
+import shutil
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from config import (
+    CHECKPOINT_DIR, CHECKPOINT_COMPRESSION,
+    CHECKPOINT_RETENTION_RUNS, CHECKPOINT_MAX_AGE_DAYS
+)
+
+STATE_FILENAME = "state.json"
+
+# Function to create a new run ID
+def new_run_id():
+    """Creates a sortable run ID based on the current timestamp."""
+    return datetime.now().strftime('%Y%m%d_%H%M%S')
+
+# Function to get the directory of a run
+def _run_dir(run_id):
+    """Returns the checkpoint directory for a given run ID."""
+    return CHECKPOINT_DIR / run_id
+
+# Function to read the state of a run
+def load_state(run_id):
+    """Loads the stage state of a run, or an empty state if it does not exist."""
+    state_file = _run_dir(run_id) / STATE_FILENAME
+    if not state_file.exists():
+        return {'run_id': run_id, 'completed_stages': [], 'status': 'new'}
+    with open(state_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# Function to write the state of a run
+def _save_state(state):
+    """Writes the stage state of a run atomically."""
+    run_dir = _run_dir(state['run_id'])
+    run_dir.mkdir(parents=True, exist_ok=True)
+    tmp_file = run_dir / (STATE_FILENAME + ".tmp")
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    tmp_file.replace(run_dir / STATE_FILENAME)
+
+# Function to save the outputs of a stage
+def save_stage(run_id, stage, frames):
+    """Saves a dict of DataFrames produced by a stage and marks the stage as completed."""
+    print(f"Checkpointing stage '{stage}' for run {run_id}...")
+    stage_dir = _run_dir(run_id) / stage
+    stage_dir.mkdir(parents=True, exist_ok=True)
+    for name, df in frames.items():
+        df.to_pickle(stage_dir / f"{name}.pkl", compression=CHECKPOINT_COMPRESSION)
+
+    state = load_state(run_id)
+    if stage not in state['completed_stages']:
+        state['completed_stages'].append(stage)
+    state['status'] = 'running'
+    state['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    _save_state(state)
+
+# Function to load the outputs of a stage
+def load_stage(run_id, stage):
+    """Loads the DataFrames checkpointed for a stage."""
+    print(f"Reusing checkpoint of stage '{stage}' from run {run_id}...")
+    stage_dir = _run_dir(run_id) / stage
+    return {
+        path.name[:-len(".pkl")]: pd.read_pickle(path, compression=CHECKPOINT_COMPRESSION)
+        for path in sorted(stage_dir.glob("*.pkl"))
+    }
+
+# Function to mark a run as finished
+def mark_run(run_id, status, error=None):
+    """Marks a run as 'completed' or 'failed'."""
+    state = load_state(run_id)
+    state['status'] = status
+    state['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    if error is not None:
+        state['error'] = str(error)
+    else:
+        state.pop('error', None)
+    _save_state(state)
+
+# Function to find the latest run that can be resumed
+def find_resumable_run():
+    """Returns the ID of the most recent run that did not complete, or None."""
+    if not CHECKPOINT_DIR.exists():
+        return None
+    for run_dir in sorted(CHECKPOINT_DIR.iterdir(), reverse=True):
+        if run_dir.is_dir() and load_state(run_dir.name)['status'] != 'completed':
+            return run_dir.name
+    return None
+
+# Function to apply the retention policy
+def cleanup_checkpoints(keep_run_id=None):
+    """Deletes checkpoints of old runs according to the retention policy."""
+    if not CHECKPOINT_DIR.exists():
+        return
+    run_dirs = sorted((d for d in CHECKPOINT_DIR.iterdir() if d.is_dir()), reverse=True)
+    max_age_seconds = CHECKPOINT_MAX_AGE_DAYS * 24 * 3600
+    now = time.time()
+
+    for position, run_dir in enumerate(run_dirs):
+        if run_dir.name == keep_run_id:
+            continue
+        too_many = position >= CHECKPOINT_RETENTION_RUNS
+        too_old = now - run_dir.stat().st_mtime > max_age_seconds
+        if too_many or too_old:
+            shutil.rmtree(run_dir, ignore_errors=True)
+            print(f"Deleted checkpoints of run {run_dir.name}.")
@@ -0,0 +1,110 @@
+# src/cohorts.py
+#--------------------------------------------------------------------------------
+# This module computes the cohort retention of recommended clients.
+# A client enters the cohort of the month of its first transaction with a
+# distributor, and is retained in month +k when it has transactions with that
+# distributor k months later. The first months come from a single groupby over
+# (distributor, client) pair codes, and the active clients of every (distributor,
+# cohort, offset) cell are counted with one bincount over the flattened cell
+# index, so the cost does not grow with the number of cohorts or distributors.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+
+from config import COHORT_MAX_OFFSET
+
+# Function to convert IDTiempo keys to month numbers
+def _month_numbers(time_keys):
+    """Returns year * 12 + month - 1 for IDTiempo keys (YYYYMMDD)."""
+    year_month = time_keys // 100
+    return (year_month // 100) * 12 + year_month % 100 - 1
+
+# Function to format month numbers
+def _month_labels(month_numbers):
+    return [f"{month // 12}-{month % 12 + 1:02d}" for month in month_numbers]
+
+# Function to count the retained clients of every cohort
+def retention_counts(group_codes, client_ids, months, num_groups, max_offset=COHORT_MAX_OFFSET):
+    """Returns (first_month, counts) for the transactions of a set of groups.
+
+    counts[g, c, k] is the number of clients of group g whose first month is
+    first_month + c and who have transactions k months later.
+    """
+    group_codes = np.asarray(group_codes, dtype=np.int64)
+    client_ids = np.asarray(client_ids, dtype=np.int64)
+    months = np.asarray(months, dtype=np.int64)
+
+    # One code per (group, client) pair, and its first month in a single groupby
+    stride = int(client_ids.max()) + 1
+    pair_codes, pair_keys = pd.factorize(group_codes * stride + client_ids)
+    pair_first = pd.Series(months).groupby(pair_codes).min().to_numpy()
+    pair_groups = pair_keys // stride
+    offsets = months - pair_first[pair_codes]
+
+    # Mark each (pair, offset) once, so a client counts once per month
+    num_offsets = max_offset + 1
+    kept = offsets <= max_offset
+    active = np.zeros(len(pair_keys) * num_offsets, dtype=bool)
+    active[pair_codes[kept] * num_offsets + offsets[kept]] = True
+    active_pairs, active_offsets = np.divmod(np.flatnonzero(active), num_offsets)
+
+    first_month = int(pair_first.min())
+    num_cohorts = int(pair_first.max()) - first_month + 1
+    cells = (
+        (pair_groups[active_pairs] * num_cohorts + (pair_first[active_pairs] - first_month)) * num_offsets
+        + active_offsets
+    )
+    counts = np.bincount(cells, minlength=num_groups * num_cohorts * num_offsets)
+    return first_month, counts.reshape(num_groups, num_cohorts, num_offsets)
+
+# Function to build the retention table
+def build_retention_table(data, max_offset=COHORT_MAX_OFFSET):
+    """Returns the retention of recommended clients per distributor and cohort, plus overall.
+
+    The overall rows have IDDISTRIBUIDOR 'All'. Offsets past the last month of
+    data are left out, as they cannot be observed yet.
+    """
+    facts = data.load_table('fact_transactions')
+    dim_client = data.load_table('dim_client')
+    recommended_ids = dim_client.loc[dim_client['EsRecomendado'], 'IDCLIENTE'].to_numpy()
+    facts = facts[facts['IDCLIENTE'].isin(recommended_ids) & facts['IDDISTRIBUIDOR'].notna()]
+    if facts.empty:
+        return pd.DataFrame(columns=['IDDISTRIBUIDOR', 'Cohort', 'CohortSize', 'MonthOffset', 'ActiveClients', 'RetentionRate'])
+
+    months = _month_numbers(facts['IDTiempo'].to_numpy())
+    client_ids = facts['IDCLIENTE'].to_numpy()
+    distributor_codes, distributors = pd.factorize(facts['IDDISTRIBUIDOR'].astype('int64'), sort=True)
+    last_month = int(months.max())
+
+    tables = []
+    for labels, group_codes in (
+        (list(distributors), distributor_codes),
+        (['All'], np.zeros(len(facts), dtype=np.int64))
+    ):
+        first_month, counts = retention_counts(group_codes, client_ids, months, len(labels), max_offset)
+        num_groups, num_cohorts, num_offsets = counts.shape
+        group_index, cohort_index, offset_index = np.indices(counts.shape).reshape(3, -1)
+        table = pd.DataFrame({
+            'IDDISTRIBUIDOR': np.asarray(labels, dtype=object)[group_index],
+            'CohortMonth': first_month + cohort_index,
+            'CohortSize': np.repeat(counts[:, :, 0].ravel(), num_offsets),
+            'MonthOffset': offset_index,
+            'ActiveClients': counts.ravel()
+        })
+        table = table[(table['CohortSize'] > 0) & (table['CohortMonth'] + table['MonthOffset'] <= last_month)]
+        tables.append(table)
+
+    table = pd.concat(tables, ignore_index=True)
+    table['RetentionRate'] = table['ActiveClients'] / table['CohortSize']
+    table.insert(1, 'Cohort', _month_labels(table['CohortMonth']))
+    return table.drop(columns='CohortMonth')
+
+# Function to pivot the retention of one distributor
+def retention_matrix(retention_table, distributor='All'):
+    """Returns the cohorts x offsets retention matrix of a distributor (or 'All')."""
+    rows = retention_table[retention_table['IDDISTRIBUIDOR'] == distributor]
+    return rows.pivot(index='Cohort', columns='MonthOffset', values='RetentionRate').sort_index()
@@ -8,6 +8,7 @@
 # Date: 2025-06-27
 #---------------------------------------------------------------------------------------
 
+import os
 from pathlib import Path
 
 # Project Base Path
@@ -25,4 +26,129 @@ CLIENTS_EXCEL_FILE = RAW_DATA_DIR / "ClientesMarca.xls"
 DIM_CLIENT_FILE = PROCESSED_DATA_DIR / "dim_client.csv"
 DIM_DISTRIBUTOR_FILE = PROCESSED_DATA_DIR / "dim_distributor.csv"
 DIM_TIME_FILE = PROCESSED_DATA_DIR / "dim_time.csv"
-FACT_TRANSACTIONS_FILE = PROCESSED_DATA_DIR / "fact_transactions.csv"
\ No newline at end of file
+FACT_TRANSACTIONS_FILE = PROCESSED_DATA_DIR / "fact_transactions.csv"
+SNAPSHOT_FILE = PROCESSED_DATA_DIR / "snapshot.json"   # Version of the last complete set of tables
+
+# Checkpoints (resume between ETL stages)
+CHECKPOINT_DIR = BASE_DIR / "data" / "checkpoints"
+CHECKPOINT_COMPRESSION = "gzip"
+CHECKPOINT_RETENTION_RUNS = 5      # Number of most recent runs to keep
+CHECKPOINT_MAX_AGE_DAYS = 7        # Runs older than this are always removed
+
+# Out-of-core processing
+MEMORY_BUDGET_MB = 2048            # Above this estimate, facts are processed in chunks
+FACT_CHUNK_SIZE = 200_000          # Transactions per chunk in out-of-core mode
+BYTES_PER_TRANSACTION_ROW = 400    # Estimated peak memory per row in create_fact_table
+
+# Parallel fact build
+FACT_BUILD_WORKERS = os.cpu_count() or 1   # Processes used by the parallel fact build
+PARALLEL_MIN_ROWS = 1_000_000              # Smaller fact builds stay on a single core
+
+# Watch mode
+WATCH_POLL_INTERVAL = 1.0          # Seconds between scans when inotify is not available
+WATCH_DEBOUNCE_SECONDS = 0.5       # Quiet time to wait for after a burst of file events
+
+# Reports
+REPORTS_OUTPUT_DIR = BASE_DIR / "reports" / "mail"
+REPORT_PLUGIN_FILES = [
+    BASE_DIR / "src" / "reportsumarydistributor.py",
+    BASE_DIR / "reports" / "MonthlyLoanPerformanceAmountvsVolume.py",
+    BASE_DIR / "reports" / "StrategicDistributorPerformance.py",
+    BASE_DIR / "reports" / "CohortRetentionRecommendedClients.py",
+]
+REPORT_LOG_DIR = BASE_DIR / "reports" / "logs"
+REPORT_WORKERS = min(4, os.cpu_count() or 1)   # Reports rendered at the same time
+REPORT_TIMEOUT_SECONDS = 600                   # Default timeout of a report
+REQUIRED_REPORTS = ['distributor_summary']     # Reports the email has to wait for
+
+# Excel export
+EXCEL_MAX_ROWS = 1_048_576         # Excel's sheet row limit (header included)
+EXCEL_WRITE_BLOCK_ROWS = 50_000    # Rows converted at a time when streaming a sheet
+
+# Charts
+CHART_FORMATS = ['png']            # Any of 'png', 'svg', 'pdf'
+MONTHLY_CHART_VARIANTS = ['distributor', 'category', 'year']
+PLOTLY_JS_MODE = 'inline'          # 'inline' (self-contained pages), 'shared' (one bundle next to the pages) or 'cdn'
+WEBGL_POINT_THRESHOLD = 1000       # Scatter plots with more points use WebGL traces
+
+# Report cache
+REPORT_CACHE_ENABLED = True
+REPORT_CACHE_DIR = BASE_DIR / "reports" / "cache"
+REPORT_CACHE_MAX_MB = 500          # Least recently used entries are evicted beyond this size
+
+# Per-distributor reports
+DISTRIBUTOR_REPORTS_DIR = BASE_DIR / "reports" / "distributors"
+FANOUT_WORKERS = os.cpu_count() or 1   # Processes writing the distributor workbooks
+
+# Rolling metrics
+ROLLING_METRICS_FILE = PROCESSED_DATA_DIR / "agg_distributor_rolling.csv"
+ROLLING_WINDOWS = [7, 30, 90]      # Trailing window lengths, in days
+
+# Cohort retention
+COHORT_MAX_OFFSET = 12             # Months after the first transaction shown in the retention matrix
+
+# OLAP cube
+CUBE_CUBOIDS = [                   # Materialized besides the base cuboid (all dimensions)
+    ['distributor'],
+    ['category'],
+    ['recommended'],
+    ['year', 'month'],
+    ['distributor', 'recommended'],
+    ['distributor', 'year', 'month'],
+    ['category', 'recommended', 'year', 'month'],
+]
+
+# Bitmap indexes
+BITMAP_INDEX_DIR = PROCESSED_DATA_DIR / "fact_bitmaps"
+BITMAP_MAX_SEGMENTS = 8            # Appended segments are compacted into one beyond this
+
+# Email
+SMTP_TIMEOUT_SECONDS = 60
+MAIL_RATE_PER_MINUTE = 30          # Messages sent per minute at most (0 disables the limit)
+MAIL_IDLE_CHECK_SECONDS = 30       # Idle time after which the session is checked with NOOP before sending
+MAIL_SEND_RETRIES = 2              # Reconnections attempted for a message when the session drops
+DISTRIBUTOR_CONTACTS_FILE = RAW_DATA_DIR / "distributor_contacts.csv"   # IDDISTRIBUIDOR,Email
+MAIL_MAX_MESSAGE_MB = 20           # Largest email accepted by the mail server; bigger bundles are split
+MAIL_COMPRESSION_LEVEL = 6         # zlib level of the attachment archives
+MAIL_PACKAGE_DIR = BASE_DIR / "reports" / "packages"
+
+# Outbox
+OUTBOX_DIR = BASE_DIR / "reports" / "outbox"
+OUTBOX_CONNECTIONS = 4             # SMTP sessions used at the same time by the delivery worker
+OUTBOX_MAX_ATTEMPTS = 8            # Deliveries attempted before a message is marked as failed
+OUTBOX_BACKOFF_SECONDS = 30        # Delay before the first retry; doubled after every failure
+OUTBOX_MAX_BACKOFF_SECONDS = 3600
+
+# Scheduler
+SCHEDULER_DIR = BASE_DIR / "data" / "scheduler"
+SCHEDULER_LOCK_FILE = SCHEDULER_DIR / "scheduler.lock"
+SCHEDULER_HISTORY_FILE = SCHEDULER_DIR / "history.jsonl"
+SCHEDULER_WORKERS = max(1, min(4, os.cpu_count() or 1))   # Jobs run at the same time
+SCHEDULE = [                       # (cron expression, jobs to run with everything they wait for)
+    ("0 6 * * 1-5", ["cleanup"]),  # Full pipeline on weekday mornings
+    ("*/15 * * * *", ["retry_outbox"])  # Outbox retries; skipped while a full run holds the lock
+]
+
+# Report archive
+REPORT_ARCHIVE_DIR = BASE_DIR / "reports" / "archive"
+REPORT_ARCHIVE_INDEX = REPORT_ARCHIVE_DIR / "index.sqlite"
+REPORT_ARCHIVE_RETENTION_DAYS = 365    # Report dates kept in the archive
+REPORT_ARCHIVE_COMPRESSION_LEVEL = 6   # gzip level of the archived files
+
+# Metrics API
+API_HOST = "127.0.0.1"
+API_PORT = 8765
+API_CACHE_ENTRIES = 4096           # Responses kept in the LRU cache
+API_SNAPSHOT_POLL_SECONDS = 5      # Interval between checks for a newly published snapshot
+API_MAX_PAGE_SIZE = 1000           # Largest client list returned by one request
+
+# Live dashboard
+DASHBOARD_HOST = "127.0.0.1"
+DASHBOARD_PORT = 8766
+DASHBOARD_POLL_SECONDS = 5         # Interval between checks for a newly published snapshot
+DASHBOARD_HEARTBEAT_SECONDS = 15   # Idle time after which a comment is sent to keep streams open
+DASHBOARD_CLIENT_QUEUE = 16        # Events a slow browser may lag behind before it is disconnected
+DASHBOARD_DELTA_HISTORY = 32       # Deltas kept to catch up reconnecting browsers
+
+# BI export
+BI_EXPORT_DIR = BASE_DIR / "data" / "powerbi"   # Monthly fact partitions and manifest for incremental refresh
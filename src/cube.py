@@ -0,0 +1,206 @@
+# src/cube.py
+#--------------------------------------------------------------------------------
+# This module is a small in-memory OLAP cube over the star schema.
+# Every dimension is encoded once as categorical codes, and selected cuboids
+# (group-bys over a subset of the dimensions) are materialized as dense NumPy
+# arrays indexed by those codes, one per measure. A query (group by some
+# dimensions, slice or dice others) is answered from the smallest materialized
+# cuboid that contains all its dimensions: the filters index its axes and the
+# remaining axes are summed away (roll-up), which takes microseconds.
+# The base cuboid, over all the dimensions, is always materialized, so every
+# additive measure can be answered. Distinct clients are not additive: they are
+# taken from a cuboid only when every extra axis is sliced to a single value,
+# and computed from the facts otherwise.
+# Dimensions are keyed by IDs (two distributors may share a name); their names
+# are carried along as labels in the query results.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from config import CUBE_CUBOIDS
+
+# Dimensions of the cube and their columns in the joined facts
+DIMENSIONS = {
+    'distributor': 'IDDISTRIBUIDOR',
+    'category': 'CategoriaCliente',
+    'recommended': 'EsRecomendado',
+    'year': 'Año',
+    'month': 'Mes',
+    'day': 'Dia'
+}
+# Columns of the joined facts naming the keys of a dimension
+DIMENSION_NAMES = {
+    'distributor': 'NombreDistribuidor'
+}
+MEASURES = ['sum', 'count', 'avg', 'distinct_clients']
+
+AMOUNT_COLUMN = 'MontoPrestamo'
+CLIENT_COLUMN = 'IDCLIENTE'
+
+
+class Cube:
+    """Dense cuboids over the joined facts, queried by dimension names and labels."""
+
+    def __init__(self, facts, dimensions=DIMENSIONS, cuboids=CUBE_CUBOIDS, names=DIMENSION_NAMES):
+        self.dimensions = list(dimensions)
+        self.labels = {}
+        self.positions = {}
+        codes = {}
+        for dimension, column in dimensions.items():
+            codes[dimension], labels = pd.factorize(facts[column], sort=True, use_na_sentinel=False)
+            self.labels[dimension] = list(labels)
+            self.positions[dimension] = {label: position for position, label in enumerate(self.labels[dimension])}
+        self.codes = codes
+        # Name of every key, in axis order
+        self.names = {
+            dimension: facts[column].groupby(codes[dimension]).first().reindex(range(len(self.labels[dimension]))).tolist()
+            for dimension, column in names.items() if dimension in dimensions
+        }
+        self.amount = facts[AMOUNT_COLUMN].to_numpy(dtype=np.float64)
+        self.clients = pd.factorize(facts[CLIENT_COLUMN])[0]
+
+        self.cuboids = {}
+        self.materialize(self.dimensions)
+        for cuboid in cuboids:
+            self.materialize(cuboid)
+
+    def _ordered(self, dimensions):
+        """Returns the dimensions in cube order, which is the axis order of the cuboids."""
+        unknown = set(dimensions) - set(self.dimensions)
+        if unknown:
+            raise KeyError(f"Unknown cube dimension(s): {', '.join(sorted(unknown))}")
+        return tuple(dimension for dimension in self.dimensions if dimension in dimensions)
+
+    def materialize(self, dimensions):
+        """Computes the cuboid over `dimensions` and keeps it for later queries."""
+        dimensions = self._ordered(dimensions)
+        shape = tuple(len(self.labels[dimension]) for dimension in dimensions)
+        size = int(np.prod(shape, dtype=np.int64))
+        cells = (
+            np.ravel_multi_index([self.codes[dimension] for dimension in dimensions], shape)
+            if dimensions else np.zeros(len(self.amount), dtype=np.int64)
+        )
+
+        # Each (cell, client) pair counts once for the distinct clients
+        stride = int(self.clients.max(initial=0)) + 1
+        client_cells = np.unique(cells.astype(np.int64) * stride + self.clients) // stride
+
+        self.cuboids[dimensions] = {
+            'sum': np.bincount(cells, weights=self.amount, minlength=size).reshape(shape),
+            'count': np.bincount(cells, minlength=size).reshape(shape),
+            'distinct_clients': np.bincount(client_cells, minlength=size).reshape(shape)
+        }
+        return self.cuboids[dimensions]
+
+    def _select(self, dimension, values):
+        """Returns the axis positions of a label or a list of labels."""
+        if isinstance(values, (list, tuple, set, np.ndarray)):
+            return [self.positions[dimension][value] for value in values]
+        return self.positions[dimension][values]
+
+    def _nearest_cuboid(self, needed, allowed=None):
+        """Returns the dimensions of the smallest materialized cuboid containing `needed`.
+
+        With allowed, only cuboids whose dimensions are all in `allowed` qualify.
+        """
+        candidates = [
+            dimensions for dimensions in self.cuboids
+            if set(needed) <= set(dimensions) and (allowed is None or set(dimensions) <= allowed)
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda dimensions: self.cuboids[dimensions]['count'].size)
+
+    def _answer(self, cuboid_dimensions, measure, by, where):
+        """Slices, dices and rolls up one measure of a cuboid down to the `by` axes."""
+        array = self.cuboids[cuboid_dimensions][measure]
+        axes = list(cuboid_dimensions)
+        for dimension, values in where.items():
+            axis = axes.index(dimension)
+            selection = self._select(dimension, values)
+            array = np.take(array, selection, axis=axis)
+            if not isinstance(selection, list):
+                axes.pop(axis)
+        rolled = tuple(position for position, dimension in enumerate(axes) if dimension not in by)
+        return array.sum(axis=rolled) if rolled else array
+
+    def _distinct_from_facts(self, by, where):
+        """Counts distinct clients from the encoded facts, for non-additive queries."""
+        mask = np.ones(len(self.clients), dtype=bool)
+        for dimension, values in where.items():
+            selection = self._select(dimension, values)
+            mask &= np.isin(self.codes[dimension], np.atleast_1d(selection))
+        shape = tuple(len(self.labels[dimension]) for dimension in by)
+        cells = (
+            np.ravel_multi_index([self.codes[dimension][mask] for dimension in by], shape)
+            if by else np.zeros(int(mask.sum()), dtype=np.int64)
+        )
+        stride = int(self.clients.max(initial=0)) + 1
+        client_cells = np.unique(cells.astype(np.int64) * stride + self.clients[mask]) // stride
+        return np.bincount(client_cells, minlength=int(np.prod(shape, dtype=np.int64))).reshape(shape)
+
+    def query(self, measures=('sum',), by=(), where=None, as_frame=True):
+        """Answers a slice/dice/roll-up query.
+
+        by lists the dimensions to group by; where maps dimensions to a label
+        (slice) or a list of labels (dice). Returns a DataFrame with one row per
+        non-empty combination of the `by` labels (plus a <dimension>_name column
+        for the dimensions keyed by ID), or, with as_frame=False, a dict of
+        arrays with one axis per `by` dimension (in cube order).
+        """
+        by = self._ordered(by)
+        where = where or {}
+        self._ordered(where)
+        # Diced dimensions, and sliced ones that are also grouped by, keep their axis
+        # (with the labels in axis order)
+        where = {
+            dimension: sorted(values, key=self.positions[dimension].__getitem__)
+            if isinstance(values, (list, tuple, set, np.ndarray))
+            else [values] if dimension in by else values
+            for dimension, values in where.items()
+        }
+
+        cuboid = self._nearest_cuboid(set(by) | set(where))
+        results = {}
+        for measure in measures:
+            if measure in ('sum', 'count'):
+                results[measure] = self._answer(cuboid, measure, by, where)
+            elif measure == 'avg':
+                total = self._answer(cuboid, 'sum', by, where)
+                count = self._answer(cuboid, 'count', by, where)
+                results[measure] = np.divide(total, count, out=np.full(total.shape, np.nan), where=count > 0)
+            elif measure == 'distinct_clients':
+                # Exact only when every axis that is summed away was sliced to one value
+                sliced = {dimension for dimension, values in where.items() if not isinstance(values, list)}
+                exact = self._nearest_cuboid(set(by) | set(where), allowed=set(by) | sliced)
+                if exact is not None:
+                    results[measure] = self._answer(exact, measure, by, where)
+                else:
+                    results[measure] = self._distinct_from_facts(by, where)
+            else:
+                raise KeyError(f"Unknown cube measure: {measure}")
+
+        if not as_frame:
+            return results
+        return self._to_frame(results, self._answer(cuboid, 'count', by, where), by, where)
+
+    def _to_frame(self, results, count, by, where):
+        """Returns the non-empty cells of the query results as a DataFrame."""
+        axis_labels = [
+            where[dimension] if isinstance(where.get(dimension), list) else self.labels[dimension]
+            for dimension in by
+        ]
+        frame = pd.DataFrame(list(product(*axis_labels)), columns=list(by)) if by else pd.DataFrame(index=[0])
+        for dimension in by:
+            if dimension in self.names:
+                names = [self.names[dimension][self.positions[dimension][label]] for label in frame[dimension]]
+                frame.insert(frame.columns.get_loc(dimension) + 1, f"{dimension}_name", names)
+        for measure, values in results.items():
+            frame[measure] = np.ravel(values)
+        return frame[np.ravel(count) > 0].reset_index(drop=True)
@@ -0,0 +1,270 @@
+# src/dashboard.py
+#--------------------------------------------------------------------------------
+# This script is a live dashboard pushed to browsers with Server-Sent Events.
+# For every published snapshot (snapshot.py) a few aggregate tables (per
+# distributor, per month, per category, per distributor and month) are
+# materialized from the OLAP cube (cube.py). A new snapshot is diffed table by
+# table against the previous one, and only the rows that changed or
+# disappeared are pushed. Every event is encoded once and put on the queue of
+# each connected browser, so many clients cost no recomputation; a browser that
+# falls too far behind is disconnected and, when it reconnects with its
+# Last-Event-ID, receives the deltas it missed (or the full state).
+# Run it with:  python src/dashboard.py [--host H] [--port P]  and open http://H:P/
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+
+
+from config import (
+    DASHBOARD_HOST, DASHBOARD_PORT, DASHBOARD_POLL_SECONDS, DASHBOARD_HEARTBEAT_SECONDS,
+    DASHBOARD_CLIENT_QUEUE, DASHBOARD_DELTA_HISTORY
+)
+import reportdata
+import snapshot
+
+# Aggregate tables pushed to the dashboard and the cube dimensions they group by
+# (rows are keyed by these labels, e.g. distributor IDs; names come along as columns)
+AGGREGATES = {
+    'distributors': ('distributor',),
+    'months': ('year', 'month'),
+    'categories': ('category',),
+    'distributor_months': ('distributor', 'year', 'month'),
+}
+MEASURES = ('sum', 'count', 'distinct_clients')
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Live distributor dashboard</title>
+<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;margin-bottom:2em}
+td,th{border:1px solid #ccc;padding:4px 10px;text-align:right}.changed{background:#fff3b0}</style></head>
+<body><h1>Live distributor dashboard</h1><p id="status">Connecting...</p>
+<h2>Distributors</h2><table id="distributors"></table>
+<h2>Months</h2><table id="months"></table>
+<h2>Categories</h2><table id="categories"></table>
+<script>
+const state = {}; const shown = ['distributors', 'months', 'categories'];
+function render(table, changed) {
+  const rows = Object.entries(state[table] || {}).sort();
+  if (!rows.length) return;
+  const columns = Object.keys(rows[0][1]);
+  document.getElementById(table).innerHTML = '<tr>' + columns.map(c => '<th>' + c + '</th>').join('') + '</tr>' +
+    rows.map(([key, row]) => '<tr class="' + (changed.has(key) ? 'changed' : '') + '">' +
+      columns.map(c => '<td>' + (typeof row[c] === 'number' ? row[c].toLocaleString() : row[c]) + '</td>').join('') + '</tr>').join('');
+}
+const source = new EventSource('/events');
+source.addEventListener('snapshot', e => {
+  const message = JSON.parse(e.data);
+  Object.assign(state, message.tables);
+  shown.forEach(table => render(table, new Set()));
+  document.getElementById('status').textContent = 'Snapshot ' + message.version + ' (full state)';
+});
+source.addEventListener('delta', e => {
+  const message = JSON.parse(e.data);
+  shown.forEach(table => {
+    const delta = message.tables[table] || {upserted: {}, removed: []};
+    state[table] = state[table] || {};
+    Object.assign(state[table], delta.upserted);
+    delta.removed.forEach(key => delete state[table][key]);
+    render(table, new Set(Object.keys(delta.upserted)));
+  });
+  document.getElementById('status').textContent = 'Snapshot ' + message.version + ' (updated ' + new Date().toLocaleTimeString() + ')';
+});
+source.onerror = () => { document.getElementById('status').textContent = 'Reconnecting...'; };
+</script></body></html>
+"""
+
+# Function to materialize the aggregate tables of the loaded snapshot
+def materialize_aggregates():
+    """Returns {table: {row key: row}} from the cube over the current processed tables."""
+    reportdata.clear_cache()
+    cube = reportdata.cube()
+    tables = {}
+    for table, by in AGGREGATES.items():
+        frame = cube.query(MEASURES, by=by)
+        columns = [column for column in frame.columns if column not in MEASURES]
+        labels = frame[columns].astype(object).where(frame[columns].notna(), None)
+        rows = {}
+        for row_labels, amount, count, clients in zip(
+            labels.itertuples(index=False, name=None), frame['sum'].round(2).tolist(),
+            frame['count'].tolist(), frame['distinct_clients'].tolist()
+        ):
+            row = {column: label.item() if hasattr(label, 'item') else label
+                   for column, label in zip(columns, row_labels)}
+            row.update(amount=amount, count=int(count), clients=int(clients))
+            rows["|".join(str(row[dimension]) for dimension in by)] = row
+        tables[table] = rows
+    # The aggregates are all the dashboard keeps
+    reportdata.clear_cache()
+    return tables
+
+# Function to diff two sets of aggregate tables
+def diff_aggregates(old, new):
+    """Returns {table: {'upserted': {key: row}, 'removed': [keys]}} for the tables that changed."""
+    delta = {}
+    for table, rows in new.items():
+        old_rows = old.get(table, {})
+        upserted = {key: row for key, row in rows.items() if old_rows.get(key) != row}
+        removed = [key for key in old_rows if key not in rows]
+        if upserted or removed:
+            delta[table] = {'upserted': upserted, 'removed': removed}
+    return delta
+
+# Function to encode a Server-Sent Event
+def encode_event(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return ("\n".join(lines) + "\n\n").encode('utf-8')
+
+
+class Dashboard:
+    """The current aggregates, the recent deltas and the connected browsers."""
+
+    def __init__(self):
+        self.version = None
+        self.tables = {}
+        self.snapshot_event = None
+        # (version before, version after, encoded delta event) of the latest snapshots
+        self.history = deque(maxlen=DASHBOARD_DELTA_HISTORY)
+        self.clients = set()
+
+    def load(self, record, tables):
+        """Swaps in the aggregates of a snapshot and broadcasts their delta."""
+        started = time.perf_counter()
+        delta = diff_aggregates(self.tables, tables)
+        previous, self.version, self.tables = self.version, record['version'], tables
+        self.snapshot_event = encode_event('snapshot', {'version': self.version, 'tables': tables}, self.version)
+        changed_rows = sum(len(table['upserted']) + len(table['removed']) for table in delta.values())
+        print(f"Snapshot {self.version} swapped in; diffed in {time.perf_counter() - started:.3f}s "
+              f"({changed_rows} changed row(s)).")
+        if previous is None:
+            return
+        event = encode_event('delta', {'version': self.version, 'previous': previous, 'tables': delta}, self.version)
+        self.history.append((previous, self.version, event))
+        self.broadcast(event)
+
+    def broadcast(self, event):
+        """Queues the same encoded event for every client; drops the clients that fell behind."""
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Close its stream; the browser reconnects and catches up from its Last-Event-ID
+                self.clients.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+        if self.clients:
+            print(f"Pushed {len(event):,} bytes to {len(self.clients)} client(s).")
+
+    def catch_up(self, last_event_id):
+        """Returns the events a client that last saw last_event_id needs."""
+        if last_event_id == self.version:
+            return []
+        versions = [before for before, _, _ in self.history]
+        if last_event_id in versions:
+            start = versions.index(last_event_id)
+            return [event for _, _, event in list(self.history)[start:]]
+        return [self.snapshot_event]
+
+    async def refresh(self, record):
+        """Aggregates a snapshot in a worker thread, then swaps it in on the event loop."""
+        started = time.perf_counter()
+        tables = await asyncio.to_thread(materialize_aggregates)
+        print(f"Snapshot {record['version']} aggregated in {time.perf_counter() - started:.2f}s.")
+        self.load(record, tables)
+
+    async def watch_snapshots(self):
+        """Aggregates every newly published snapshot, forever."""
+        while True:
+            try:
+                record = snapshot.current()
+                if record['version'] != self.version:
+                    await self.refresh(record)
+            except Exception as e:
+                # Keep the current aggregates, e.g. while the ETL is still writing
+                print(f"WARNING: Could not load the new snapshot ({e}). Retrying later.")
+            await asyncio.sleep(DASHBOARD_POLL_SECONDS)
+
+    async def stream(self, writer, last_event_id):
+        """Streams the catch-up events, then every broadcast, to one browser."""
+        queue = asyncio.Queue(maxsize=DASHBOARD_CLIENT_QUEUE)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\nretry: 3000\n\n")
+        for event in self.catch_up(last_event_id):
+            writer.write(event)
+        self.clients.add(queue)
+        try:
+            while True:
+                await writer.drain()
+                try:
+                    event = await asyncio.wait_for(queue.get(), DASHBOARD_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # A comment line keeps proxies from closing an idle stream
+                    event = b": heartbeat\n\n"
+                if event is None:
+                    return
+                writer.write(event)
+        finally:
+            self.clients.discard(queue)
+
+    async def handle(self, reader, writer):
+        """Answers one HTTP connection."""
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1')
+                if line in ('\r\n', '\n', ''):
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            path = request_line[1].split('?')[0] if len(request_line) > 1 else ''
+
+            if path == '/events':
+                await self.stream(writer, headers.get('last-event-id'))
+            elif path in ('/', '/index.html'):
+                self._respond(writer, '200 OK', 'text/html; charset=utf-8', PAGE.encode('utf-8'))
+            elif path == '/state':
+                self._respond(writer, '200 OK', 'application/json', json.dumps({
+                    'version': self.version, 'tables': self.tables
+                }).encode('utf-8'))
+            else:
+                self._respond(writer, '404 Not Found', 'text/plain', b"Not found")
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _respond(writer, status, content_type, body):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+
+# Coroutine of the dashboard server
+async def serve(host=DASHBOARD_HOST, port=DASHBOARD_PORT):
+    """Serves the dashboard until cancelled."""
+    dashboard = Dashboard()
+    await dashboard.refresh(snapshot.current())
+    server = await asyncio.start_server(dashboard.handle, host, port)
+    print(f"Dashboard listening on http://{host}:{port}/")
+    async with server:
+        await asyncio.gather(server.serve_forever(), dashboard.watch_snapshots())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pushes live aggregates to browsers over Server-Sent Events.")
+    parser.add_argument('--host', default=DASHBOARD_HOST, help="Address to listen on.")
+    parser.add_argument('--port', type=int, default=DASHBOARD_PORT, help="Port to listen on.")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nDashboard stopped.")
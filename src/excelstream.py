@@ -0,0 +1,80 @@
+# src/excelstream.py
+#--------------------------------------------------------------------------------
+# This module writes large DataFrames to Excel with a bounded amount of memory.
+# The workbook is opened in xlsxwriter's constant_memory mode, which flushes each
+# row to disk as soon as the next one starts, so rows are written strictly in
+# order, block by block. Cell formats are precomputed per column (dates are
+# converted to Excel serial numbers and displayed through the column format),
+# and when a sheet reaches Excel's row limit the rows continue on a new sheet
+# named "<sheet> (2)", "<sheet> (3)" and so on.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import pandas as pd
+import xlsxwriter
+
+from config import EXCEL_MAX_ROWS, EXCEL_WRITE_BLOCK_ROWS
+
+# Origin of Excel serial dates (1900 date system)
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+
+# Function to open a workbook in streaming mode
+def open_streaming_workbook(file_path):
+    """Creates an xlsxwriter workbook that keeps at most one row per sheet in memory."""
+    return xlsxwriter.Workbook(str(file_path), {
+        'constant_memory': True,
+        'nan_inf_to_errors': True,
+        'strings_to_formulas': False,
+        'strings_to_urls': False
+    })
+
+# Function to convert a column to plain Python values
+def _column_values(series):
+    """Returns the values of a column as a list Excel can store natively."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        serials = (series - EXCEL_EPOCH) / pd.Timedelta(days=1)
+        return [None if pd.isna(value) else value for value in serials.tolist()]
+    # Missing values become empty cells: nullable dtypes hold pd.NA, which
+    # xlsxwriter cannot write, and str() would turn them into 'nan' or '<NA>'
+    if (isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object
+            or pd.api.types.is_string_dtype(series)):
+        return [None if pd.isna(value) else value for value in series.tolist()]
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return [None if pd.isna(value) else value for value in series.astype(object).tolist()]
+    return [None if pd.isna(value) else str(value) for value in series.tolist()]
+
+# Function to add a sheet with its header and column formats
+def _add_sheet(workbook, sheet_name, columns, column_specs, header_format):
+    """Adds a worksheet, writes the header row and applies the column formats."""
+    sheet = workbook.add_worksheet(sheet_name)
+    for col_num, (width, cell_format) in enumerate(column_specs):
+        sheet.set_column(col_num, col_num, width, cell_format)
+    sheet.write_row(0, 0, [str(column) for column in columns], header_format)
+    return sheet
+
+# Function to write a DataFrame across as many sheets as needed
+def write_frame_streaming(workbook, sheet_name, df, column_specs, header_format=None, max_rows=EXCEL_MAX_ROWS):
+    """Writes df (without index) starting at sheet_name, rolling over at max_rows rows per sheet.
+
+    column_specs is a list of (width, format) tuples, one per column of df.
+    Returns the names of the sheets written.
+    """
+    rows_per_sheet = max_rows - 1  # The first row holds the header
+    sheet_names = [sheet_name]
+    sheet = _add_sheet(workbook, sheet_name, df.columns, column_specs, header_format)
+    row_num = 1
+
+    for start in range(0, len(df), EXCEL_WRITE_BLOCK_ROWS):
+        block = df.iloc[start:start + EXCEL_WRITE_BLOCK_ROWS]
+        columns = [_column_values(block[column]) for column in block.columns]
+        for values in zip(*columns):
+            if row_num > rows_per_sheet:
+                sheet_names.append(f"{sheet_name} ({len(sheet_names) + 1})")
+                sheet = _add_sheet(workbook, sheet_names[-1], df.columns, column_specs, header_format)
+                row_num = 1
+            sheet.write_row(row_num, 0, values)
+            row_num += 1
+
+    return sheet_names
@@ -2,7 +2,8 @@
 #--------------------------------------------------------------------------------------------------------
 # This module provides functions to load client recommendation data from a JSON file
 # and client/transaction data from an Excel file. It also includes a function to create mock
-# data for demonstration purposes.
+# data for demonstration purposes, and functions to stream the transactions sheet in
+# fixed-size chunks when it does not fit in memory.
 #
 # author: ekastel
 # date: 2025-06-27
@@ -38,6 +39,19 @@ def load_clients_and_transactions(file_path):
         print(f"Error loading sheets from Excel: {e}")
         return pd.DataFrame(), pd.DataFrame()
 
+# Function to load only the clients data
+def load_clients_data(file_path):
+    """Loads the clients sheet from an Excel file, leaving the transactions on disk."""
+    print(f"Loading clients from {file_path}...")
+    try:
+        return pd.read_excel(file_path, sheet_name="CLIENTES")
+    except FileNotFoundError:
+        print(f"Error: Excel file not found at {file_path}")
+        return pd.DataFrame(columns=['IDCLIENTE'])
+    except ValueError as e:
+        print(f"Error loading sheets from Excel: {e}")
+        return pd.DataFrame()
+
 # Function to create mock Excel data
 def create_mock_excel_data(file_path, client_ids_from_json):
     """Creates a mock Excel file for demonstration purposes."""
@@ -66,4 +80,67 @@ def create_mock_excel_data(file_path, client_ids_from_json):
         mock_clients_df.to_excel(writer, sheet_name='CLIENTES', index=False)
         mock_transactions_df.to_excel(writer, sheet_name='TRANSACCIONES', index=False)
     
-    print(f"Mock Excel file created at {file_path}")
\ No newline at end of file
+    print(f"Mock Excel file created at {file_path}")
+
+# Function to check that a workbook can be streamed
+def _check_streamable(file_path):
+    """Raises ValueError unless the file is an xlsx workbook.
+
+    Only xlsx sheets can be read row by row: xlrd loads a whole BIFF (.xls) sheet
+    into memory, so legacy workbooks are not streamed (convert them to xlsx).
+    Files named .xls are often xlsx workbooks, so this checks the content (xlsx is a zip).
+    """
+    with open(file_path, 'rb') as f:
+        if f.read(2) != b'PK':
+            raise ValueError(f"{file_path} is a legacy .xls workbook, which cannot be streamed; "
+                             f"save it as .xlsx to use the out-of-core mode.")
+
+# Function to count the transactions without loading them
+def count_transactions(file_path):
+    """Returns the number of transaction rows in the Excel file (header excluded).
+
+    The count comes from the sheet's dimension metadata, so no row is parsed. Returns
+    None when it is unknown: legacy .xls workbooks, or sheets written without dimensions.
+    """
+    try:
+        _check_streamable(file_path)
+    except FileNotFoundError:
+        print(f"Error: Excel file not found at {file_path}")
+        return 0
+    except ValueError:
+        return None
+
+    import openpyxl
+    # openpyxl rejects the .xls extension, so hand it a file object instead of the path
+    with open(file_path, 'rb') as f:
+        workbook = openpyxl.load_workbook(f, read_only=True, data_only=True)
+        try:
+            row_count = workbook["TRANSACCIONES"].max_row
+        finally:
+            workbook.close()
+    return None if row_count is None else max(row_count - 1, 0)
+
+# Function to stream transactions in chunks
+def iter_transactions_chunks(file_path, chunk_size):
+    """Yields the transactions of an xlsx workbook as DataFrames of at most chunk_size rows."""
+    print(f"Streaming transactions from {file_path} in chunks of {chunk_size:,} rows...")
+    _check_streamable(file_path)
+
+    import openpyxl
+    with open(file_path, 'rb') as f:
+        workbook = openpyxl.load_workbook(f, read_only=True, data_only=True)
+        try:
+            rows = workbook["TRANSACCIONES"].iter_rows(values_only=True)
+            header = [str(column).strip() for column in next(rows)]
+            block = []
+            for row in rows:
+                if all(value in (None, '') for value in row):
+                    continue
+                block.append(row)
+                if len(block) == chunk_size:
+                    yield pd.DataFrame.from_records(block, columns=header)
+                    block = []
+            if block:
+                yield pd.DataFrame.from_records(block, columns=header)
+        finally:
+            workbook.close()
@@ -0,0 +1,134 @@
+# src/mailer.py
+#--------------------------------------------------------------------------------
+# This module sends batches of emails over a single SMTP session.
+# The Mailer connects once (STARTTLS and login when the server and the settings
+# allow it), sends every message over the same session, and reconnects
+# transparently when the server dropped an idle connection. Sends are spaced to
+# at most MAIL_RATE_PER_MINUTE messages per minute.
+# Without credentials and with SMTP_STARTTLS=false it works against a local
+# debugging server, e.g.:  python -m aiosmtpd -n -l localhost:1025  (pip install
+# aiosmtpd; the standard library smtpd module was removed in Python 3.12).
+# tests/test_mailer.py drives it against an in-process stub server.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import smtplib
+import time
+
+from config import MAIL_RATE_PER_MINUTE, MAIL_IDLE_CHECK_SECONDS, MAIL_SEND_RETRIES, SMTP_TIMEOUT_SECONDS
+
+# Errors after which the session is reopened and the message sent again
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+class Mailer:
+    """A reusable, rate-limited SMTP session."""
+
+    def __init__(self, server, port, sender, password=None, starttls=True,
+                 rate_per_minute=MAIL_RATE_PER_MINUTE, timeout=SMTP_TIMEOUT_SECONDS):
+        self.server = server
+        self.port = port
+        self.sender = sender
+        self.password = password
+        self.starttls = starttls
+        self.min_interval = 60.0 / rate_per_minute if rate_per_minute else 0.0
+        self.timeout = timeout
+        self.connection = None
+        self.last_used = 0.0
+        self.last_sent = 0.0
+        self.sent_count = 0
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        """Opens and authenticates the SMTP session."""
+        self.close()
+        connection = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        try:
+            connection.ehlo()
+            if self.starttls and connection.has_extn('starttls'):
+                connection.starttls()  # Secure connection
+                connection.ehlo()
+            if self.password:
+                connection.login(self.sender, self.password)
+        except Exception:
+            connection.close()
+            raise
+        self.connection = connection
+        self.last_used = time.monotonic()
+        print(f"Connected to SMTP server {self.server}:{self.port}.")
+
+    def close(self):
+        """Ends the session, ignoring a connection the server already dropped."""
+        if self.connection is None:
+            return
+        try:
+            self.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self.connection.close()
+        self.connection = None
+
+    def _ensure_connected(self):
+        """Reconnects when there is no session, or when an idle one no longer answers."""
+        if self.connection is None:
+            self.connect()
+            return
+        if time.monotonic() - self.last_used < MAIL_IDLE_CHECK_SECONDS:
+            return
+        try:
+            status, _ = self.connection.noop()
+        except RECONNECT_ERRORS + (smtplib.SMTPException,):
+            status = None
+        if status != 250:
+            print("SMTP session timed out. Reconnecting...")
+            self.connect()
+
+    def _wait_for_rate_limit(self):
+        delay = self.last_sent + self.min_interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def send(self, message):
+        """Sends an email.message.Message, reconnecting and retrying after a dropped session."""
+        self._wait_for_rate_limit()
+        for attempt in range(MAIL_SEND_RETRIES + 1):
+            self._ensure_connected()
+            try:
+                self.connection.send_message(message)
+                break
+            except smtplib.SMTPResponseException as e:
+                # 421: the server is closing the session (e.g. idle timeout or too many messages)
+                if e.smtp_code != 421 or attempt == MAIL_SEND_RETRIES:
+                    raise
+            except RECONNECT_ERRORS:
+                if attempt == MAIL_SEND_RETRIES:
+                    raise
+            print("SMTP session lost. Reconnecting and retrying...")
+            # The server ended the session: release the socket without waiting for a QUIT reply
+            self.connection.close()
+            self.connection = None
+
+        self.last_used = self.last_sent = time.monotonic()
+        self.sent_count += 1
+
+    def send_many(self, messages):
+        """Sends every message over the session; returns (sent, failed) lists.
+
+        A message the server rejects does not stop the batch.
+        """
+        sent, failed = [], []
+        for message in messages:
+            try:
+                self.send(message)
+                sent.append(message)
+            except (smtplib.SMTPException, OSError) as e:
+                print(f"ERROR sending email to {message['To']}: {e}")
+                failed.append((message, e))
+        return sent, failed
@@ -3,63 +3,224 @@
 # Main ETL pipeline for processing client recommendations and transactions.
 # This script orchestrates the entire ETL process, including data extraction,
 # transformation, and loading into the appropriate data structures.
+# The outputs of each stage are checkpointed, so a failed run can be resumed
+# with --resume from the first stage that did not complete.
+# When the transactions would not fit in the configured memory budget, the
+# pipeline switches to an out-of-core mode that streams them in chunks, and large
+# fact builds are spread over a process pool. With --watch it keeps running and
+# refreshes the outputs whenever a raw file changes (see watcher.py).
+# After the star schema is written, the publish stage rebuilds the rolling
+# distributor metrics table and the fact bitmap indexes (see rollingmetrics.py,
+# bitmapindex.py) and publishes the new tables as the current snapshot
+# (snapshot.py); like the other stages, it is resumed when it failed.
 #
 # author: ekastel
 # date: 2025-06-27
 #--------------------------------------------------------------------------------
 
+import argparse
 import os
 import pandas as pd
 from config import (
     RECOMMENDATIONS_JSON_FILE, CLIENTS_EXCEL_FILE,
-    DIM_CLIENT_FILE, DIM_DISTRIBUTOR_FILE, DIM_TIME_FILE, FACT_TRANSACTIONS_FILE
+    DIM_CLIENT_FILE, DIM_DISTRIBUTOR_FILE, DIM_TIME_FILE, FACT_TRANSACTIONS_FILE,
+    MEMORY_BUDGET_MB, FACT_CHUNK_SIZE, BYTES_PER_TRANSACTION_ROW,
+    FACT_BUILD_WORKERS, PARALLEL_MIN_ROWS
 )
+import bitmapindex
+import checkpoint
 import loader
+import parallelfact
+import rollingmetrics
+import snapshot
 import transformer
 import writer
 
-def main():
-    """Main ETL pipeline function."""
-    print("--- Starting ETL Process ---")
+# Stages of the pipeline, in execution order
+STAGES = ['extract', 'transform', 'load', 'publish']
+
+def use_chunked_mode(file_path):
+    """Decides whether the transactions must be streamed to stay within the memory budget.
+
+    Unsized workbooks (see loader.count_transactions) are loaded in memory; use --chunked for them.
+    """
+    row_count = loader.count_transactions(file_path)
+    if row_count is None:
+        return False
+    estimated_mb = row_count * BYTES_PER_TRANSACTION_ROW / 1024 ** 2
+    chunked = estimated_mb > MEMORY_BUDGET_MB
+    if chunked:
+        print(f"Estimated fact build memory {estimated_mb:,.0f} MB exceeds the budget of "
+              f"{MEMORY_BUDGET_MB:,} MB. Switching to out-of-core mode.")
+    return chunked
 
-    # --- EXTRACT ---
+def extract(chunked=None):
+    """Extract stage: loads the raw recommendations, clients and transactions.
+
+    In out-of-core mode the transactions are left on disk and streamed during the load stage.
+    """
     reco_df = loader.load_recommendations_data(RECOMMENDATIONS_JSON_FILE)
     if reco_df.empty:
         print("ETL process halted due to missing recommendations data.")
-        return
+        return None
 
     # Check for mock data creation
     if not os.path.exists(CLIENTS_EXCEL_FILE):
         unique_client_ids = reco_df['IDCLIENTE'].unique().tolist()
         loader.create_mock_excel_data(CLIENTS_EXCEL_FILE, unique_client_ids)
-    
+
+    if chunked is None:
+        chunked = use_chunked_mode(CLIENTS_EXCEL_FILE)
+    if chunked:
+        clients_df = loader.load_clients_data(CLIENTS_EXCEL_FILE)
+        if clients_df.empty:
+            print("ETL process halted due to missing client data.")
+            return None
+        return {'recommendations': reco_df, 'clients': clients_df}
+
     clients_df, transactions_df = loader.load_clients_and_transactions(CLIENTS_EXCEL_FILE)
     if clients_df.empty or transactions_df.empty:
         print("ETL process halted due to missing client/transaction data.")
-        return
+        return None
+
+    return {'recommendations': reco_df, 'clients': clients_df, 'transactions': transactions_df}
+
+def transform(extracted, workers=FACT_BUILD_WORKERS):
+    """Transform stage: builds the dimensions and the fact table."""
+    cleaned_reco_df = transformer.clean_recommendations_data(extracted['recommendations'])
 
-    # --- TRANSFORM ---
-    cleaned_reco_df = transformer.clean_recommendations_data(reco_df)
-    
     # Create Dimensions
     dim_distributor = transformer.create_distributor_dimension(cleaned_reco_df)
-    dim_client = transformer.create_client_dimension(clients_df, cleaned_reco_df)
-    dim_time = transformer.create_time_dimension(transactions_df['FECHA'])
-    
+    dim_client = transformer.create_client_dimension(extracted['clients'], cleaned_reco_df)
+
+    # Out-of-core mode: time dimension and facts are built while streaming in the load stage
+    if 'transactions' not in extracted:
+        return {
+            'dim_client': dim_client,
+            'dim_client_keys': dim_client[['IDCLIENTE', 'IDDISTRIBUIDOR']],
+            'dim_distributor': dim_distributor
+        }
+
+    dim_time = transformer.create_time_dimension(extracted['transactions']['FECHA'])
+
     # Create Fact Table
-    fact_transactions = transformer.create_fact_table(transactions_df, dim_client, dim_time)
-    
-    # For the final client dimension, we only need the client attributes, not the distributor FK
-    dim_client_final = dim_client[['IDCLIENTE', 'CategoriaCliente', 'EsRecomendado']]
+    transactions_df = extracted['transactions']
+    if workers > 1 and len(transactions_df) >= PARALLEL_MIN_ROWS:
+        fact_transactions = parallelfact.create_fact_table_parallel(transactions_df, dim_client, dim_time, workers)
+    else:
+        fact_transactions = transformer.create_fact_table(transactions_df, dim_client, dim_time)
+
+    # The client dimension keeps the distributor that recommended each client, so the
+    # recommended clients without transactions still count for their distributor
+    return {
+        'dim_client': dim_client,
+        'dim_distributor': dim_distributor,
+        'dim_time': dim_time,
+        'fact_transactions': fact_transactions
+    }
+
+def stream_facts(client_keys):
+    """Streams the transactions in chunks, appending their fact rows to the fact CSV.
+
+    Returns the time dimension built from the dates seen along the way.
+    """
+    unique_dates = []
+
+    def fact_chunks():
+        for chunk in loader.iter_transactions_chunks(CLIENTS_EXCEL_FILE, FACT_CHUNK_SIZE):
+            unique_dates.append(pd.Series(pd.to_datetime(chunk['FECHA']).unique()))
+            yield transformer.create_fact_chunk(chunk, client_keys)
+
+    writer.save_chunks_to_csv(fact_chunks(), FACT_TRANSACTIONS_FILE)
+    all_dates = pd.concat(unique_dates, ignore_index=True) if unique_dates else pd.Series(dtype='datetime64[ns]')
+    return transformer.create_time_dimension(all_dates)
+
+def load(tables):
+    """Load stage: writes the star schema to the processed data directory."""
+    if 'fact_transactions' not in tables:
+        tables['dim_time'] = stream_facts(tables['dim_client_keys'])
+
+    writer.save_to_csv(tables['dim_client'], DIM_CLIENT_FILE)
+    writer.save_to_csv(tables['dim_distributor'], DIM_DISTRIBUTOR_FILE)
+    writer.save_to_csv(tables['dim_time'], DIM_TIME_FILE)
+    if 'fact_transactions' in tables:
+        writer.save_to_csv(tables['fact_transactions'], FACT_TRANSACTIONS_FILE)
+    return {}
+
+def publish(run_id):
+    """Publish stage: rebuilds the derived outputs and publishes the tables as the current snapshot."""
+    rollingmetrics.update_rolling_metrics(full=True)
+    bitmapindex.build_index_file()
+    snapshot.publish(run_id)
+    return {}
+
+def main(resume=False, run_id=None, chunked=None, workers=FACT_BUILD_WORKERS):
+    """Main ETL pipeline function.
+
+    Returns True when the run completed, False when it halted on missing input
+    data; a failing stage raises.
+    """
+    print("--- Starting ETL Process ---")
+
+    if resume and run_id is None:
+        run_id = checkpoint.find_resumable_run()
+        if run_id is None:
+            print("No failed run to resume. Starting a new run.")
+    if run_id is None:
+        run_id = checkpoint.new_run_id()
+    completed = checkpoint.load_state(run_id)['completed_stages'] if resume else []
+    print(f"Run ID: {run_id}")
+
+    outputs = None
+    try:
+        for position, stage in enumerate(STAGES):
+            if stage in completed:
+                # Only the last completed stage feeds the next one
+                next_stage = STAGES[position + 1] if position + 1 < len(STAGES) else None
+                if next_stage is not None and next_stage not in completed:
+                    outputs = checkpoint.load_stage(run_id, stage)
+                continue
 
-    # --- LOAD ---
-    writer.save_to_csv(dim_client_final, DIM_CLIENT_FILE)
-    writer.save_to_csv(dim_distributor, DIM_DISTRIBUTOR_FILE)
-    writer.save_to_csv(dim_time, DIM_TIME_FILE)
-    writer.save_to_csv(fact_transactions, FACT_TRANSACTIONS_FILE)
+            print(f"--- Stage: {stage} ---")
+            if stage == 'extract':
+                outputs = extract(chunked)
+                if outputs is None:
+                    checkpoint.mark_run(run_id, 'failed', error="missing input data")
+                    return False
+            elif stage == 'transform':
+                outputs = transform(outputs, workers)
+            elif stage == 'load':
+                outputs = load(outputs)
+            else:
+                outputs = publish(run_id)
+            checkpoint.save_stage(run_id, stage, outputs)
+    except Exception as e:
+        checkpoint.mark_run(run_id, 'failed', error=e)
+        print(f"ETL process failed at stage '{stage}'. Rerun with --resume to continue from it.")
+        raise
 
+    checkpoint.mark_run(run_id, 'completed')
+    checkpoint.cleanup_checkpoints(keep_run_id=run_id)
     print("--- ETL Process Completed Successfully ---")
+    return True
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Runs the ETL pipeline.")
+    parser.add_argument('--resume', action='store_true',
+                        help="Resume the latest failed run from its first incomplete stage.")
+    parser.add_argument('--run-id', default=None,
+                        help="Run ID to use (or to resume, together with --resume).")
+    parser.add_argument('--chunked', action='store_true', default=None,
+                        help="Force the out-of-core mode regardless of the memory budget.")
+    parser.add_argument('--workers', type=int, default=FACT_BUILD_WORKERS,
+                        help="Processes for the fact build (1 disables the parallel mode).")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep running and reprocess whenever a raw file changes.")
+    args = parser.parse_args()
+    if args.watch:
+        import watcher
+        watcher.watch()
+        raise SystemExit
+    completed = main(resume=args.resume, run_id=args.run_id, chunked=args.chunked, workers=args.workers)
+    raise SystemExit(0 if completed else 1)
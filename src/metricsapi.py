@@ -0,0 +1,333 @@
+# src/metricsapi.py
+#--------------------------------------------------------------------------------
+# This script is a local, read-only HTTP service for the distributor metrics.
+# It loads the processed star schema once, pre-aggregates it per distributor,
+# per distributor and month, and per distributor and client, and serves JSON:
+#
+#   GET /snapshot                          version of the data being served
+#   GET /distributors                      summary of every distributor
+#   GET /distributors/<id>                 summary of one distributor
+#   GET /distributors/<id>/monthly         monthly series (?from=YYYY-MM&to=YYYY-MM)
+#   GET /distributors/<id>/clients         clients (?recommended=true&category=Oro&limit=&offset=)
+#
+# Rendered responses are kept in an LRU cache and carry an ETag (a hash of the
+# body), so a client sending If-None-Match gets a bodyless 304 when nothing
+# changed. A background thread watches the published snapshot (snapshot.py);
+# a new one is loaded and aggregated aside and then swapped in at once, so the
+# requests never see a mix of two snapshots.
+# Run it with:  python src/metricsapi.py [--host H] [--port P]
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import pandas as pd
+
+from config import API_HOST, API_PORT, API_CACHE_ENTRIES, API_SNAPSHOT_POLL_SECONDS, API_MAX_PAGE_SIZE
+import reportdata
+import snapshot
+
+# Routes: path pattern and the MetricsSnapshot method that answers it
+ROUTES = [
+    (re.compile(r'^/snapshot/?$'), 'info'),
+    (re.compile(r'^/distributors/?$'), 'distributor_list'),
+    (re.compile(r'^/distributors/(\d+)/?$'), 'distributor'),
+    (re.compile(r'^/distributors/(\d+)/monthly/?$'), 'monthly'),
+    (re.compile(r'^/distributors/(\d+)/clients/?$'), 'clients'),
+]
+
+
+class NotFound(Exception):
+    """The requested resource does not exist in the snapshot."""
+
+
+# Function to turn a DataFrame into JSON-ready records
+def _records(df):
+    """Returns the rows as dicts of plain Python values; amounts are rounded to cents."""
+    return json.loads(df.to_json(orient='records', double_precision=2))
+
+# Function to parse a YYYY-MM query parameter
+def _year_month(value):
+    """Returns YYYY-MM as the integer YYYYMM."""
+    match = re.fullmatch(r'(\d{4})-(\d{1,2})', value)
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"'{value}' is not a YYYY-MM month.")
+    return int(match.group(1)) * 100 + int(match.group(2))
+
+
+class MetricsSnapshot:
+    """The per-distributor aggregates of one published snapshot."""
+
+    def __init__(self, record):
+        self.version = record['version']
+        self.published = record.get('published')
+        started = time.perf_counter()
+        tables = {name: pd.read_csv(file_path, **options) for name, (file_path, options) in reportdata.TABLES.items()}
+        tables['dim_client'] = reportdata.with_client_distributor(tables['dim_client'], tables['fact_transactions'])
+        facts = tables['fact_transactions'].dropna(subset=['IDDISTRIBUIDOR'])
+        facts = facts.astype({'IDDISTRIBUIDOR': 'int64'})
+        facts = facts.merge(tables['dim_time'][['IDTiempo', 'FechaCompleta', 'Año', 'Mes']], on='IDTiempo', how='left')
+        facts = facts.merge(tables['dim_client'].drop(columns='IDDISTRIBUIDOR', errors='ignore'), on='IDCLIENTE', how='left')
+        self.num_facts = len(facts)
+
+        # One row per distributor
+        totals = facts.groupby('IDDISTRIBUIDOR').agg(
+            TotalAmount=('MontoPrestamo', 'sum'),
+            Transactions=('CantidadTransacciones', 'sum'),
+            Clients=('IDCLIENTE', 'nunique'),
+            FirstDate=('FechaCompleta', 'min'),
+            LastDate=('FechaCompleta', 'max')
+        )
+        distributors = tables['dim_distributor'].set_index('IDDISTRIBUIDOR').join(totals, how='left')
+        # Recommended clients of the distributor that recommended them, with or
+        # without transactions, as in the distributor report (reportdata.recommended_clients)
+        dim_client = tables['dim_client']
+        recommended = dim_client[dim_client['EsRecomendado']].dropna(subset=['IDDISTRIBUIDOR'])
+        recommended = recommended.astype({'IDDISTRIBUIDOR': 'int64'})
+        distributors['RecommendedClients'] = recommended.groupby('IDDISTRIBUIDOR')['IDCLIENTE'].nunique()
+        distributors[['TotalAmount', 'Transactions', 'Clients', 'RecommendedClients']] = distributors[
+            ['TotalAmount', 'Transactions', 'Clients', 'RecommendedClients']
+        ].fillna(0)
+        for column in ('FirstDate', 'LastDate'):
+            distributors[column] = distributors[column].dt.strftime('%Y-%m-%d')
+        self.distributors = distributors.astype({'Transactions': 'int64', 'Clients': 'int64', 'RecommendedClients': 'int64'})
+
+        # One row per distributor and month
+        monthly = facts.groupby(['IDDISTRIBUIDOR', 'Año', 'Mes']).agg(
+            Amount=('MontoPrestamo', 'sum'),
+            Transactions=('CantidadTransacciones', 'sum'),
+            Clients=('IDCLIENTE', 'nunique')
+        ).reset_index()
+        monthly['YearMonth'] = monthly['Año'].astype('int64') * 100 + monthly['Mes']
+        self.monthly_rows = monthly.set_index('IDDISTRIBUIDOR').sort_values(['IDDISTRIBUIDOR', 'YearMonth'])
+
+        # One row per distributor and client, largest amount first
+        clients = facts.groupby(['IDDISTRIBUIDOR', 'IDCLIENTE']).agg(
+            CategoriaCliente=('CategoriaCliente', 'first'),
+            EsRecomendado=('EsRecomendado', 'first'),
+            Amount=('MontoPrestamo', 'sum'),
+            Transactions=('CantidadTransacciones', 'sum'),
+            LastDate=('FechaCompleta', 'max')
+        ).reset_index()
+        clients['CategoriaCliente'] = clients['CategoriaCliente'].astype('string')
+        clients['LastDate'] = clients['LastDate'].dt.strftime('%Y-%m-%d')
+        self.client_rows = clients.sort_values(['IDDISTRIBUIDOR', 'Amount'], ascending=[True, False]).set_index('IDDISTRIBUIDOR')
+        print(f"Snapshot {self.version} loaded in {time.perf_counter() - started:.2f}s "
+              f"({self.num_facts:,} facts, {len(self.distributors)} distributors).")
+
+    def _distributor_rows(self, frame, distributor_id):
+        if distributor_id not in self.distributors.index:
+            raise NotFound(f"Distributor {distributor_id} not found.")
+        if distributor_id not in frame.index:
+            return frame.iloc[:0]
+        return frame.loc[[distributor_id]]
+
+    def info(self, query):
+        return {'version': self.version, 'published': self.published,
+                'facts': self.num_facts, 'distributors': len(self.distributors)}
+
+    def distributor_list(self, query):
+        return _records(self.distributors.reset_index())
+
+    def distributor(self, query, distributor_id):
+        rows = self._distributor_rows(self.distributors, int(distributor_id))
+        return _records(rows.reset_index())[0]
+
+    def monthly(self, query, distributor_id):
+        rows = self._distributor_rows(self.monthly_rows, int(distributor_id))
+        if 'from' in query:
+            rows = rows[rows['YearMonth'] >= _year_month(query['from'])]
+        if 'to' in query:
+            rows = rows[rows['YearMonth'] <= _year_month(query['to'])]
+        series = rows.rename(columns={'Año': 'Year', 'Mes': 'Month'})
+        return _records(series[['Year', 'Month', 'Amount', 'Transactions', 'Clients']])
+
+    def clients(self, query, distributor_id):
+        rows = self._distributor_rows(self.client_rows, int(distributor_id))
+        if 'recommended' in query:
+            if query['recommended'].lower() not in ('true', 'false'):
+                raise ValueError("recommended must be true or false.")
+            rows = rows[rows['EsRecomendado'] == (query['recommended'].lower() == 'true')]
+        if 'category' in query:
+            rows = rows[rows['CategoriaCliente'] == query['category']]
+        limit = min(int(query.get('limit', API_MAX_PAGE_SIZE)), API_MAX_PAGE_SIZE)
+        offset = int(query.get('offset', 0))
+        if limit < 0 or offset < 0:
+            raise ValueError("limit and offset must not be negative.")
+        return {'total': len(rows), 'offset': offset, 'limit': limit,
+                'clients': _records(rows.iloc[offset:offset + limit].reset_index(drop=True))}
+
+
+class ResponseCache:
+    """A thread-safe LRU cache of rendered responses."""
+
+    def __init__(self, max_entries=API_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class MetricsAPI:
+    """Answers the API requests from the current snapshot through the response cache."""
+
+    def __init__(self, cache_entries=API_CACHE_ENTRIES):
+        self.snapshot = MetricsSnapshot(snapshot.current())
+        self.cache = ResponseCache(cache_entries)
+
+    def refresh(self):
+        """Loads and swaps in the published snapshot when it is newer; returns True when swapped."""
+        record = snapshot.current()
+        if record['version'] == self.snapshot.version:
+            return False
+        print(f"New snapshot {record['version']} published. Loading it...")
+        new_snapshot = MetricsSnapshot(record)
+        # One reference assignment: a request uses either the old or the new snapshot
+        self.snapshot = new_snapshot
+        self.cache.clear()
+        return True
+
+    def watch_snapshots(self, poll_seconds=API_SNAPSHOT_POLL_SECONDS):
+        """Checks for a new snapshot every poll_seconds, forever."""
+        while True:
+            time.sleep(poll_seconds)
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the current snapshot, e.g. while the ETL is still writing
+                print(f"WARNING: Could not load the new snapshot ({e}). Retrying later.")
+
+    def respond(self, path, query):
+        """Returns (status, body bytes, ETag, snapshot version) for a GET request.
+
+        The version is the one of the snapshot that answered, which may already
+        have been replaced by the time the response is written.
+        """
+        current = self.snapshot
+        key = (current.version, path, tuple(sorted(query.items())))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        for pattern, method in ROUTES:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            return 404, json.dumps({'error': f"Unknown path {path}"}).encode('utf-8'), None, current.version
+        try:
+            payload = getattr(current, method)(query, *match.groups())
+        except NotFound as e:
+            return 404, json.dumps({'error': str(e)}).encode('utf-8'), None, current.version
+        except ValueError as e:
+            return 400, json.dumps({'error': str(e)}).encode('utf-8'), None, current.version
+        except Exception as e:
+            print(f"ERROR answering {path}: {e}")
+            return 500, json.dumps({'error': 'Internal error'}).encode('utf-8'), None, current.version
+
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        etag = '"' + hashlib.sha256(body).hexdigest()[:24] + '"'
+        response = (200, body, etag, current.version)
+        self.cache.put(key, response)
+        return response
+
+
+# Function to check an If-None-Match header against an ETag
+def _etag_matches(header, etag):
+    if not header or not etag:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves the JSON endpoints over keep-alive HTTP/1.1 connections."""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MetricsAPI/1.0'
+    # Buffer each response and send it at once: small separate writes (headers, then body)
+    # would stall on Nagle's algorithm and delayed ACKs over keep-alive connections
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        api = self.server.api
+        status, body, etag, version = api.respond(url.path, query)
+
+        if status == 200 and _etag_matches(self.headers.get('If-None-Match'), etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Snapshot-Version', version)
+        if etag:
+            self.send_header('ETag', etag)
+            # Clients may keep the response but must revalidate it with If-None-Match
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Logging every request would cost more than answering it from the cache
+        pass
+
+# Function to run the service
+def serve(host=API_HOST, port=API_PORT):
+    """Serves the API until interrupted, swapping in new snapshots as they are published."""
+    api = MetricsAPI()
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    server.api = api
+    threading.Thread(target=api.watch_snapshots, name="snapshot-watcher", daemon=True).start()
+    print(f"Metrics API listening on http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nMetrics API stopped.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves the distributor metrics as JSON over HTTP.")
+    parser.add_argument('--host', default=API_HOST, help="Address to listen on.")
+    parser.add_argument('--port', type=int, default=API_PORT, help="Port to listen on.")
+    args = parser.parse_args()
+    serve(args.host, args.port)
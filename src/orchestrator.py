@@ -1,116 +1,249 @@
 # src/orchestrator.py
 #----------------------------------------------------------------------------------
 # This script orchestrates the generation of reports, sends them via email, and cleans up afterwards.
-# It runs specified Python scripts, collects their output files, sends them as email attachments,
-# and finally deletes the files from the reports directory.
+# It runs the registered report plugins over the shared report data layer, either concurrently in
+# a bounded pool of worker processes (default) or one after another in this process (--sequential),
+# collects their output files, queues them as email attachments in the durable outbox (outbox.py)
+# as soon as the required reports are done (the optional reports follow in one more email once they
+# all finished; nothing is sent when a required report fails), and moves the queued files from the reports
+# directory into the report archive (reportarchive.py), from which --resend sends them again.
+# With --fanout it also writes one workbook per distributor into the distributor reports
+# folder and queues an email with each distributor's own workbook. Attachments are
+# streamed into compressed archives and split across several emails when they exceed the
+# configured message size (attachments.py). Finally the outbox is delivered once over pooled SMTP
+# sessions (mailer.py); messages that could not be sent are retried by the next run or by
+# `python src/outbox.py --forever` (--no-deliver only queues them).
 #
 # author: ekastel
 # date: 2025-06-27
 #--------------------------------------------------------------------------------
 
+import argparse
+import asyncio
+import hashlib
+import json
 import os
-import smtplib
-import subprocess
-import sys
-from email.mime.application import MIMEApplication
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from pathlib import Path
+import pandas as pd
 from dotenv import load_dotenv
 
+from config import (
+    REPORTS_OUTPUT_DIR, REPORT_CACHE_ENABLED, DISTRIBUTOR_REPORTS_DIR, FANOUT_WORKERS,
+    DISTRIBUTOR_CONTACTS_FILE, MAIL_PACKAGE_DIR, MAIL_RATE_PER_MINUTE
+)
+import attachments
+import mailer
+import outbox
+import reportarchive
+import reportcache
+import reportdata
+import reportregistry
+import reportrunner
+
 # Load environment variables from .env file
 load_dotenv()
 
 # Paths
-BASE_DIR = Path(__file__).resolve().parent
-REPORTS_DIR = BASE_DIR.parent / "reports" / "mail"
-
-# Scripts to run in order
-# Make sure these scripts exist in the src/ folder
-SCRIPTS_TO_RUN = [
-    "generate_excel_report.py",
-    "create_visual_en.py"
-]
+REPORTS_DIR = REPORTS_OUTPUT_DIR
 
 # Email configuration loaded from .env file
 SMTP_SERVER = os.getenv('SMTP_SERVER')
 SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
 SENDER_EMAIL = os.getenv('SENDER_EMAIL')
 SENDER_PASSWORD = os.getenv('SENDER_PASSWORD')
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').strip().lower() not in ('0', 'false', 'no')
 RECIPIENTS = [email.strip() for email in os.getenv('RECIPIENTS', '').split(',')]
 
+# Names of the fan-out workbooks: Distributor_Report_<IDDISTRIBUIDOR>_<name>.xlsx
+DISTRIBUTOR_FILE_PATTERN = re.compile(r'^Distributor_Report_(\d+)_')
 
-def run_report_scripts():
-    """Executes all Python scripts that generate reports."""
-    print("--- 1. Running scripts to generate reports ---")
-    for script_name in SCRIPTS_TO_RUN:
-        script_path = BASE_DIR / script_name
-        if not script_path.exists():
-            print(f"WARNING: Script '{script_name}' not found. Skipping.")
-            continue
-        try:
-            print(f"Executing '{script_name}'...")
-            # Use sys.executable to ensure the same Python interpreter is used
-            subprocess.run([sys.executable, script_path], check=True, capture_output=True, text=True)
-            print(f"'{script_name}' executed successfully.")
-        except subprocess.CalledProcessError as e:
-            print(f"ERROR executing '{script_name}': {e.stderr}")
-            # Decide whether to stop or continue if a script fails
-            # return False
-    print("--- All report scripts have been executed. ---")
-    return True
-
-def send_email_with_attachments():
-    """Finds reports, attaches them, and sends an email."""
-    print("\n--- 2. Preparing and sending email ---")
-    
-    report_files = list(REPORTS_DIR.glob('*'))
-    if not report_files:
-        print("No reports found to send. Aborting email process.")
-        return False
 
-    msg = MIMEMultipart()
-    msg['From'] = SENDER_EMAIL
-    msg['To'] = ", ".join(RECIPIENTS)
-    msg['Subject'] = f"Automated Reports - {pd.Timestamp.now().strftime('%Y-%m-%d')}"
+def run_reports():
+    """Runs every registered report plugin in this process and reports their timings.
 
-    # Email body
-    body = "Good morning,\n\nPlease find the automatically generated reports attached.\n\nRegards."
-    msg.attach(MIMEText(body, 'plain'))
+    Returns the output files of the reports that completed, or False when none
+    is registered or a required report failed.
+    """
+    print("--- 1. Generating reports ---")
+    reports = reportregistry.load_report_plugins()
+    if not reports:
+        print("WARNING: No report plugins registered.")
+        return False
 
-    # Attach files
-    for file_path in report_files:
+    results = []
+    for name, report in reports.items():
+        print(f"Running report '{name}'...")
+        started = time.perf_counter()
         try:
-            with open(file_path, "rb") as f:
-                part = MIMEApplication(f.read(), Name=file_path.name)
-            part['Content-Disposition'] = f'attachment; filename="{file_path.name}"'
-            msg.attach(part)
-            print(f"Attached: {file_path.name}")
+            if REPORT_CACHE_ENABLED:
+                output_paths = reportcache.run_cached(name, reportdata, REPORTS_DIR)
+            else:
+                output_paths = report(reportdata, REPORTS_DIR)
+            status = 'ok'
         except Exception as e:
-            print(f"Could not attach file {file_path.name}. Error: {e}")
+            print(f"ERROR running report '{name}': {e}")
+            output_paths, status = [], 'failed'
+        results.append((name, status, time.perf_counter() - started, output_paths))
+
+    print("\nReport timings:")
+    for name, status, seconds, output_paths in results:
+        print(f"  {name:<40} {status:<7} {seconds:8.2f}s  {len(output_paths)} file(s)")
+    print("--- All reports have been generated. ---")
+    failed_required = [name for name, status, _, _ in results
+                       if status != 'ok' and reportregistry.REPORT_OPTIONS[name]['required']]
+    if failed_required:
+        print(f"Required report(s) failed: {', '.join(failed_required)}. The email is not sent.")
+        return False
+    return [path for _, _, _, output_paths in results for path in output_paths]
+
+# Function to open the SMTP session
+def create_mailer(rate_per_minute=MAIL_RATE_PER_MINUTE):
+    """Returns a Mailer configured from the .env settings."""
+    return mailer.Mailer(SMTP_SERVER, SMTP_PORT, SENDER_EMAIL, SENDER_PASSWORD, starttls=SMTP_STARTTLS,
+                         rate_per_minute=rate_per_minute)
 
-    # Send email
+# Function to build the emails of a set of attachments
+def build_messages(recipients, subject, body, attachment_paths, package_name):
+    """Packages the files into size-bounded archives and returns (messages, packaged files).
+
+    Each archive part becomes one message, built lazily as the messages are
+    iterated; when there are several, the subject says which part it is and
+    every message carries the manifest. The Message-ID of a part is derived from
+    its recipients, subject and file contents, so the outbox sends it only once.
+    """
+    packaged_files = [file_path for file_path in attachment_paths if file_path.is_file()]
+    for file_path in set(attachment_paths) - set(packaged_files):
+        print(f"Could not attach {file_path.name}: not a file.")
+    if not packaged_files:
+        return [], []
+
+    package_dir = MAIL_PACKAGE_DIR / package_name
+    attachments.remove_package(package_dir)
+    manifest = attachments.package_files(packaged_files, package_dir, name=package_name)
+    content_key = json.dumps([recipients, subject, [file['sha256'] for file in manifest['files']]])
+    domain = (SENDER_EMAIL or 'localhost').rpartition('@')[2]
+
+    def new_message(part_number, num_parts):
+        msg = MIMEMultipart()
+        msg['From'] = SENDER_EMAIL
+        msg['To'] = ", ".join(recipients)
+        msg['Subject'] = subject if num_parts == 1 else f"{subject} (part {part_number}/{num_parts})"
+        digest = hashlib.sha256(f"{content_key}/{part_number}".encode('utf-8')).hexdigest()[:32]
+        msg['Message-ID'] = f"<{package_name}.{digest}@{domain}>"
+        msg.attach(MIMEText(body, 'plain'))
+        return msg
+
+    print(f"Packaged {len(packaged_files)} file(s) into {len(manifest['parts'])} message(s).")
+    return attachments.build_part_messages(manifest, package_dir, new_message), packaged_files
+
+# Function to spool the messages of a package
+def _queue_messages(messages, package_name):
+    """Spools the messages in the outbox; returns False when one could not be written."""
     try:
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()  # Secure connection
-        server.login(SENDER_EMAIL, SENDER_PASSWORD)
-        server.send_message(msg)
-        server.quit()
-        print(f"Email sent successfully to: {', '.join(RECIPIENTS)}")
+        for msg in messages:
+            outbox.enqueue(msg, msg['Message-ID'])
         return True
-    except Exception as e:
-        print(f"ERROR sending email: {e}")
+    except OSError as e:
+        print(f"ERROR writing to the outbox: {e}")
+        return False
+    finally:
+        attachments.remove_package(MAIL_PACKAGE_DIR / package_name)
+
+def queue_email_with_attachments(report_files, label=None):
+    """Attaches the given report files and queues the email in the outbox.
+
+    label marks a follow-up email of the same day, e.g. 'Additional' for the
+    optional reports. Returns the list of attached files once the email is
+    safely spooled, or False.
+    """
+    print("\n--- 2. Preparing and queueing email ---")
+
+    # Reports may share a file, e.g. the plotly.js bundle of their pages
+    report_files = sorted({Path(file_path) for file_path in report_files})
+    if not report_files:
+        print("No reports found to send. Aborting email process.")
+        return False
+
+    # Email body
+    body = "Good morning,\n\nPlease find the automatically generated reports attached.\n\nRegards."
+    subject = f"Automated Reports - {pd.Timestamp.now().strftime('%Y-%m-%d')}"
+    package_name = f"Reports_{pd.Timestamp.now().strftime('%Y%m%d')}"
+    if label:
+        subject = f"{subject} - {label}"
+        package_name = f"{package_name}_{label}"
+    messages, attached_files = build_messages(RECIPIENTS, subject, body, report_files, package_name)
+
+    if not _queue_messages(messages, package_name):
         return False
+    print(f"Email queued for: {', '.join(RECIPIENTS)}")
+    return attached_files
+
+# Function to load the email addresses of the distributors
+def load_distributor_contacts():
+    """Returns {IDDISTRIBUIDOR: [emails]} from DISTRIBUTOR_CONTACTS_FILE, or {} when it is missing."""
+    if not DISTRIBUTOR_CONTACTS_FILE.exists():
+        print(f"WARNING: {DISTRIBUTOR_CONTACTS_FILE} not found. No distributor reports will be sent.")
+        return {}
+    contacts = pd.read_csv(DISTRIBUTOR_CONTACTS_FILE, dtype={'IDDISTRIBUIDOR': 'int64', 'Email': 'string'})
+    contacts = contacts.dropna(subset=['Email'])
+    return contacts.groupby('IDDISTRIBUIDOR')['Email'].agg(lambda emails: [e.strip() for e in emails]).to_dict()
+
+# Function to queue each distributor its own reports
+def queue_distributor_bundles(report_paths):
+    """Queues an email with its fan-out workbook for every distributor with a contact.
+
+    Returns the list of files that were spooled.
+    """
+    print("\n--- 5. Queueing the per-distributor reports ---")
+    contacts = load_distributor_contacts()
+    bundles = {}
+    for file_path in report_paths:
+        match = DISTRIBUTOR_FILE_PATTERN.match(file_path.name)
+        if match:
+            bundles.setdefault(int(match.group(1)), []).append(file_path)
+
+    date = pd.Timestamp.now().strftime('%Y-%m-%d')
+    body = "Good morning,\n\nPlease find attached your recommended clients report.\n\nRegards."
+    queued_files = []
+    for distributor_id, attachment_paths in sorted(bundles.items()):
+        if distributor_id not in contacts:
+            print(f"No contact for distributor {distributor_id}. Skipping.")
+            continue
+        package_name = f"Distributor_{distributor_id}"
+        messages, packaged_files = build_messages(
+            contacts[distributor_id], f"Distributor Report - {date}", body, attachment_paths, package_name
+        )
+        if _queue_messages(messages, package_name):
+            queued_files += packaged_files
+
+    print(f"Distributor reports queued: {len(queued_files)} file(s).")
+    return queued_files
+
+# Function to deliver the queued emails
+def deliver_outbox():
+    """Attempts the due messages of the outbox once; failures stay spooled for a later retry."""
+    print("\n--- 6. Delivering the outbox ---")
+    return asyncio.run(outbox.deliver_due(create_mailer))
+
+def cleanup_reports(report_files=None):
+    """Archives the given files (all files by default) and deletes them from the reports folder.
 
-def cleanup_reports():
-    """Deletes all files from the reports folder."""
+    A file that could not be archived is kept.
+    """
     print("\n--- 3. Cleaning up the reports folder ---")
-    report_files = list(REPORTS_DIR.glob('*'))
+    if report_files is None:
+        report_files = list(REPORTS_DIR.glob('*'))
     if not report_files:
         print("No reports to clean up.")
         return
-        
-    for file_path in report_files:
+
+    for file_path in reportarchive.archive_files(report_files):
         try:
             os.remove(file_path)
             print(f"Deleted: {file_path.name}")
@@ -118,19 +251,132 @@ def cleanup_reports():
             print(f"ERROR deleting file {file_path.name}: {e}")
     print("--- Cleanup complete. ---")
 
-def main():
+# Function to send archived reports again
+def queue_archived_reports(report_date, name=None, recipients=None):
+    """Restores the reports archived on report_date (optionally filtered by file name) and queues them.
+
+    Returns the number of files queued.
+    """
+    rows = reportarchive.lookup(report_date=report_date, name=name)
+    if not rows:
+        print(f"No archived reports found for {report_date}.")
+        return 0
+    recipients = recipients or RECIPIENTS
+    package_name = f"Resend_{report_date:%Y%m%d}"
+    restore_dir = MAIL_PACKAGE_DIR / f"{package_name}_files"
+    try:
+        report_paths = reportarchive.restore(rows, restore_dir)
+        # The send time is part of the subject, so an explicit resend is not deduplicated by the outbox
+        subject = f"Automated Reports - {report_date:%Y-%m-%d} (resent {pd.Timestamp.now():%Y-%m-%d %H:%M})"
+        body = f"Hello,\n\nPlease find attached the reports of {report_date:%Y-%m-%d} again.\n\nRegards."
+        messages, packaged_files = build_messages(recipients, subject, body, report_paths, package_name)
+        if not _queue_messages(messages, package_name):
+            return 0
+    finally:
+        attachments.remove_package(restore_dir)
+    print(f"{len(packaged_files)} archived report(s) of {report_date} queued for: {', '.join(recipients)}")
+    return len(packaged_files)
+
+def run_reports_and_send(workers=None):
+    """Runs the reports in parallel and queues their emails as they become ready.
+
+    The outputs of the required reports are queued together as soon as all of
+    them completed, in a background thread while the optional reports are still
+    rendering; those of the optional reports that completed follow in a single
+    email once every report finished. Nothing is queued when a required report
+    failed or timed out. Returns the list of files that were queued.
+    """
+    print("--- 1. Generating reports in parallel ---")
+    required_email = None
+    required_ok = False
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="email") as email_pool:
+        def on_required_done(required_results):
+            nonlocal required_email, required_ok
+            failed = sorted(name for name, (status, _, _, _) in required_results.items() if status != 'ok')
+            if failed:
+                print(f"Required report(s) did not complete ({', '.join(failed)}). The email is not sent.")
+                return
+            required_ok = True
+            if not required_results:
+                return
+            print(f"Required reports done ({', '.join(sorted(required_results))}). Starting the email step...")
+            output_paths = [path for _, _, paths, _ in required_results.values() for path in paths]
+            required_email = email_pool.submit(queue_email_with_attachments, output_paths)
+
+        results = reportrunner.run_reports_parallel(
+            REPORTS_DIR, workers=workers or reportrunner.REPORT_WORKERS, on_required_done=on_required_done
+        )
+        reportrunner.print_summary(results)
+
+    sent_files = []
+    if required_email is not None:
+        try:
+            sent_files += required_email.result() or []
+        except Exception as e:
+            print(f"ERROR queueing the email: {e}")
+    if not required_ok:
+        return sent_files
+
+    optional_paths = [path for name, status, _, output_paths, _ in results
+                      if status == 'ok' and not reportregistry.REPORT_OPTIONS[name]['required']
+                      for path in output_paths]
+    if optional_paths:
+        try:
+            sent_files += queue_email_with_attachments(optional_paths, 'Additional') or []
+        except Exception as e:
+            print(f"ERROR queueing the email: {e}")
+    return sent_files
+
+def main(sequential=False, workers=None, fanout=False, deliver=True):
     """Main function to orchestrate the entire process."""
     print(">>> Starting Report Orchestrator <<<")
     
     # Ensure the reports directory exists
     REPORTS_DIR.mkdir(parents=True, exist_ok=True)
     
-    if run_report_scripts():
-        if send_email_with_attachments():
-            cleanup_reports()
+    if sequential:
+        report_files = run_reports()
+        if report_files:
+            sent_files = queue_email_with_attachments(report_files)
+            if sent_files:
+                cleanup_reports(sent_files)
+    else:
+        sent_files = run_reports_and_send(workers)
+        if sent_files:
+            cleanup_reports(sent_files)
+
+    if fanout:
+        print("\n--- 4. Writing the per-distributor reports ---")
+        reportregistry.load_report_plugins()
+        import reportsumarydistributor
+        report_paths = reportsumarydistributor.fan_out_reports(reportdata, DISTRIBUTOR_REPORTS_DIR, workers=FANOUT_WORKERS)
+        sent_files = queue_distributor_bundles(report_paths)
+        if sent_files:
+            cleanup_reports(sent_files)
+
+    if deliver:
+        deliver_outbox()
             
     print("\n>>> Orchestrator process finished. <<<")
 
 if __name__ == '__main__':
-    import pandas as pd
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generates the reports and emails them.")
+    parser.add_argument('--sequential', action='store_true',
+                        help="Run the reports one after another in this process.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of reports rendered at the same time.")
+    parser.add_argument('--fanout', action='store_true',
+                        help="Also write one workbook per distributor and email it to the distributor.")
+    parser.add_argument('--no-deliver', action='store_true',
+                        help="Only queue the emails; leave the delivery to `python src/outbox.py`.")
+    parser.add_argument('--resend', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                        help="Send the reports archived on that date again instead of generating them.")
+    parser.add_argument('--resend-name', help="With --resend, only the archived files matching this name (* allowed).")
+    args = parser.parse_args()
+    if args.resend:
+        queue_archived_reports(args.resend, args.resend_name)
+        if not args.no_deliver:
+            deliver_outbox()
+    else:
+        main(sequential=args.sequential, workers=args.workers, fanout=args.fanout, deliver=not args.no_deliver)
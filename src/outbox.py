@@ -0,0 +1,264 @@
+# src/outbox.py
+#--------------------------------------------------------------------------------
+# This module is a durable outbox for the report emails.
+# Messages are spooled to OUTBOX_DIR/spool as .eml files and every change of
+# their state (queued, retry, sent, failed) is appended to a journal, so the
+# report pipeline only has to enqueue them and can finish without the network.
+# An asyncio worker delivers the due messages over a bounded number of SMTP
+# sessions (mailer.py, run in threads), retries failures with exponential
+# backoff, and skips any message ID the journal already records as queued or
+# sent, which makes enqueueing and delivery idempotent per message ID.
+# Several processes may share the outbox (the orchestrator, the scheduler and
+# `outbox.py --forever`): a delivery lock lets only one of them deliver at a
+# time, so no message is sent twice, and a journal lock serializes the appends
+# with the compaction that rewrites the journal, so no record is lost. Both are
+# flock locks, released by the OS if their process dies. The worker does its
+# file and lock I/O in threads, so waiting for the journal lock or an fsync never
+# stalls the other SMTP sessions.
+# Run it on its own with:  python src/outbox.py [--forever]
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import email
+import email.policy
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+
+from config import (
+    OUTBOX_DIR, OUTBOX_CONNECTIONS, OUTBOX_MAX_ATTEMPTS, OUTBOX_BACKOFF_SECONDS,
+    OUTBOX_MAX_BACKOFF_SECONDS, MAIL_RATE_PER_MINUTE
+)
+
+SPOOL_DIR = OUTBOX_DIR / "spool"
+JOURNAL_FILE = OUTBOX_DIR / "journal.jsonl"
+JOURNAL_LOCK_FILE = OUTBOX_DIR / "journal.lock"
+DELIVERY_LOCK_FILE = OUTBOX_DIR / "delivery.lock"
+PENDING_STATES = ('queued', 'retry')
+
+# Function to make a message ID safe as a file name
+def _spool_path(message_id):
+    return SPOOL_DIR / (re.sub(r'[^0-9A-Za-z._-]+', '_', message_id.strip('<>')) + ".eml")
+
+# Context manager holding an exclusive lock on a lock file
+@contextmanager
+def _locked(lock_path, blocking=True):
+    """Holds an flock on lock_path while the block runs.
+
+    Yields True once the lock is held, or False right away when blocking is off
+    and another process holds it. Without fcntl (Windows) nothing is locked, so
+    the outbox must then be used by one process at a time.
+    """
+    OUTBOX_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        import fcntl
+    except ImportError:
+        yield True
+        return
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
+
+# Function to append a record to the journal
+def _append_record(record):
+    """Appends one record and flushes it to disk; the caller holds the journal lock."""
+    with open(JOURNAL_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+# Function to append a state change to the journal
+def _journal(message_id, state, **fields):
+    """Appends one record to the journal under the journal lock."""
+    with _locked(JOURNAL_LOCK_FILE):
+        _append_record({'id': message_id, 'state': state, 'time': time.time(), **fields})
+
+# Function to replay the journal
+def load_state():
+    """Returns {message ID: latest journal record}; a torn last line is ignored."""
+    state = {}
+    if not JOURNAL_FILE.exists():
+        return state
+    with open(JOURNAL_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            state[record['id']] = {**state.get(record['id'], {}), **record}
+    return state
+
+# Function to rewrite the journal with one record per message
+def compact_journal():
+    """Keeps only the latest record of every message.
+
+    The journal lock is held from the read to the replace, so a record appended
+    meanwhile by another process cannot be lost.
+    """
+    with _locked(JOURNAL_LOCK_FILE):
+        state = load_state()
+        if not state:
+            return
+        tmp_path = JOURNAL_FILE.with_name(JOURNAL_FILE.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in state.values():
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path.replace(JOURNAL_FILE)
+
+# Function to spool a message
+def enqueue(message, message_id):
+    """Spools a message for delivery under message_id; returns False when it is already known.
+
+    The message ID becomes the Message-ID header, so a message delivered twice
+    (e.g. after a crash right before its 'sent' record) can be deduplicated.
+    The check and the 'queued' record are made under the journal lock, so two
+    processes cannot both queue the same message.
+    """
+    del message['Message-ID']
+    message['Message-ID'] = message_id
+    data = message.as_bytes(policy=email.policy.SMTP)
+
+    with _locked(JOURNAL_LOCK_FILE):
+        state = load_state().get(message_id)
+        if state is not None and state['state'] in PENDING_STATES + ('sent',):
+            print(f"Message {message_id} is already {state['state']}. Skipping.")
+            return False
+
+        SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+        spool_path = _spool_path(message_id)
+        tmp_path = spool_path.with_name(spool_path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path.replace(spool_path)
+        _append_record({'id': message_id, 'state': 'queued', 'time': time.time(), 'attempts': 0,
+                        'next_attempt': time.time(), 'to': message['To'], 'subject': message['Subject']})
+    return True
+
+# Function to list the messages due for delivery
+def due_messages(now=None):
+    """Returns the journal records of the pending messages whose next attempt is due."""
+    now = time.time() if now is None else now
+    return [
+        record for record in load_state().values()
+        if record['state'] in PENDING_STATES and record.get('next_attempt', 0) <= now
+    ]
+
+# Function to compute the next retry delay
+def backoff_delay(attempts):
+    """Returns OUTBOX_BACKOFF_SECONDS * 2^(attempts - 1), capped at OUTBOX_MAX_BACKOFF_SECONDS."""
+    return min(OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), OUTBOX_MAX_BACKOFF_SECONDS)
+
+# Function to send a spooled message
+def _send_spooled(session, message_id):
+    """Reads the spooled message and sends it over the session (blocking)."""
+    with open(_spool_path(message_id), 'rb') as f:
+        message = email.message_from_binary_file(f, policy=email.policy.SMTP)
+    session.send(message)
+
+# Function to record a delivered message
+def _mark_sent(message_id, attempts):
+    """Journals the message as sent and removes it from the spool (blocking)."""
+    _journal(message_id, 'sent', attempts=attempts)
+    _spool_path(message_id).unlink(missing_ok=True)
+
+# Coroutine of one delivery connection
+async def _delivery_worker(queue, create_mailer, results, rate_per_minute):
+    session = create_mailer(rate_per_minute)
+    try:
+        while True:
+            try:
+                record = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            message_id = record['id']
+            attempts = record.get('attempts', 0) + 1
+            try:
+                await asyncio.to_thread(_send_spooled, session, message_id)
+            except Exception as e:
+                if attempts >= OUTBOX_MAX_ATTEMPTS:
+                    await asyncio.to_thread(_journal, message_id, 'failed', attempts=attempts, error=str(e))
+                    print(f"Message {message_id} failed after {attempts} attempts: {e}")
+                    results['failed'] += 1
+                else:
+                    delay = backoff_delay(attempts)
+                    await asyncio.to_thread(_journal, message_id, 'retry', attempts=attempts,
+                                            next_attempt=time.time() + delay, error=str(e))
+                    print(f"Message {message_id} not delivered ({e}). Retrying in {delay:.0f}s.")
+                    results['retry'] += 1
+                continue
+            await asyncio.to_thread(_mark_sent, message_id, attempts)
+            results['sent'] += 1
+    finally:
+        await asyncio.to_thread(session.close)
+
+# Coroutine to deliver the due messages once
+async def deliver_due(create_mailer, connections=OUTBOX_CONNECTIONS, rate_per_minute=MAIL_RATE_PER_MINUTE):
+    """Attempts every due message once over at most `connections` SMTP sessions.
+
+    create_mailer(rate_per_minute) must return a Mailer; the rate limit is shared
+    among the sessions. Returns {'sent', 'retry', 'failed'} counts. Nothing is
+    sent while another process holds the delivery lock.
+    """
+    results = {'sent': 0, 'retry': 0, 'failed': 0}
+    with _locked(DELIVERY_LOCK_FILE, blocking=False) as acquired:
+        if not acquired:
+            print("Another process is delivering the outbox. Leaving the due messages to it.")
+            return results
+        due = await asyncio.to_thread(due_messages)
+        if not due:
+            return results
+        queue = asyncio.Queue()
+        for record in due:
+            queue.put_nowait(record)
+        connections = max(1, min(connections, len(due)))
+        session_rate = rate_per_minute / connections if rate_per_minute else 0
+        print(f"Delivering {len(due)} message(s) over {connections} connection(s)...")
+        await asyncio.gather(*(
+            _delivery_worker(queue, create_mailer, results, session_rate) for _ in range(connections)
+        ))
+        await asyncio.to_thread(compact_journal)
+    print(f"Outbox: {results['sent']} sent, {results['retry']} to retry, {results['failed']} failed.")
+    return results
+
+# Coroutine to keep delivering until the outbox is empty
+async def deliver_forever(create_mailer, connections=OUTBOX_CONNECTIONS, poll_seconds=OUTBOX_BACKOFF_SECONDS):
+    """Delivers the due messages, then sleeps until the next one is due, forever."""
+    while True:
+        await deliver_due(create_mailer, connections)
+        state = await asyncio.to_thread(load_state)
+        pending = [record for record in state.values() if record['state'] in PENDING_STATES]
+        next_attempt = min((record.get('next_attempt', 0) for record in pending), default=time.time() + poll_seconds)
+        await asyncio.sleep(max(1.0, min(next_attempt - time.time(), poll_seconds)))
+
+
+if __name__ == "__main__":
+    import orchestrator
+
+    parser = argparse.ArgumentParser(description="Delivers the spooled report emails.")
+    parser.add_argument('--forever', action='store_true',
+                        help="Keep running and deliver new and retried messages as they become due.")
+    parser.add_argument('--connections', type=int, default=OUTBOX_CONNECTIONS,
+                        help="SMTP sessions used at the same time.")
+    args = parser.parse_args()
+    if args.forever:
+        asyncio.run(deliver_forever(orchestrator.create_mailer, args.connections))
+    else:
+        asyncio.run(deliver_due(orchestrator.create_mailer, args.connections))
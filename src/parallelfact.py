@@ -0,0 +1,83 @@
+# src/parallelfact.py
+#--------------------------------------------------------------------------------
+# This module builds the transactions fact table on several CPU cores.
+# The transactions are hash-partitioned by IDCLIENTE, so every client lands in a
+# single partition, and each partition is built in a process pool with the same
+# create_fact_table used by the single-core pipeline.
+# The client and time dimension columns are published once through the shared
+# memory store and attached by the workers, instead of being pickled for every
+# partition.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+import transformer
+from sharedstore import SharedFrameStore
+
+# Dimension columns needed by the workers
+CLIENT_COLUMNS = ['IDCLIENTE', 'IDDISTRIBUIDOR']
+TIME_COLUMNS = ['FechaCompleta', 'IDTiempo']
+
+# Function executed by the workers
+def _build_partition(task):
+    """Builds the fact rows of one partition against the shared dimensions."""
+    partition_id, transactions_df, client_descriptor, time_descriptor, output_dir = task
+    with client_descriptor.open() as client_dim, time_descriptor.open() as time_dim:
+        fact_df = transformer.create_fact_table(transactions_df, client_dim.frame, time_dim.frame)
+
+    if output_dir is None:
+        return fact_df
+    file_path = output_dir / f"part-{partition_id:05d}.csv"
+    fact_df.to_csv(file_path, index=False)
+    return len(fact_df)
+
+# Function to hash-partition the transactions
+def partition_transactions(transactions_df, num_partitions):
+    """Splits the transactions into partitions by a hash of IDCLIENTE."""
+    hashes = pd.util.hash_pandas_object(transactions_df['IDCLIENTE'], index=False).to_numpy()
+    partition_ids = hashes % np.uint64(num_partitions)
+    order = np.argsort(partition_ids, kind='stable')
+    bounds = np.searchsorted(partition_ids[order], np.arange(num_partitions + 1, dtype=np.uint64))
+    return [
+        transactions_df.iloc[order[bounds[i]:bounds[i + 1]]]
+        for i in range(num_partitions)
+    ]
+
+# Function to build the fact table in parallel
+def create_fact_table_parallel(transactions_df, client_dim_df, time_dim_df, workers=None, output_dir=None):
+    """Creates the fact table on several processes.
+
+    Returns the concatenated fact table, or, when output_dir is given, writes one
+    CSV per partition into it and returns the total number of fact rows.
+    """
+    workers = workers or os.cpu_count() or 1
+    print(f"Creating Transactions Fact Table on {workers} processes...")
+
+    client_keys = client_dim_df[CLIENT_COLUMNS]
+    time_keys = time_dim_df[TIME_COLUMNS].copy()
+    time_keys['FechaCompleta'] = pd.to_datetime(time_keys['FechaCompleta'])
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    with SharedFrameStore() as store:
+        client_descriptor = store.publish('dim_client', client_keys)
+        time_descriptor = store.publish('dim_time', time_keys)
+        tasks = [
+            (partition_id, partition, client_descriptor, time_descriptor, output_dir)
+            for partition_id, partition in enumerate(partition_transactions(transactions_df, workers))
+            if not partition.empty
+        ]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_build_partition, tasks))
+
+    if output_dir is not None:
+        return sum(results)
+    if not results:
+        return transformer.create_fact_table(transactions_df, client_dim_df, time_dim_df)
+    return pd.concat(results, ignore_index=True)
@@ -0,0 +1,80 @@
+# src/plotlyexport.py
+#--------------------------------------------------------------------------------
+# This module exports Plotly figures to files instead of opening a browser.
+# Figures are written as HTML pages and, when the kaleido renderer is installed,
+# as static images. By default every page embeds plotly.js, so the mailed and
+# archived files render offline. In 'shared' mode the pages reference a single
+# plotly.js bundle written next to them, named after its plotly.js version, and
+# the bundle is one of the outputs, so it is mailed and archived with them.
+# 'cdn' mode loads plotly.js from its CDN, which needs network access to render.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+from pathlib import Path
+
+import plotly.offline
+
+from config import CHART_FORMATS, PLOTLY_JS_MODE
+
+PLOTLY_BUNDLE_PATTERN = "plotly-{version}.min.js"
+STATIC_FORMATS = {'png', 'svg', 'pdf'}
+
+# Function to check whether static images can be rendered
+def static_export_available():
+    """Returns True when the kaleido renderer needed by write_image is installed."""
+    try:
+        import kaleido  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+# Function to write the shared plotly.js bundle
+def _write_bundle(bundle_dir):
+    """Writes the installed plotly.js version into bundle_dir once and returns its path."""
+    bundle_path = Path(bundle_dir) / PLOTLY_BUNDLE_PATTERN.format(version=plotly.offline.get_plotlyjs_version())
+    if not bundle_path.exists():
+        bundle_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = bundle_path.with_name(bundle_path.name + ".tmp")
+        tmp_path.write_text(plotly.offline.get_plotlyjs(), encoding='utf-8')
+        tmp_path.replace(bundle_path)
+    return bundle_path
+
+# Function to export a batch of figures
+def export_figures(figures, output_dir, js_mode=PLOTLY_JS_MODE, formats=CHART_FORMATS):
+    """Writes every figure of the dict {name: figure} into output_dir.
+
+    Returns the paths written: one HTML page per figure, the static images
+    when kaleido is available and, in 'shared' mode, the plotly.js bundle.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_paths = []
+
+    if js_mode == 'shared':
+        # The pages load the bundle from their own folder, so it travels with them
+        bundle_path = _write_bundle(output_dir)
+        include_plotlyjs = bundle_path.name
+        output_paths.append(bundle_path)
+    elif js_mode == 'cdn':
+        include_plotlyjs = 'cdn'
+    else:
+        include_plotlyjs = True
+
+    static_formats = [file_format for file_format in formats if file_format in STATIC_FORMATS]
+    if static_formats and not static_export_available():
+        print("Static image export skipped: the 'kaleido' package is not installed.")
+        static_formats = []
+
+    for name, fig in figures.items():
+        html_path = output_dir / f"{name}.html"
+        fig.write_html(html_path, include_plotlyjs=include_plotlyjs, full_html=True)
+        output_paths.append(html_path)
+        for file_format in static_formats:
+            image_path = output_dir / f"{name}.{file_format}"
+            fig.write_image(image_path)
+            output_paths.append(image_path)
+
+    print(f"Exported {len(figures)} Plotly figure(s) into {output_dir}.")
+    return output_paths
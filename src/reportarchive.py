@@ -0,0 +1,193 @@
+# src/reportarchive.py
+#--------------------------------------------------------------------------------
+# This module archives the report files once they have been sent.
+# Every file is stored once, gzip-compressed, under the SHA-256 of its content
+# (objects/ab/abcdef....gz), so a report that did not change between two runs
+# takes no extra space. A sqlite index records which file was archived on which
+# report date; the date is the partition key, so listing a day (or a range of
+# days) and a file name is an indexed lookup, and the retention policy drops
+# whole days before deleting the objects no longer referenced by any day.
+# Run it on its own with:  python src/reportarchive.py --list [--date D] [--name N]
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import argparse
+import gzip
+import hashlib
+import shutil
+import sqlite3
+import time
+from contextlib import closing
+from datetime import date, timedelta
+from pathlib import Path
+
+from config import (
+    REPORT_ARCHIVE_DIR, REPORT_ARCHIVE_INDEX, REPORT_ARCHIVE_RETENTION_DAYS, REPORT_ARCHIVE_COMPRESSION_LEVEL
+)
+
+OBJECTS_DIR = REPORT_ARCHIVE_DIR / "objects"
+COPY_BLOCK_BYTES = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report_date TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    archived_at REAL NOT NULL,
+    PRIMARY KEY (report_date, file_name)
+);
+CREATE INDEX IF NOT EXISTS reports_by_name ON reports (file_name, report_date);
+CREATE INDEX IF NOT EXISTS reports_by_object ON reports (sha256);
+"""
+
+# Function to open the index
+def _connect():
+    REPORT_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(REPORT_ARCHIVE_INDEX, timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+# Function to locate an object
+def object_path(sha256):
+    return OBJECTS_DIR / sha256[:2] / f"{sha256}.gz"
+
+# Function to hash a file
+def _sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BLOCK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to store a file as an object
+def _store_object(file_path, sha256):
+    """Compresses the file into its object unless an identical one is already stored.
+
+    Returns True when a new object was written.
+    """
+    path = object_path(sha256)
+    if path.exists():
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(file_path, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=REPORT_ARCHIVE_COMPRESSION_LEVEL) as dst:
+        shutil.copyfileobj(src, dst, COPY_BLOCK_BYTES)
+    tmp_path.replace(path)
+    return True
+
+# Function to archive report files
+def archive_files(file_paths, report_date=None):
+    """Archives the files under report_date (today by default); returns the archived paths.
+
+    A file archived again on the same date replaces the previous version in the index.
+    """
+    report_date = (report_date or date.today()).isoformat()
+    archived, new_objects = [], 0
+    with closing(_connect()) as connection, connection:
+        for file_path in file_paths:
+            file_path = Path(file_path)
+            if not file_path.is_file():
+                continue
+            try:
+                sha256 = _sha256(file_path)
+                new_objects += _store_object(file_path, sha256)
+            except OSError as e:
+                print(f"ERROR archiving {file_path.name}: {e}")
+                continue
+            connection.execute(
+                "INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?)",
+                (report_date, file_path.name, sha256, file_path.stat().st_size, time.time())
+            )
+            archived.append(file_path)
+    print(f"Archived {len(archived)} file(s) for {report_date} ({new_objects} new, "
+          f"{len(archived) - new_objects} already stored).")
+    return archived
+
+# Function to look up archived reports
+def lookup(report_date=None, date_from=None, date_to=None, name=None):
+    """Returns the index rows (dicts) matching a date or date range and a file name.
+
+    name may contain * wildcards (e.g. 'Monthly_Loan_Performance_*').
+    """
+    conditions, values = [], []
+    if report_date is not None:
+        conditions.append("report_date = ?")
+        values.append(report_date.isoformat())
+    if date_from is not None:
+        conditions.append("report_date >= ?")
+        values.append(date_from.isoformat())
+    if date_to is not None:
+        conditions.append("report_date <= ?")
+        values.append(date_to.isoformat())
+    if name is not None:
+        conditions.append("file_name GLOB ?" if '*' in name else "file_name = ?")
+        values.append(name)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with closing(_connect()) as connection:
+        rows = connection.execute(
+            f"SELECT * FROM reports {where} ORDER BY report_date DESC, file_name", values
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+# Function to read an archived file
+def read_object(sha256):
+    """Returns the decompressed content of an object."""
+    with gzip.open(object_path(sha256), 'rb') as f:
+        return f.read()
+
+# Function to restore archived files
+def restore(rows, output_dir):
+    """Decompresses the files of the given index rows into output_dir; returns their paths."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_paths = []
+    for row in rows:
+        output_path = output_dir / row['file_name']
+        with gzip.open(object_path(row['sha256']), 'rb') as src, open(output_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, COPY_BLOCK_BYTES)
+        output_paths.append(output_path)
+    return output_paths
+
+# Function to apply the retention policy
+def apply_retention(retention_days=REPORT_ARCHIVE_RETENTION_DAYS):
+    """Drops the report dates older than retention_days and deletes the unreferenced objects."""
+    if not REPORT_ARCHIVE_INDEX.exists():
+        return
+    cutoff = (date.today() - timedelta(days=retention_days)).isoformat()
+    with closing(_connect()) as connection, connection:
+        dropped = connection.execute("DELETE FROM reports WHERE report_date < ?", (cutoff,)).rowcount
+        referenced = {row[0] for row in connection.execute("SELECT DISTINCT sha256 FROM reports")}
+
+    deleted = 0
+    for path in OBJECTS_DIR.glob("*/*.gz"):
+        if path.name[:-len(".gz")] not in referenced:
+            path.unlink(missing_ok=True)
+            deleted += 1
+    if dropped or deleted:
+        print(f"Archive retention: {dropped} entry(ies) before {cutoff} dropped, {deleted} object(s) deleted.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lists, restores and prunes the archived reports.")
+    parser.add_argument('--list', action='store_true', help="List the archived reports.")
+    parser.add_argument('--restore', type=Path, metavar='DIR', help="Restore the matching reports into DIR.")
+    parser.add_argument('--date', type=date.fromisoformat, help="Report date (YYYY-MM-DD).")
+    parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help="First report date.")
+    parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help="Last report date.")
+    parser.add_argument('--name', help="File name, * wildcards allowed.")
+    parser.add_argument('--prune', action='store_true', help="Apply the retention policy.")
+    args = parser.parse_args()
+
+    rows = lookup(args.date, args.date_from, args.date_to, args.name)
+    if args.list:
+        for row in rows:
+            print(f"{row['report_date']}  {row['sha256'][:12]}  {row['size']:>12,}  {row['file_name']}")
+    if args.restore:
+        paths = restore(rows, args.restore)
+        print(f"Restored {len(paths)} file(s) into {args.restore}.")
+    if args.prune:
+        apply_retention()
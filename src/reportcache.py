@@ -0,0 +1,170 @@
+# src/reportcache.py
+#--------------------------------------------------------------------------------
+# This module caches the files rendered by the report plugins.
+# Each report declares the processed tables and the parameters it depends on
+# (see register_report). Its cache key is a fingerprint of the content of those
+# tables, those parameters and the source files of the report and of the project
+# modules it uses, directly or through other modules (reportdata.py,
+# plotlyexport.py, cohorts.py, ...). When the key is
+# already in the cache directory, the stored files are copied to the output
+# folder instead of rendering the report again. The least recently used entries
+# are evicted once the cache grows beyond REPORT_CACHE_MAX_MB.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import hashlib
+import inspect
+import json
+import shutil
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from config import BASE_DIR, REPORT_CACHE_DIR, REPORT_CACHE_MAX_MB
+import reportdata
+import reportregistry
+
+MANIFEST_FILENAME = "manifest.json"
+
+# Function to hash the content of a file
+@lru_cache(maxsize=None)
+def _file_digest(file_path, size, mtime_ns):
+    """Returns the SHA-256 of a file; size and mtime make the memoization safe."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_digest(file_path):
+    """Returns the SHA-256 of a file, or 'missing' when it does not exist."""
+    file_path = Path(file_path)
+    if not file_path.exists():
+        return 'missing'
+    stat = file_path.stat()
+    return _file_digest(str(file_path), stat.st_size, stat.st_mtime_ns)
+
+# Function to find the project source files a module depends on
+def source_files(module):
+    """Returns the source files of module and of the project modules it imports, transitively.
+
+    A module counts as imported when it, or a function or class taken from it,
+    is a global of the importing module.
+    """
+    project_dir = str(BASE_DIR)
+    found, pending = {}, [module]
+    while pending:
+        module = pending.pop()
+        source = getattr(module, '__file__', None)
+        if source is None or not source.startswith(project_dir) or source in found:
+            continue
+        found[source] = module
+        for value in vars(module).values():
+            if inspect.ismodule(value):
+                pending.append(value)
+            elif inspect.isfunction(value) or inspect.isclass(value):
+                pending.append(sys.modules.get(value.__module__))
+    return sorted(found)
+
+# Function to compute the cache key of a report
+def fingerprint(name):
+    """Returns the fingerprint of the inputs a report declares."""
+    options = reportregistry.REPORT_OPTIONS[name]
+    tables = options['depends_on'] or sorted(reportdata.TABLES)
+    report_module = inspect.getmodule(reportregistry.REPORTS[name])
+    inputs = {
+        'tables': {table: file_digest(reportdata.TABLES[table][0]) for table in tables},
+        'params': options['params'] or {},
+        'sources': {Path(source).relative_to(BASE_DIR).as_posix(): file_digest(source)
+                    for source in source_files(report_module)}
+    }
+    encoded = json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+# Function to get the size of a directory
+def _dir_size(directory):
+    return sum(path.stat().st_size for path in directory.rglob('*') if path.is_file())
+
+# Function to evict old entries
+def evict(max_bytes=REPORT_CACHE_MAX_MB * 1024 ** 2):
+    """Deletes the least recently used entries until the cache fits in max_bytes."""
+    if not REPORT_CACHE_DIR.exists():
+        return
+    entries = []
+    for manifest_path in REPORT_CACHE_DIR.glob(f"*/*/{MANIFEST_FILENAME}"):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                last_used = json.load(f)['last_used']
+            entries.append((last_used, manifest_path.parent, _dir_size(manifest_path.parent)))
+        except (OSError, ValueError, KeyError):
+            continue
+
+    total = sum(size for _, _, size in entries)
+    for _, entry_dir, size in sorted(entries, key=lambda entry: entry[0]):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total -= size
+        print(f"Evicted cached report {entry_dir.parent.name}/{entry_dir.name}.")
+
+# Function to restore a cached entry
+def _restore(entry_dir, output_dir):
+    """Copies the files of a cache entry to output_dir and returns their paths."""
+    manifest_path = entry_dir / MANIFEST_FILENAME
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    output_paths = []
+    for filename in manifest['files']:
+        shutil.copy2(entry_dir / filename, output_dir / filename)
+        output_paths.append(output_dir / filename)
+
+    manifest['last_used'] = time.time()
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return output_paths
+
+# Function to store the files of a report
+def _store(name, key, output_paths):
+    """Copies the rendered files into a new cache entry."""
+    entry_dir = REPORT_CACHE_DIR / name / key
+    tmp_dir = entry_dir.with_name(key + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    for path in output_paths:
+        shutil.copy2(path, tmp_dir / Path(path).name)
+    with open(tmp_dir / MANIFEST_FILENAME, 'w', encoding='utf-8') as f:
+        json.dump({
+            'report': name,
+            'files': [Path(path).name for path in output_paths],
+            'created': time.time(),
+            'last_used': time.time()
+        }, f, indent=2)
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    tmp_dir.rename(entry_dir)
+
+# Function to run a report through the cache
+def run_cached(name, data, output_dir):
+    """Returns the files of a report, from the cache when its inputs did not change."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    key = fingerprint(name)
+    entry_dir = REPORT_CACHE_DIR / name / key
+
+    if (entry_dir / MANIFEST_FILENAME).exists():
+        try:
+            output_paths = _restore(entry_dir, output_dir)
+            print(f"Report '{name}' restored from cache ({key[:12]}).")
+            return output_paths
+        except (OSError, ValueError, KeyError) as e:
+            print(f"WARNING: Cache entry of '{name}' is unusable ({e}). Rendering again.")
+
+    output_paths = reportregistry.REPORTS[name](data, output_dir)
+    try:
+        _store(name, key, output_paths)
+        evict()
+    except OSError as e:
+        print(f"WARNING: Could not cache report '{name}': {e}")
+    return output_paths
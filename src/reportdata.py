@@ -0,0 +1,131 @@
+# src/reportdata.py
+#--------------------------------------------------------------------------------
+# This module is the shared data layer of the report scripts.
+# It loads each processed star-schema table once, with explicit dtypes, and
+# memoizes the joined views the reports are built from, so generating the full
+# report set costs one load and one join chain instead of one per report.
+# The OLAP cube over the joined facts (cube.py) is built on first use, and
+# filters on low-cardinality attributes go through the fact bitmap indexes.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+from functools import lru_cache
+
+import pandas as pd
+
+import bitmapindex
+import cube as olap
+from config import DIM_CLIENT_FILE, DIM_DISTRIBUTOR_FILE, DIM_TIME_FILE, FACT_TRANSACTIONS_FILE
+
+# Processed tables and the options used to read them
+TABLES = {
+    'dim_client': (DIM_CLIENT_FILE, {
+        'dtype': {'IDCLIENTE': 'int64', 'IDDISTRIBUIDOR': 'Int64', 'CategoriaCliente': 'category',
+                  'EsRecomendado': 'bool'}
+    }),
+    'dim_distributor': (DIM_DISTRIBUTOR_FILE, {
+        'dtype': {'IDDISTRIBUIDOR': 'int64', 'Telefono': 'string'}
+    }),
+    'dim_time': (DIM_TIME_FILE, {
+        'dtype': {'IDTiempo': 'int64', 'Año': 'int16', 'Mes': 'int8', 'Dia': 'int8'},
+        'parse_dates': ['FechaCompleta']
+    }),
+    'fact_transactions': (FACT_TRANSACTIONS_FILE, {
+        'dtype': {'IDTiempo': 'int64', 'IDCLIENTE': 'int64', 'IDDISTRIBUIDOR': 'Int64',
+                  'MontoPrestamo': 'float64', 'CantidadTransacciones': 'int32'}
+    }),
+}
+
+# Function to load a processed table
+@lru_cache(maxsize=None)
+def load_table(name):
+    """Loads a processed table once; later calls return the same DataFrame.
+
+    Callers must treat the result as read-only.
+    """
+    file_path, read_options = TABLES[name]
+    print(f"Loading {name} from {file_path}...")
+    table = pd.read_csv(file_path, **read_options)
+    if name == 'dim_client':
+        table = with_client_distributor(table, load_table('fact_transactions'))
+    return table
+
+# Function to add the distributor key to a client dimension that lacks it
+def with_client_distributor(dim_client, fact_transactions):
+    """Returns dim_client with the IDDISTRIBUIDOR of every client.
+
+    A dim_client.csv written before the client dimension carried the
+    distributor key lacks the column; the distributor of each client is then
+    taken from its facts, and clients without transactions get none.
+    """
+    if 'IDDISTRIBUIDOR' in dim_client.columns:
+        return dim_client
+    facts = fact_transactions.dropna(subset=['IDDISTRIBUIDOR']).drop_duplicates('IDCLIENTE')
+    distributors = facts.set_index('IDCLIENTE')['IDDISTRIBUIDOR']
+    dim_client = dim_client.copy()
+    dim_client.insert(1, 'IDDISTRIBUIDOR', dim_client['IDCLIENTE'].map(distributors).astype('Int64'))
+    return dim_client
+
+# Function to build the fully joined fact view
+@lru_cache(maxsize=None)
+def facts_full():
+    """Returns fact ⨝ client ⨝ distributor ⨝ time, joined once.
+
+    Every fact references existing dimension rows, so left joins keep exactly
+    the rows of the inner join chains the reports used to do on their own.
+    The distributor key of the facts is the one of their client, so the client
+    side of that join only brings the client attributes.
+    """
+    print("Joining the star schema...")
+    facts = pd.merge(load_table('fact_transactions'), load_table('dim_time'),
+                     on='IDTiempo', how='left', validate='many_to_one')
+    facts = pd.merge(facts, load_table('dim_client').drop(columns='IDDISTRIBUIDOR', errors='ignore'),
+                     on='IDCLIENTE', how='left', validate='many_to_one')
+    facts = pd.merge(facts, load_table('dim_distributor'),
+                     on='IDDISTRIBUIDOR', how='left', validate='many_to_one')
+    return facts
+
+# Function to get the bitmap indexes of the fact rows
+@lru_cache(maxsize=None)
+def fact_index():
+    """Returns the bitmap indexes matching the loaded fact table."""
+    return bitmapindex.load_index(len(load_table('fact_transactions')))
+
+# Function to filter the joined facts through the bitmap indexes
+def filtered_facts(**where):
+    """Returns the fully joined facts matching every filter, e.g.
+    filtered_facts(recommended=True, category=['Oro', 'Platino']).
+
+    The joins keep the row order of the fact table, so the indexed row
+    positions apply to the joined view as well.
+    """
+    return facts_full().take(fact_index().rows(**where)).reset_index(drop=True)
+
+# Function to get the facts of recommended clients
+@lru_cache(maxsize=None)
+def recommended_facts():
+    """Returns the fully joined facts of recommended clients only."""
+    return filtered_facts(recommended=True)
+
+# Function to get the recommended clients with their distributor
+@lru_cache(maxsize=None)
+def recommended_clients():
+    """Returns the recommended clients with the distributor that recommended them,
+    whether or not they have transactions."""
+    dim_client = load_table('dim_client')
+    return dim_client[dim_client['EsRecomendado']].reset_index(drop=True)
+
+# Function to get the OLAP cube over the joined facts
+@lru_cache(maxsize=None)
+def cube():
+    """Returns the cube over the joined facts, with the configured cuboids materialized."""
+    print("Materializing the OLAP cube...")
+    return olap.Cube(facts_full())
+
+# Function to clear the memoized tables and views
+def clear_cache():
+    """Forgets every loaded table and view, e.g. after the ETL publishes new data."""
+    for cached in (load_table, facts_full, fact_index, recommended_facts, recommended_clients, cube):
+        cached.cache_clear()
@@ -0,0 +1,64 @@
+# src/reportregistry.py
+#--------------------------------------------------------------------------------
+# This module is the registry of report plugins.
+# A report is a function decorated with @register_report that receives the
+# shared report data layer (reportdata.py) and the output folder, and returns
+# the paths of the files it wrote. A report can declare its own timeout, whether
+# the email has to wait for it (required), and the tables and parameters its
+# output depends on, which key the report cache (reportcache.py).
+# The orchestrator imports the configured plugin files once and runs the
+# registered reports in the same process, so the imports and the star-schema
+# load are paid only once.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import importlib.util
+import sys
+
+from config import REPORT_PLUGIN_FILES, REQUIRED_REPORTS
+
+# Registered reports by name, in registration order, and their options
+REPORTS = {}
+REPORT_OPTIONS = {}
+
+# Decorator to register a report
+def register_report(name, timeout=None, required=None, depends_on=None, params=None):
+    """Registers the decorated function as the report called `name`.
+
+    timeout is in seconds (REPORT_TIMEOUT_SECONDS when None). Required reports
+    must finish before the email is sent; by default those listed in REQUIRED_REPORTS.
+    depends_on lists the processed tables the report reads (all when None), and
+    params is a dict of the settings that change its output.
+    """
+    def decorator(function):
+        REPORTS[name] = function
+        REPORT_OPTIONS[name] = {
+            'timeout': timeout,
+            'required': name in REQUIRED_REPORTS if required is None else required,
+            'depends_on': list(depends_on) if depends_on else None,
+            'params': params
+        }
+        return function
+    return decorator
+
+# Function to import the report plugins
+def load_report_plugins(plugin_files=REPORT_PLUGIN_FILES):
+    """Imports every plugin file so that its reports register themselves."""
+    for file_path in plugin_files:
+        module_name = file_path.stem
+        if module_name in sys.modules:
+            continue
+        if not file_path.exists():
+            print(f"WARNING: Report plugin '{file_path}' not found. Skipping.")
+            continue
+        spec = importlib.util.spec_from_file_location(module_name, file_path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except Exception as e:
+            del sys.modules[module_name]
+            print(f"ERROR loading report plugin '{file_path.name}': {e}")
+    return REPORTS
@@ -0,0 +1,182 @@
+# src/reportrunner.py
+#--------------------------------------------------------------------------------
+# This module runs the registered report plugins concurrently in a bounded pool
+# of worker processes.
+# Each report runs in its own process with its own timeout, after which it is
+# cancelled. Its stdout/stderr are captured in a log file and streamed to the
+# console with the report name as prefix. A callback fires as soon as every
+# required report has finished, so the email can go out while optional reports
+# are still rendering, and a summary of all the runs is returned at the end.
+# On platforms with fork, the star schema is loaded once before the workers
+# start, so every worker begins with the data already in memory. Reports whose
+# inputs did not change are restored from the report cache.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+from config import REPORT_WORKERS, REPORT_TIMEOUT_SECONDS, REPORT_LOG_DIR, REPORT_CACHE_ENABLED
+import reportcache
+import reportdata
+import reportregistry
+
+# Seconds between two checks of the running reports
+POLL_INTERVAL = 0.1
+
+
+# Function executed in the worker process
+def _run_report(name, output_dir, log_path, results):
+    """Runs one report with stdout/stderr redirected to its log file."""
+    with open(log_path, 'w', buffering=1, encoding='utf-8') as log_file:
+        # Redirect at the file descriptor level, so output from C extensions is captured too
+        os.dup2(log_file.fileno(), 1)
+        os.dup2(log_file.fileno(), 2)
+        sys.stdout = sys.stderr = log_file
+        try:
+            reportregistry.load_report_plugins()
+            if REPORT_CACHE_ENABLED:
+                output_paths = reportcache.run_cached(name, reportdata, output_dir)
+            else:
+                output_paths = reportregistry.REPORTS[name](reportdata, output_dir)
+            results.put((name, 'ok', [str(path) for path in output_paths], None))
+        except Exception as e:
+            traceback.print_exc()
+            results.put((name, 'failed', [], str(e)))
+
+
+class _RunningReport:
+    """Book-keeping of a report running in a worker process."""
+
+    def __init__(self, name, process, log_path, timeout):
+        self.name = name
+        self.process = process
+        self.log_path = log_path
+        self.log_offset = 0
+        self.started = time.perf_counter()
+        self.deadline = self.started + timeout
+
+    def stream_log(self):
+        """Prints the lines written to the log since the last call."""
+        if not self.log_path.exists():
+            return
+        with open(self.log_path, 'r', encoding='utf-8', errors='replace') as f:
+            f.seek(self.log_offset)
+            chunk = f.read()
+        # Keep an incomplete last line for the next call
+        complete = chunk[:chunk.rfind('\n') + 1]
+        self.log_offset += len(complete.encode('utf-8'))
+        for line in complete.splitlines():
+            print(f"[{self.name}] {line}")
+
+    def cancel(self):
+        """Terminates the worker, killing it if it does not stop in time."""
+        self.process.terminate()
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+# Function to get the multiprocessing context
+def _get_context():
+    """Prefers fork, so that workers inherit the already loaded data."""
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('spawn')
+
+# Function to run the reports in parallel
+def run_reports_parallel(output_dir, workers=REPORT_WORKERS, on_required_done=None):
+    """Runs every registered report in a bounded pool of processes.
+
+    Returns a list of (name, status, seconds, output_paths, error) tuples, where
+    status is 'ok', 'failed' or 'timeout'. on_required_done({name: (status,
+    seconds, output_paths, error)}) is called once every required report has
+    finished, whatever their status.
+    """
+    reports = reportregistry.load_report_plugins()
+    options = reportregistry.REPORT_OPTIONS
+    required = {name for name in reports if options[name]['required']}
+    context = _get_context()
+    REPORT_LOG_DIR.mkdir(parents=True, exist_ok=True)
+
+    if context.get_start_method() == 'fork':
+        print("Pre-loading the star schema for the report workers...")
+        try:
+            reportdata.facts_full()
+            reportdata.recommended_facts()
+            reportdata.recommended_clients()
+        except FileNotFoundError as e:
+            print(f"WARNING: Could not pre-load {e.filename}; reports will load it themselves.")
+
+    results_queue = context.Queue()
+    pending = list(reports)
+    running = {}
+    received = {}
+    finished = {}
+    required_notified = False
+
+    def collect_results():
+        while not results_queue.empty():
+            name, status, output_paths, error = results_queue.get()
+            received[name] = (status, output_paths, error)
+
+    while pending or running:
+        # Start reports while there are free workers
+        while pending and len(running) < workers:
+            name = pending.pop(0)
+            log_path = REPORT_LOG_DIR / f"{name}.log"
+            process = context.Process(target=_run_report, args=(name, output_dir, log_path, results_queue),
+                                      name=f"report-{name}", daemon=True)
+            process.start()
+            timeout = options[name]['timeout'] or REPORT_TIMEOUT_SECONDS
+            running[name] = _RunningReport(name, process, log_path, timeout)
+            print(f"Started report '{name}' (timeout {timeout}s).")
+
+        time.sleep(POLL_INTERVAL)
+        collect_results()
+
+        for name, run in list(running.items()):
+            run.stream_log()
+            elapsed = time.perf_counter() - run.started
+            if not run.process.is_alive():
+                run.process.join()
+                # The result may have been queued right before the process exited
+                collect_results()
+                status, output_paths, error = received.get(
+                    name, ('failed', [], f"worker exited with code {run.process.exitcode}")
+                )
+            elif time.perf_counter() > run.deadline:
+                run.cancel()
+                run.stream_log()
+                status, output_paths, error = 'timeout', [], f"cancelled after {elapsed:.0f}s"
+            else:
+                continue
+            finished[name] = (status, elapsed, output_paths, error)
+            print(f"Report '{name}' finished: {status} in {elapsed:.2f}s.")
+            del running[name]
+
+        if not required_notified and on_required_done is not None and required <= finished.keys():
+            required_notified = True
+            on_required_done({name: finished[name] for name in required})
+
+    return [(name,) + finished[name] for name in reports]
+
+# Function to print the summary of the runs
+def print_summary(results):
+    """Prints one line per report with its status, duration and files."""
+    print("\nReport summary:")
+    for name, status, seconds, output_paths, error in results:
+        line = f"  {name:<40} {status:<8} {seconds:8.2f}s  {len(output_paths)} file(s)"
+        if error:
+            line += f"  ({error})"
+        print(line)
+    failed = [name for name, status, _, _, _ in results if status != 'ok']
+    if failed:
+        print(f"  {len(failed)} report(s) did not complete: {', '.join(failed)}. "
+              f"See the logs in {REPORT_LOG_DIR}.")
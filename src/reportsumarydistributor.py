@@ -3,104 +3,103 @@
 # This script generates an Excel report summarizing the performance of distributors
 # based on recommended clients and their transactions.
 # It includes a detailed transaction report and a summary with a bar chart.
+# The workbook is streamed with a constant amount of memory (excelstream.py).
+# The joined data comes from the shared report data layer (reportdata.py), and the
+# report is registered as a plugin so the orchestrator can run it in-process.
+# The fan-out mode (--fanout) writes one workbook per distributor, with its monthly
+# summary, a chart and its transactions. The facts are sorted once and sliced at
+# the distributor boundaries, and the workbooks are rendered on a process pool.
 #
 # Author: ekastel
 # Date: 2025-06-27
 #-----------------------------------------------------------------------------------
 
-import pandas as pd
+import argparse
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import numpy as np
 
-print("Loading processed data...")
-BASE_DIR = Path(__file__).resolve().parent
-PROCESSED_DATA_DIR = BASE_DIR / "data" / "processed"
-
-try:
-    dim_client = pd.read_csv(PROCESSED_DATA_DIR / "dim_client.csv")
-    dim_distributor = pd.read_csv(PROCESSED_DATA_DIR / "dim_distributor.csv")
-    dim_time = pd.read_csv(PROCESSED_DATA_DIR / "dim_time.csv")
-    fact_transactions = pd.read_csv(PROCESSED_DATA_DIR / "fact_transactions.csv")
-except FileNotFoundError as e:
-    print(f"Error: File not found {e.filename}. Please run the ETL script first.")
-    exit()
-
-print("Preparing detailed transaction data for recommended clients...")
-
-# Filter for recommended clients only
-recommended_clients = dim_client[dim_client['EsRecomendado'] == True]
-
-# Merge all tables to create a comprehensive dataset
-report_data = pd.merge(fact_transactions, recommended_clients, on='IDCLIENTE')
-report_data = pd.merge(report_data, dim_distributor, on='IDDISTRIBUIDOR')
-report_data = pd.merge(report_data, dim_time, on='IDTiempo')
-
-# Select and rename columns for the final detailed report
-detailed_report = report_data[[
-    'NombreDistribuidor',
-    'IDCLIENTE',
-    'CategoriaCliente',
-    'FechaCompleta',
-    'MontoPrestamo'
-]].rename(columns={
+from config import EXCEL_MAX_ROWS, DISTRIBUTOR_REPORTS_DIR, FANOUT_WORKERS
+import excelstream
+import reportdata
+from reportregistry import register_report
+
+OUTPUT_FILENAME = 'Distributor_Recommendation_Report.xlsx'
+FANOUT_PREFIX = 'Distributor_Report'
+
+# Columns of the detailed transactions and their Excel names
+DETAIL_COLUMNS = {
     'NombreDistribuidor': 'Distributor Name',
     'IDCLIENTE': 'Client ID',
     'CategoriaCliente': 'Client Category',
     'FechaCompleta': 'Transaction Date',
     'MontoPrestamo': 'Loan Amount'
-})
+}
+
+# Function to prepare the report data
+def build_report_frames(data):
+    """Returns the detailed transactions and the summary by distributor."""
+    print("Preparing detailed transaction data for recommended clients...")
+    report_data = data.recommended_facts()
 
-print("Creating summary data by distributor...")
+    # Select and rename columns for the final detailed report
+    detailed_report = report_data[list(DETAIL_COLUMNS)].rename(columns=DETAIL_COLUMNS)
 
-summary_report = detailed_report.groupby('Distributor Name').agg(
-    TotalLoanAmount=('Loan Amount', 'sum'),
-    NumberOfTransactions=('Loan Amount', 'count'),
-    UniqueClients=('Client ID', 'nunique')
-).sort_values(by='TotalLoanAmount', ascending=False)
+    print("Creating summary data by distributor...")
 
-summary_report['AverageLoanAmount'] = summary_report['TotalLoanAmount'] / summary_report['NumberOfTransactions']
+    summary_report = detailed_report.groupby('Distributor Name').agg(
+        TotalLoanAmount=('Loan Amount', 'sum'),
+        NumberOfTransactions=('Loan Amount', 'count'),
+        UniqueClients=('Client ID', 'nunique')
+    ).sort_values(by='TotalLoanAmount', ascending=False)
 
+    summary_report['AverageLoanAmount'] = summary_report['TotalLoanAmount'] / summary_report['NumberOfTransactions']
+    return detailed_report, summary_report
 
-# Reset index to make 'Distributor Name' a column
-output_filename = 'Distributor_Recommendation_Report.xlsx'
-print(f"Writing data to Excel file: {output_filename}...")
+# Function to write the Excel report
+def write_excel_report(detailed_report, summary_report, output_path):
+    """Writes the summary (with a bar chart) and the detailed transactions to Excel.
 
-with pd.ExcelWriter(output_filename, engine='xlsxwriter') as writer:
-    # Write dataframes to different sheets
-    summary_report.to_excel(writer, sheet_name='Summary')
-    detailed_report.to_excel(writer, sheet_name='Detailed Transactions', index=False)
+    The workbook is streamed in constant-memory mode; the detailed transactions
+    continue on "Detailed Transactions (2)", "(3)"... past Excel's row limit.
+    """
+    print(f"Writing data to Excel file: {output_path}...")
 
-    # Get the xlsxwriter workbook and worksheet objects
-    workbook  = writer.book
-    summary_sheet = writer.sheets['Summary']
-    details_sheet = writer.sheets['Detailed Transactions']
+    workbook = excelstream.open_streaming_workbook(output_path)
 
     # Define formats
     currency_format = workbook.add_format({'num_format': '$#,##0.00'})
     integer_format = workbook.add_format({'num_format': '#,##0'})
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
     header_format = workbook.add_format({'bold': True, 'bg_color': '#DDEBF7', 'border': 1})
 
-    # Format headers
-    for col_num, value in enumerate(summary_report.columns.values):
-        summary_sheet.write(0, col_num + 1, value, header_format)
-    
-    # Format columns in Summary sheet
-    summary_sheet.set_column('A:A', 25) # Distributor Name
-    summary_sheet.set_column('B:B', 20, currency_format) # TotalLoanAmount
-    summary_sheet.set_column('C:C', 22, integer_format) # NumberOfTransactions
-    summary_sheet.set_column('D:D', 15, integer_format) # UniqueClients
-    summary_sheet.set_column('E:E', 22, currency_format) # AverageLoanAmount
+    # Summary sheet: the distributor name index becomes column A
+    excelstream.write_frame_streaming(workbook, 'Summary', summary_report.reset_index(), [
+        (25, None),             # Distributor Name
+        (20, currency_format),  # TotalLoanAmount
+        (22, integer_format),   # NumberOfTransactions
+        (15, integer_format),   # UniqueClients
+        (22, currency_format)   # AverageLoanAmount
+    ], header_format)
 
-    # Format columns in Details sheet
-    for col_num, value in enumerate(detailed_report.columns.values):
-        details_sheet.write(0, col_num, value, header_format)
-    details_sheet.set_column('A:A', 25) # Distributor Name
-    details_sheet.set_column('E:E', 15, currency_format) # Loan Amount
+    # Details sheet(s)
+    details_sheets = excelstream.write_frame_streaming(workbook, 'Detailed Transactions', detailed_report, [
+        (25, None),             # Distributor Name
+        (12, None),             # Client ID
+        (16, None),             # Client Category
+        (16, date_format),      # Transaction Date
+        (15, currency_format)   # Loan Amount
+    ], header_format)
+    if len(details_sheets) > 1:
+        print(f"Detailed transactions split across {len(details_sheets)} sheets.")
 
 
     # --- Create a Bar Chart ---
     chart = workbook.add_chart({'type': 'bar'})
-    
+
     # Configure the series. Note: The ranges are 1-based [sheet, row_start, col_start, row_end, col_end]
     num_distributors = len(summary_report)
     chart.add_series({
@@ -112,10 +111,182 @@ with pd.ExcelWriter(output_filename, engine='xlsxwriter') as writer:
     chart.set_title({'name': 'Total Loan Amount by Distributor'})
     chart.set_x_axis({'name': 'Distributor'})
     chart.set_y_axis({'name': 'Total Loan Amount ($)'})
-    chart.get_legend().set_position('none')
-    
+    chart.set_legend({'none': True})
+
     # Insert the chart into the worksheet.
-    summary_sheet.insert_chart('G3', chart)
+    workbook.get_worksheet_by_name('Summary').insert_chart('G3', chart)
+    workbook.close()
+
+# Function to split a frame sorted by a key at the key boundaries
+def _split_sorted(df, key):
+    """Returns {key value: slice of df}; df must be sorted by key."""
+    keys = df[key].to_numpy()
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.array([], dtype=int)
+    bounds = np.r_[starts, len(keys)]
+    return {keys[start]: df.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])}
+
+# Function to partition the report data by distributor
+def build_distributor_partitions(data):
+    """Returns a list of (distributor id, name, monthly summary, detailed transactions).
+
+    The facts are sorted once by distributor and date; the monthly summaries of
+    every distributor come from a single groupby, and both frames are sliced at
+    the distributor boundaries instead of being filtered once per distributor.
+    """
+    print("Partitioning recommended transactions by distributor...")
+    report_data = data.recommended_facts()
+    report_data = report_data[report_data['IDDISTRIBUIDOR'].notna()]
+    report_data = report_data[['IDDISTRIBUIDOR'] + list(DETAIL_COLUMNS)].sort_values(
+        ['IDDISTRIBUIDOR', 'FechaCompleta'], kind='stable', ignore_index=True
+    )
+    report_data['IDDISTRIBUIDOR'] = report_data['IDDISTRIBUIDOR'].astype('int64')
+
+    monthly = report_data.assign(Month=report_data['FechaCompleta'].dt.to_period('M')).groupby(
+        ['IDDISTRIBUIDOR', 'Month'], sort=True
+    ).agg(
+        TotalLoanAmount=('MontoPrestamo', 'sum'),
+        NumberOfTransactions=('MontoPrestamo', 'count'),
+        UniqueClients=('IDCLIENTE', 'nunique')
+    ).reset_index()
+    monthly['AverageLoanAmount'] = monthly['TotalLoanAmount'] / monthly['NumberOfTransactions']
+    monthly['Month'] = monthly['Month'].astype(str)
+
+    details = _split_sorted(report_data, 'IDDISTRIBUIDOR')
+    summaries = _split_sorted(monthly, 'IDDISTRIBUIDOR')
+    return [
+        (
+            distributor_id,
+            detail['NombreDistribuidor'].iloc[0],
+            summaries[distributor_id].drop(columns='IDDISTRIBUIDOR'),
+            detail[list(DETAIL_COLUMNS)].rename(columns=DETAIL_COLUMNS)
+        )
+        for distributor_id, detail in details.items()
+    ]
+
+# Function to write the workbook of one distributor
+def write_distributor_workbook(distributor_name, monthly_summary, detailed_report, output_path):
+    """Writes the monthly summary (with a chart) and the transactions of one distributor."""
+    workbook = excelstream.open_streaming_workbook(output_path)
+
+    currency_format = workbook.add_format({'num_format': '$#,##0.00'})
+    integer_format = workbook.add_format({'num_format': '#,##0'})
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+    header_format = workbook.add_format({'bold': True, 'bg_color': '#DDEBF7', 'border': 1})
+
+    excelstream.write_frame_streaming(workbook, 'Summary', monthly_summary, [
+        (12, None),             # Month
+        (20, currency_format),  # TotalLoanAmount
+        (22, integer_format),   # NumberOfTransactions
+        (15, integer_format),   # UniqueClients
+        (22, currency_format)   # AverageLoanAmount
+    ], header_format)
+    excelstream.write_frame_streaming(workbook, 'Detailed Transactions', detailed_report, [
+        (25, None),             # Distributor Name
+        (12, None),             # Client ID
+        (16, None),             # Client Category
+        (16, date_format),      # Transaction Date
+        (15, currency_format)   # Loan Amount
+    ], header_format)
+
+    # Monthly amount (columns) vs. number of transactions (line on the secondary axis)
+    num_months = len(monthly_summary)
+    chart = workbook.add_chart({'type': 'column'})
+    chart.add_series({
+        'name':       'Total Loan Amount',
+        'categories': ['Summary', 1, 0, num_months, 0],
+        'values':     ['Summary', 1, 1, num_months, 1],
+    })
+    line_chart = workbook.add_chart({'type': 'line'})
+    line_chart.add_series({
+        'name':       'Number of Transactions',
+        'categories': ['Summary', 1, 0, num_months, 0],
+        'values':     ['Summary', 1, 2, num_months, 2],
+        'marker':     {'type': 'circle'},
+        'y2_axis':    True,
+    })
+    chart.combine(line_chart)
+
+    chart.set_title({'name': f'Monthly Loan Performance - {distributor_name}'})
+    chart.set_x_axis({'name': 'Month'})
+    chart.set_y_axis({'name': 'Total Loan Amount ($)'})
+    line_chart.set_y2_axis({'name': 'Number of Transactions'})
+    chart.set_legend({'position': 'bottom'})
+
+    workbook.get_worksheet_by_name('Summary').insert_chart('G3', chart)
+    workbook.close()
+
+# Function to build a file name from a distributor name
+def _slug(value):
+    return re.sub(r'[^0-9A-Za-z]+', '_', str(value)).strip('_')
+
+# Function executed by the fan-out workers
+def _render_partition(task):
+    """Writes the workbook of one distributor and returns its path."""
+    distributor_id, distributor_name, monthly_summary, detailed_report, output_dir = task
+    output_path = output_dir / f"{FANOUT_PREFIX}_{distributor_id}_{_slug(distributor_name)}.xlsx"
+    write_distributor_workbook(distributor_name, monthly_summary, detailed_report, output_path)
+    return output_path
+
+# Function to write one report per distributor
+def fan_out_reports(data, output_dir=DISTRIBUTOR_REPORTS_DIR, workers=FANOUT_WORKERS):
+    """Writes one workbook per distributor into output_dir and returns their paths.
+
+    The workbooks are rendered on `workers` processes; a single worker, or a
+    daemon process (e.g. a report worker), renders them in this process.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tasks = [partition + (output_dir,) for partition in build_distributor_partitions(data)]
+    if not tasks:
+        print("No recommended transactions to fan out.")
+        return []
+
+    workers = max(1, min(workers, len(tasks)))
+    if workers == 1 or multiprocessing.current_process().daemon:
+        print(f"Writing {len(tasks)} distributor workbooks...")
+        output_paths = [_render_partition(task) for task in tasks]
+    else:
+        print(f"Writing {len(tasks)} distributor workbooks on {workers} processes...")
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+        # Batches of tasks per worker round trip amortize the pickling overhead
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            output_paths = list(pool.map(_render_partition, tasks, chunksize=chunksize))
+
+    print(f"Wrote {len(output_paths)} distributor workbooks into {output_dir}.")
+    return output_paths
+
+# Report plugin
+@register_report(
+    'distributor_summary',
+    depends_on=['fact_transactions', 'dim_client', 'dim_distributor', 'dim_time'],
+    params={'excel_max_rows': EXCEL_MAX_ROWS}
+)
+def distributor_summary_report(data, output_dir):
+    """Generates the distributor recommendation Excel report in output_dir."""
+    detailed_report, summary_report = build_report_frames(data)
+    output_path = Path(output_dir) / OUTPUT_FILENAME
+    write_excel_report(detailed_report, summary_report, output_path)
+    return [output_path]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates the distributor recommendation report.")
+    parser.add_argument('--fanout', action='store_true',
+                        help="Write one workbook per distributor into the distributor reports folder.")
+    parser.add_argument('--workers', type=int, default=FANOUT_WORKERS,
+                        help="Processes used to write the distributor workbooks.")
+    args = parser.parse_args()
+
+    print("Loading processed data...")
+    try:
+        if args.fanout:
+            fan_out_reports(reportdata, DISTRIBUTOR_REPORTS_DIR, workers=args.workers)
+            exit()
+        output_paths = distributor_summary_report(reportdata, Path.cwd())
+    except FileNotFoundError as e:
+        print(f"Error: File not found {e.filename}. Please run the ETL script first.")
+        exit()
 
-print(f"\nReport '{output_filename}' generated successfully.")
-print("It contains a summary with a chart and a detailed transaction list.")
\ No newline at end of file
+    print(f"\nReport '{output_paths[0].name}' generated successfully.")
+    print("It contains a summary with a chart and a detailed transaction list.")
@@ -0,0 +1,174 @@
+# src/rollingmetrics.py
+#--------------------------------------------------------------------------------
+# This module materializes trailing 7/30/90-day metrics per distributor and day:
+# loan amount, number of transactions and active recommended clients.
+# The facts are laid out as dense day x distributor arrays, and every window is
+# the difference of two rows of their cumulative sum. Distinct clients are
+# counted with an interval-coverage diff: an activity day t of a (distributor,
+# client) pair keeps the pair in the windows ending on days [t, t+W-1], and only
+# the part not already covered by the pair's previous activity day p, that is
+# [max(t, p+W), t+W-1], is added to the diff array.
+# The table is updated incrementally: only the days from the first new one on are
+# recomputed, from the facts of the last (largest window - 1) days before them.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+
+from config import FACT_TRANSACTIONS_FILE, DIM_CLIENT_FILE, ROLLING_METRICS_FILE, ROLLING_WINDOWS
+
+# Function to load the facts needed by the metrics
+def load_rolling_inputs(since=None):
+    """Returns the facts as (Fecha, IDDISTRIBUIDOR, IDCLIENTE, MontoPrestamo, CantidadTransacciones, EsRecomendado).
+
+    With since, only the facts from since on are kept.
+    """
+    facts = pd.read_csv(FACT_TRANSACTIONS_FILE, dtype={
+        'IDTiempo': 'int64', 'IDCLIENTE': 'int64', 'IDDISTRIBUIDOR': 'Int64',
+        'MontoPrestamo': 'float64', 'CantidadTransacciones': 'int32'
+    })
+    facts = facts[facts['IDDISTRIBUIDOR'].notna()]
+    facts['Fecha'] = pd.to_datetime(facts['IDTiempo'].astype(str), format='%Y%m%d')
+    if since is not None:
+        facts = facts[facts['Fecha'] >= since]
+
+    recommended = pd.read_csv(DIM_CLIENT_FILE, usecols=['IDCLIENTE', 'EsRecomendado'],
+                              dtype={'IDCLIENTE': 'int64', 'EsRecomendado': 'bool'})
+    facts = pd.merge(facts, recommended, on='IDCLIENTE', how='left', validate='many_to_one')
+    facts['EsRecomendado'] = facts['EsRecomendado'].fillna(False).astype(bool)
+    facts['IDDISTRIBUIDOR'] = facts['IDDISTRIBUIDOR'].astype('int64')
+    return facts[['Fecha', 'IDDISTRIBUIDOR', 'IDCLIENTE', 'MontoPrestamo', 'CantidadTransacciones', 'EsRecomendado']]
+
+# Function to lay a measure out on the day x distributor grid
+def _dense(day_index, distributor_index, values, num_days, num_distributors):
+    """Returns a (num_days, num_distributors) array with the values summed per cell."""
+    flat = day_index * num_distributors + distributor_index
+    return np.bincount(flat, weights=values, minlength=num_days * num_distributors).reshape(num_days, num_distributors)
+
+# Function to compute the trailing sums of a dense array
+def _trailing_sums(dense, window):
+    """Returns the sum of the last `window` days for every day, via cumulative sums."""
+    cumulative = np.cumsum(dense, axis=0)
+    trailing = cumulative.copy()
+    trailing[window:] -= cumulative[:-window]
+    return trailing
+
+# Function to count the distinct clients of every trailing window
+def _trailing_distinct(day_index, distributor_index, client_codes, window, num_days, num_distributors):
+    """Returns the number of distinct clients active in the last `window` days, per day and distributor.
+
+    The activity days must be unique per (distributor, client) pair and sorted by
+    distributor, client and day.
+    """
+    same_pair = np.r_[False, (distributor_index[1:] == distributor_index[:-1]) & (client_codes[1:] == client_codes[:-1])]
+    previous_day = np.where(same_pair, np.r_[0, day_index[:-1]], -window)
+
+    starts = np.maximum(day_index, previous_day + window)
+    ends = np.minimum(day_index + window, num_days)  # Exclusive, clipped to the last day
+    covered = starts < ends
+    diff = np.zeros((num_days + 1) * num_distributors, dtype=np.int64)
+    np.add.at(diff, starts[covered] * num_distributors + distributor_index[covered], 1)
+    np.add.at(diff, ends[covered] * num_distributors + distributor_index[covered], -1)
+    return np.cumsum(diff.reshape(num_days + 1, num_distributors)[:-1], axis=0)
+
+# Function to compute the rolling metrics
+def compute_rolling_metrics(facts, start=None, windows=ROLLING_WINDOWS):
+    """Returns one row per day and distributor with the trailing metrics of every window.
+
+    The days run from the first fact day (or start) to the last one; rows without
+    any transaction in the largest window are left out.
+    """
+    if facts.empty:
+        return pd.DataFrame()
+    first_day = facts['Fecha'].min()
+    last_day = facts['Fecha'].max()
+    num_days = (last_day - first_day).days + 1
+    distributors = np.sort(facts['IDDISTRIBUIDOR'].unique())
+    num_distributors = len(distributors)
+
+    day_index = (facts['Fecha'] - first_day).dt.days.to_numpy()
+    distributor_index = np.searchsorted(distributors, facts['IDDISTRIBUIDOR'].to_numpy())
+    amount = _dense(day_index, distributor_index, facts['MontoPrestamo'].to_numpy(), num_days, num_distributors)
+    transactions = _dense(day_index, distributor_index, facts['CantidadTransacciones'].to_numpy(), num_days, num_distributors)
+
+    # Unique activity days of recommended clients, sorted by distributor, client and day
+    recommended = facts['EsRecomendado'].to_numpy()
+    activity = pd.DataFrame({
+        'distributor': distributor_index[recommended],
+        'client': pd.factorize(facts['IDCLIENTE'].to_numpy()[recommended])[0],
+        'day': day_index[recommended]
+    }).drop_duplicates().sort_values(['distributor', 'client', 'day'])
+    activity = {column: activity[column].to_numpy() for column in activity.columns}
+
+    metrics = {}
+    for window in windows:
+        metrics[f'LoanAmount_{window}d'] = _trailing_sums(amount, window)
+        metrics[f'Transactions_{window}d'] = np.rint(_trailing_sums(transactions, window)).astype(np.int64)
+        metrics[f'ActiveRecommendedClients_{window}d'] = _trailing_distinct(
+            activity['day'], activity['distributor'], activity['client'], window, num_days, num_distributors
+        )
+
+    days = pd.date_range(first_day, periods=num_days, freq='D')
+    table = pd.DataFrame({
+        'Fecha': np.repeat(days, num_distributors),
+        'IDDISTRIBUIDOR': np.tile(distributors, num_days)
+    })
+    for column, values in metrics.items():
+        table[column] = values.ravel()
+
+    table = table[table[f'Transactions_{max(windows)}d'] > 0]
+    if start is not None:
+        table = table[table['Fecha'] >= start]
+    return table.reset_index(drop=True)
+
+# Function to update the materialized table
+def update_rolling_metrics(since=None, full=False, windows=ROLLING_WINDOWS):
+    """Updates the rolling metrics table and returns the number of rows written.
+
+    By default only the days after the last materialized one are computed; since
+    (a date) recomputes from that day on, e.g. after late transactions, and full
+    rebuilds the whole table.
+    """
+    existing = None
+    if not full and ROLLING_METRICS_FILE.exists():
+        existing = pd.read_csv(ROLLING_METRICS_FILE, parse_dates=['Fecha'])
+        if since is None and not existing.empty:
+            since = existing['Fecha'].max() + pd.Timedelta(days=1)
+    if existing is None or since is None:
+        existing, since = None, None
+
+    # The windows of the recomputed days reach (largest window - 1) days back
+    lookback_start = None if since is None else pd.Timestamp(since) - pd.Timedelta(days=max(windows) - 1)
+    facts = load_rolling_inputs(lookback_start)
+    if since is not None and (facts.empty or facts['Fecha'].max() < pd.Timestamp(since)):
+        print("Rolling metrics are up to date.")
+        return 0
+
+    print(f"Computing rolling metrics ({'/'.join(f'{w}d' for w in windows)})"
+          f"{'' if since is None else f' from {pd.Timestamp(since).date()}'}...")
+    table = compute_rolling_metrics(facts, start=since, windows=windows)
+
+    if existing is not None:
+        existing = existing[existing['Fecha'] < pd.Timestamp(since)]
+        table = pd.concat([existing, table], ignore_index=True)
+
+    # Written under a temporary name so readers never see a partial table
+    ROLLING_METRICS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = ROLLING_METRICS_FILE.with_name(ROLLING_METRICS_FILE.name + ".tmp")
+    table.to_csv(tmp_path, index=False, date_format='%Y-%m-%d')
+    tmp_path.replace(ROLLING_METRICS_FILE)
+    print(f"Rolling metrics saved to {ROLLING_METRICS_FILE} ({len(table):,} rows).")
+    return len(table)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Updates the rolling distributor metrics table.")
+    parser.add_argument('--full', action='store_true', help="Rebuild the whole table.")
+    parser.add_argument('--since', default=None, help="Recompute from this date (YYYY-MM-DD) on.")
+    args = parser.parse_args()
+    update_rolling_metrics(since=args.since and pd.Timestamp(args.since), full=args.full)
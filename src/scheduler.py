@@ -0,0 +1,357 @@
+# src/scheduler.py
+#--------------------------------------------------------------------------------
+# This script is the built-in scheduler of the pipeline.
+# The jobs (ETL, every registered report, queueing the email, delivering the
+# outbox, the BI export, cleanup) form a dependency graph. A run starts every job as soon as
+# all of its dependencies finished, running independent jobs concurrently in a
+# process pool; when a job fails, the jobs that depend on it are skipped. Jobs
+# pass their output files on to the jobs waiting for them, so the email attaches
+# exactly the files the report jobs wrote.
+# Runs are started by cron-like triggers (SCHEDULE), a lock file prevents two
+# runs from overlapping, even across processes, and every job's status and
+# duration are appended to a run history (--history summarizes it).
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+import pandas as pd
+
+from config import (
+    SCHEDULE, SCHEDULER_WORKERS, SCHEDULER_LOCK_FILE, SCHEDULER_HISTORY_FILE,
+    REPORTS_OUTPUT_DIR, REPORT_CACHE_ENABLED
+)
+import reportregistry
+
+REPORT_JOB_PREFIX = 'report:'
+
+# Ranges of the cron fields: minute, hour, day of month, month, day of week (0 = Sunday)
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+class CronTrigger:
+    """A five-field cron expression: minute hour day-of-month month day-of-week."""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expression}' must have 5 fields.")
+        self.expression = expression
+        self.allowed = [self._parse(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)]
+        # 7 is also Sunday
+        if 7 in self.allowed[4]:
+            self.allowed[4].add(0)
+        self.any_day = (fields[2] == '*', fields[4] == '*')
+
+    @staticmethod
+    def _parse(field, low, high):
+        """Returns the set of values of one field (*, */n, a, a-b, a-b/n, and lists of them)."""
+        values = set()
+        for item in field.split(','):
+            range_part, _, step = item.partition('/')
+            if range_part == '*':
+                start, end = low, high
+            elif '-' in range_part:
+                start, end = (int(value) for value in range_part.split('-'))
+            else:
+                start = end = int(range_part)
+                if step:
+                    end = high
+            if not low <= start <= end <= high:
+                raise ValueError(f"Cron field '{field}' is out of range {low}-{high}.")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def matches(self, moment):
+        """Returns True when the trigger fires in the minute of `moment`."""
+        minutes, hours, days, months, weekdays = self.allowed
+        day_matches = moment.day in days
+        weekday_matches = (moment.weekday() + 1) % 7 in weekdays
+        # As in cron, a restricted day of month and day of week match either one
+        any_day_of_month, any_day_of_week = self.any_day
+        if any_day_of_month or any_day_of_week:
+            day_ok = day_matches and weekday_matches
+        else:
+            day_ok = day_matches or weekday_matches
+        return moment.minute in minutes and moment.hour in hours and moment.month in months and day_ok
+
+
+# Function to define the job graph
+def build_jobs():
+    """Returns {job name: {'requires': [...], 'after': [...]}}.
+
+    A job starts once every job in 'requires' succeeded and every job in 'after'
+    finished, whatever its outcome; it is skipped when a required job did not
+    succeed. The email waits for every report but only requires the required ones.
+    """
+    reports = reportregistry.load_report_plugins()
+    jobs = {'etl': {'requires': [], 'after': []}}
+    for name in reports:
+        jobs[REPORT_JOB_PREFIX + name] = {'requires': ['etl'], 'after': []}
+    required = [REPORT_JOB_PREFIX + name for name in reports if reportregistry.REPORT_OPTIONS[name]['required']]
+    optional = [REPORT_JOB_PREFIX + name for name in reports if not reportregistry.REPORT_OPTIONS[name]['required']]
+    jobs['email'] = {'requires': required or ['etl'], 'after': optional}
+    jobs['deliver'] = {'requires': ['email'], 'after': []}
+    jobs['bi_export'] = {'requires': ['etl'], 'after': []}
+    jobs['cleanup'] = {'requires': [], 'after': ['deliver', 'bi_export']}
+    # Standalone delivery of the messages waiting for a retry
+    jobs['retry_outbox'] = {'requires': [], 'after': []}
+    return jobs
+
+# Function to select the jobs needed by some targets
+def required_jobs(jobs, targets):
+    """Returns the subgraph of the targets and, transitively, every job they wait for."""
+    selected = set()
+    pending = list(targets)
+    while pending:
+        job = pending.pop()
+        if job not in jobs:
+            raise KeyError(f"Unknown job: {job}")
+        if job not in selected:
+            selected.add(job)
+            pending.extend(jobs[job]['requires'] + jobs[job]['after'])
+    return {
+        job: {kind: [other for other in edges if other in selected] for kind, edges in jobs[job].items()}
+        for job in jobs if job in selected
+    }
+
+# Function executed by the pool for every job
+def _run_job(job, inputs=None):
+    """Runs one job in a worker process; returns (duration in seconds, output files).
+
+    inputs maps the jobs this one waited for, and that succeeded, to their output
+    files: the email attaches exactly the files the report jobs wrote.
+    """
+    started = time.perf_counter()
+    output_paths = []
+    if job == 'etl':
+        import main
+        if not main.main():
+            raise RuntimeError("the ETL run halted on missing input data")
+    elif job.startswith(REPORT_JOB_PREFIX):
+        import reportcache
+        import reportdata
+        name = job[len(REPORT_JOB_PREFIX):]
+        report = reportregistry.load_report_plugins()[name]
+        REPORTS_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+        if REPORT_CACHE_ENABLED:
+            output_paths = reportcache.run_cached(name, reportdata, REPORTS_OUTPUT_DIR)
+        else:
+            output_paths = report(reportdata, REPORTS_OUTPUT_DIR)
+    elif job == 'email':
+        import orchestrator
+        report_files = [path for other, paths in (inputs or {}).items()
+                        if other.startswith(REPORT_JOB_PREFIX) for path in paths]
+        queued_files = orchestrator.queue_email_with_attachments(report_files)
+        if queued_files:
+            orchestrator.cleanup_reports(queued_files)
+    elif job == 'bi_export':
+        import biexport
+        biexport.export()
+    elif job in ('deliver', 'retry_outbox'):
+        import orchestrator
+        orchestrator.deliver_outbox()
+    elif job == 'cleanup':
+        import checkpoint
+        import outbox
+        import reportarchive
+        import reportcache
+        checkpoint.cleanup_checkpoints()
+        reportcache.evict()
+        reportarchive.apply_retention()
+        outbox.compact_journal()
+    else:
+        raise KeyError(f"Unknown job: {job}")
+    return time.perf_counter() - started, [str(path) for path in output_paths]
+
+# Function to append a record to the run history
+def _record(run_id, job, status, started, seconds, error=None):
+    SCHEDULER_HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
+    record = {
+        'run_id': run_id, 'job': job, 'status': status,
+        'started': datetime.fromtimestamp(started).isoformat(timespec='seconds'),
+        'seconds': round(seconds, 3), 'error': error
+    }
+    with open(SCHEDULER_HISTORY_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + "\n")
+
+
+class RunLock:
+    """An exclusive lock file held for the duration of a run.
+
+    With fcntl the lock is released by the OS if the process dies; elsewhere the
+    lock file holds the owner's PID and is taken over when that PID is gone.
+    """
+
+    def __init__(self, file_path=SCHEDULER_LOCK_FILE):
+        self.file_path = file_path
+        self.fd = None
+
+    def acquire(self):
+        """Returns True when the lock was taken, False when another run holds it."""
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            import fcntl
+        except ImportError:
+            return self._acquire_pid_file()
+        fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self.fd = fd
+        return True
+
+    def _acquire_pid_file(self):
+        try:
+            fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            try:
+                owner = int(self.file_path.read_text() or 0)
+                os.kill(owner, 0)
+                return False
+            except (ValueError, ProcessLookupError):
+                # Stale lock of a run that died
+                self.file_path.unlink(missing_ok=True)
+                return self._acquire_pid_file()
+            except PermissionError:
+                return False
+        os.write(fd, str(os.getpid()).encode())
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is None:
+            return
+        try:
+            import fcntl
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        except ImportError:
+            self.file_path.unlink(missing_ok=True)
+        os.close(self.fd)
+        self.fd = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+# Function to run a job graph
+def run_graph(jobs, workers=SCHEDULER_WORKERS):
+    """Runs every job of the graph as soon as it can start, up to `workers` at a time.
+
+    Returns {job: status}, where status is 'ok', 'failed' or 'skipped'.
+    """
+    run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+    print(f"--- Scheduler run {run_id}: {len(jobs)} job(s) ---")
+    status = {}
+    outputs = {}
+    running = {}
+    started = {}
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        while len(status) < len(jobs):
+            finished = len(status)
+            for job, edges in jobs.items():
+                if job in status or job in started:
+                    continue
+                if any(status.get(other) in ('failed', 'skipped') for other in edges['requires']):
+                    # Skip the jobs whose requirements did not succeed
+                    status[job] = 'skipped'
+                    _record(run_id, job, 'skipped', time.time(), 0.0)
+                    print(f"Job '{job}' skipped: a required job did not succeed.")
+                elif all(other in status for other in edges['requires'] + edges['after']):
+                    # Start the jobs whose requirements all succeeded as soon as possible
+                    print(f"Starting job '{job}'...")
+                    inputs = {other: outputs[other] for other in edges['requires'] + edges['after'] if other in outputs}
+                    running[pool.submit(_run_job, job, inputs)] = job
+                    started[job] = time.time()
+
+            if not running:
+                if len(status) == finished:
+                    raise ValueError("The job graph has a cycle.")
+                # Skipping a job may have unblocked others
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                try:
+                    seconds, outputs[job] = future.result()
+                    status[job] = 'ok'
+                    _record(run_id, job, 'ok', started[job], seconds)
+                    print(f"Job '{job}' finished in {seconds:.2f}s.")
+                except Exception as e:
+                    status[job] = 'failed'
+                    _record(run_id, job, 'failed', started[job], time.time() - started[job], error=str(e))
+                    print(f"ERROR: Job '{job}' failed: {e}")
+
+    print(f"--- Scheduler run {run_id} finished: " +
+          ", ".join(f"{sum(1 for value in status.values() if value == kind)} {kind}" for kind in ('ok', 'failed', 'skipped')) + " ---")
+    return status
+
+# Function to run the jobs needed by some targets under the lock
+def run_targets(targets, workers=SCHEDULER_WORKERS):
+    """Runs the targets and their dependencies, unless another run holds the lock."""
+    with RunLock() as acquired:
+        if not acquired:
+            print("Another scheduler run is in progress. Skipping this one.")
+            return None
+        return run_graph(required_jobs(build_jobs(), targets), workers)
+
+# Function to run the triggers forever
+def run_forever(schedule=SCHEDULE, workers=SCHEDULER_WORKERS):
+    """Checks the cron triggers at the start of every minute and runs the due targets."""
+    triggers = [(CronTrigger(expression), targets) for expression, targets in schedule]
+    print(f"Scheduler started with {len(triggers)} trigger(s).")
+    while True:
+        now = datetime.now().replace(second=0, microsecond=0)
+        targets = [target for trigger, trigger_targets in triggers if trigger.matches(now) for target in trigger_targets]
+        if targets:
+            run_targets(list(dict.fromkeys(targets)), workers)
+        # Sleep until the next minute
+        time.sleep(max(1.0, 60 - datetime.now().second))
+
+# Function to summarize the run history
+def history_summary():
+    """Returns the runs, mean, p95 and max duration and failures of every job."""
+    if not SCHEDULER_HISTORY_FILE.exists():
+        return pd.DataFrame()
+    history = pd.read_json(SCHEDULER_HISTORY_FILE, lines=True)
+    finished = history[history['status'].isin(['ok', 'failed'])]
+    return finished.groupby('job').agg(
+        Runs=('seconds', 'size'),
+        MeanSeconds=('seconds', 'mean'),
+        P95Seconds=('seconds', lambda seconds: seconds.quantile(0.95)),
+        MaxSeconds=('seconds', 'max'),
+        Failures=('status', lambda statuses: int((statuses == 'failed').sum()))
+    ).sort_values('MeanSeconds', ascending=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the pipeline jobs on their schedule.")
+    parser.add_argument('--once', nargs='*', metavar='JOB',
+                        help="Run the given jobs (the full pipeline by default) and their dependencies now, then exit.")
+    parser.add_argument('--workers', type=int, default=SCHEDULER_WORKERS,
+                        help="Jobs run at the same time.")
+    parser.add_argument('--history', action='store_true',
+                        help="Print the duration statistics of every job and exit.")
+    args = parser.parse_args()
+    if args.history:
+        print(history_summary().to_string())
+    elif args.once is not None:
+        run_targets(args.once or ['cleanup'], args.workers)
+    else:
+        run_forever(workers=args.workers)
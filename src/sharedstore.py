@@ -0,0 +1,158 @@
+# src/sharedstore.py
+#--------------------------------------------------------------------------------
+# This module publishes the columns of the star-schema tables in shared memory,
+# so worker processes can use them without pickling DataFrames across process
+# boundaries.
+# Numeric, boolean and datetime columns are copied as-is into one segment each;
+# text and categorical columns are stored as integer codes plus a small list of
+# categories. A picklable descriptor lets a worker reattach the table as a
+# DataFrame over the shared buffers, and the store frees every segment it
+# created when it is closed, when its `with` block ends, or at interpreter exit.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import atexit
+import gc
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+
+class SharedFrame:
+    """A DataFrame attached to shared-memory segments, usable as a context manager.
+
+    Only use the DataFrame through the `frame` attribute, and copy it if it has
+    to outlive the attachment: close() drops it before detaching the buffers.
+    """
+
+    def __init__(self, frame, handles):
+        self.frame = frame
+        self._handles = handles
+
+    def close(self):
+        """Detaches from the shared segments (they stay alive for other processes)."""
+        self.frame = None
+        for shm in self._handles:
+            try:
+                shm.close()
+            except BufferError:
+                # Views on the buffer may be kept alive by reference cycles inside pandas
+                gc.collect()
+                try:
+                    shm.close()
+                except BufferError:
+                    pass
+        self._handles = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SharedFrameDescriptor:
+    """Picklable description of a table published in shared memory."""
+
+    def __init__(self, table_name, length, columns):
+        self.table_name = table_name
+        self.length = length
+        # List of dicts: name, segment, dtype and, for categorical columns, categories/ordered
+        self.columns = columns
+
+    def open(self):
+        """Attaches to the shared segments and returns a SharedFrame."""
+        handles = []
+        data = {}
+        try:
+            for column in self.columns:
+                shm = shared_memory.SharedMemory(name=column['segment'])
+                handles.append(shm)
+                values = np.ndarray((self.length,), dtype=np.dtype(column['dtype']), buffer=shm.buf)
+                if 'categories' in column:
+                    data[column['name']] = pd.Categorical.from_codes(
+                        values, categories=column['categories'], ordered=column['ordered']
+                    )
+                else:
+                    data[column['name']] = values
+        except Exception:
+            for shm in handles:
+                shm.close()
+            raise
+        return SharedFrame(pd.DataFrame(data, copy=False), handles)
+
+    def nbytes(self):
+        """Returns the size of the shared data in bytes."""
+        return sum(np.dtype(column['dtype']).itemsize * self.length for column in self.columns)
+
+
+class SharedFrameStore:
+    """Owns the shared-memory segments of the tables published during a run."""
+
+    def __init__(self):
+        self._segments = []
+        self.descriptors = {}
+        atexit.register(self.close)
+
+    def _new_segment(self, values):
+        """Copies an array into a new shared segment and returns the segment name."""
+        values = np.ascontiguousarray(values)
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+        self._segments.append(shm)
+        return shm.name
+
+    def publish(self, table_name, df, columns=None):
+        """Publishes the given columns of a DataFrame (all by default) and returns its descriptor."""
+        shared_columns = []
+        for name in (columns or list(df.columns)):
+            series = df[name]
+            values = None
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                values = series.to_numpy()
+            # Text, nullable and categorical columns are stored as codes plus categories
+            if values is None or values.dtype.kind not in 'biufmM':
+                categorical = series.astype('category').array
+                codes = categorical.codes
+                shared_columns.append({
+                    'name': name,
+                    'segment': self._new_segment(codes),
+                    'dtype': codes.dtype.str,
+                    'categories': categorical.categories,
+                    'ordered': categorical.ordered
+                })
+            else:
+                shared_columns.append({
+                    'name': name,
+                    'segment': self._new_segment(values),
+                    'dtype': values.dtype.str
+                })
+
+        descriptor = SharedFrameDescriptor(table_name, len(df), shared_columns)
+        self.descriptors[table_name] = descriptor
+        return descriptor
+
+    def publish_star_schema(self, tables):
+        """Publishes a dict of star-schema tables and returns their descriptors by name."""
+        return {name: self.publish(name, df) for name, df in tables.items()}
+
+    def close(self):
+        """Frees every segment created by the store."""
+        for shm in self._segments:
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._segments = []
+        self.descriptors = {}
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,71 @@
+# src/snapshot.py
+#--------------------------------------------------------------------------------
+# This module publishes the processed star schema as versioned snapshots.
+# Once the ETL (or the watch mode) has written every processed table, it
+# replaces SNAPSHOT_FILE with the new version, the time it was published and
+# the size and modification time of each table. Long-running readers, such as
+# the metrics API, only have to watch that one small file to know when to load
+# a complete, consistent set of tables.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import time
+
+from config import (
+    SNAPSHOT_FILE, DIM_CLIENT_FILE, DIM_DISTRIBUTOR_FILE, DIM_TIME_FILE, FACT_TRANSACTIONS_FILE
+)
+
+SNAPSHOT_TABLES = {
+    'dim_client': DIM_CLIENT_FILE,
+    'dim_distributor': DIM_DISTRIBUTOR_FILE,
+    'dim_time': DIM_TIME_FILE,
+    'fact_transactions': FACT_TRANSACTIONS_FILE,
+}
+
+# Function to describe the processed tables on disk
+def table_signatures():
+    """Returns {table: [size, mtime_ns]}, or None for a missing table."""
+    signatures = {}
+    for name, file_path in SNAPSHOT_TABLES.items():
+        try:
+            stat = file_path.stat()
+            signatures[name] = [stat.st_size, stat.st_mtime_ns]
+        except FileNotFoundError:
+            signatures[name] = None
+    return signatures
+
+# Function to publish a new snapshot
+def publish(run_id=None):
+    """Records the processed tables as the current snapshot; returns its version."""
+    tables = table_signatures()
+    version = hashlib.sha256(json.dumps(tables, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    record = {'version': version, 'run_id': run_id, 'published': time.time(), 'tables': tables}
+    SNAPSHOT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = SNAPSHOT_FILE.with_name(SNAPSHOT_FILE.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp_path.replace(SNAPSHOT_FILE)
+    print(f"Published snapshot {version}.")
+    return version
+
+# Function to read the current snapshot
+def current():
+    """Returns the current snapshot record.
+
+    Without a published snapshot (e.g. tables written by an older ETL), the
+    version is derived from the tables on disk.
+    """
+    try:
+        with open(SNAPSHOT_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        tables = table_signatures()
+        version = hashlib.sha256(json.dumps(tables, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        return {'version': version, 'run_id': None, 'published': None, 'tables': tables}
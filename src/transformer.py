@@ -71,4 +71,24 @@ def create_fact_table(transactions_df, client_dim_df, time_dim_df):
     # Add a transaction count for easy aggregation
     fact_df['CantidadTransacciones'] = 1
     
-    return fact_df
\ No newline at end of file
+    return fact_df
+
+# Function to create the fact rows of a chunk of transactions
+def create_fact_chunk(transactions_chunk, client_dim_df):
+    """Creates the fact rows for a chunk of transactions.
+
+    Equivalent to create_fact_table, but the time key is derived from the date
+    itself, so the chunk only needs to be enriched against the client dimension.
+    """
+    fact_df = pd.merge(
+        transactions_chunk[['IDCLIENTE', 'FECHA', 'MONTO_PRESTAMO']],
+        client_dim_df[['IDCLIENTE', 'IDDISTRIBUIDOR']],
+        on='IDCLIENTE'
+    )
+    dates = pd.to_datetime(fact_df['FECHA'])
+    fact_df['IDTiempo'] = dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day
+
+    fact_df = fact_df[['IDTiempo', 'IDCLIENTE', 'IDDISTRIBUIDOR', 'MONTO_PRESTAMO']]
+    fact_df = fact_df.rename(columns={'MONTO_PRESTAMO': 'MontoPrestamo'})
+    fact_df['CantidadTransacciones'] = 1
+    return fact_df
@@ -0,0 +1,235 @@
+# src/watcher.py
+#--------------------------------------------------------------------------------
+# This module runs the ETL pipeline in watch mode: a long-running process that
+# monitors RAW_DATA_DIR and refreshes data/processed whenever a raw file is
+# created or changed, keeping the parsed inputs and dimensions in memory.
+# Changes are detected with inotify on Linux, and by polling file signatures
+# everywhere else. When the Excel file only gained new transactions, only the
+# new rows are transformed and appended to the fact table and to its bitmap
+# indexes, and the rolling metrics are recomputed from their first day on.
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+import pandas as pd
+
+from config import (
+    RAW_DATA_DIR, RECOMMENDATIONS_JSON_FILE, CLIENTS_EXCEL_FILE,
+    DIM_CLIENT_FILE, DIM_DISTRIBUTOR_FILE, DIM_TIME_FILE, FACT_TRANSACTIONS_FILE,
+    WATCH_POLL_INTERVAL, WATCH_DEBOUNCE_SECONDS
+)
+import bitmapindex
+import loader
+import rollingmetrics
+import snapshot
+import transformer
+import writer
+
+# inotify event flags (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """Waits for file events in a directory using the Linux inotify API."""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, str(directory).encode(), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout=None):
+        """Blocks until events arrive and returns the names of the files involved."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        buffer = os.read(self.fd, 64 * 1024)
+        names = set()
+        offset = 0
+        while offset < len(buffer):
+            _, _, _, name_length = INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT.size
+            names.add(buffer[offset:offset + name_length].rstrip(b'\0').decode())
+            offset += name_length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Waits for file changes in a directory by comparing size and mtime signatures."""
+
+    def __init__(self, directory, interval=WATCH_POLL_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.signatures = self._scan()
+
+    def _scan(self):
+        return {
+            path.name: (path.stat().st_size, path.stat().st_mtime_ns)
+            for path in self.directory.iterdir() if path.is_file()
+        }
+
+    def wait(self, timeout=None):
+        """Polls until some file changed and returns the names of the changed files."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self._scan()
+            changed = {name for name, signature in current.items() if self.signatures.get(name) != signature}
+            self.signatures = current
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+# Function to create the best available watcher
+def create_watcher(directory):
+    """Returns an inotify watcher when the platform supports it, or a polling watcher."""
+    try:
+        return InotifyWatcher(directory)
+    except (OSError, AttributeError) as e:
+        print(f"inotify not available ({e}). Falling back to polling every {WATCH_POLL_INTERVAL}s.")
+        return PollingWatcher(directory)
+
+
+class WarmStarSchema:
+    """Keeps the parsed raw inputs and the dimensions resident between refreshes."""
+
+    def __init__(self):
+        self.reco_df = None
+        self.clients_df = None
+        self.transactions_df = None
+        self.dim_client = None
+        self.dim_distributor = None
+        self.dim_time = None
+
+    def load_recommendations(self):
+        reco_df = loader.load_recommendations_data(RECOMMENDATIONS_JSON_FILE)
+        if reco_df.empty:
+            return False
+        self.reco_df = transformer.clean_recommendations_data(reco_df)
+        return True
+
+    def rebuild(self):
+        """Rebuilds the full star schema from the resident inputs and writes it."""
+        self.dim_distributor = transformer.create_distributor_dimension(self.reco_df)
+        self.dim_client = transformer.create_client_dimension(self.clients_df, self.reco_df)
+        self.dim_time = transformer.create_time_dimension(self.transactions_df['FECHA'])
+        fact_transactions = transformer.create_fact_table(self.transactions_df, self.dim_client, self.dim_time)
+
+        writer.save_to_csv(self.dim_client, DIM_CLIENT_FILE)
+        writer.save_to_csv(self.dim_distributor, DIM_DISTRIBUTOR_FILE)
+        writer.save_to_csv(self.dim_time, DIM_TIME_FILE)
+        writer.save_to_csv(fact_transactions, FACT_TRANSACTIONS_FILE)
+        rollingmetrics.update_rolling_metrics(full=True)
+        bitmapindex.build_index_file(fact_transactions, self.dim_client)
+        snapshot.publish()
+
+    def append_transactions(self, new_transactions):
+        """Transforms only the new transactions and appends their facts."""
+        print(f"Appending {len(new_transactions):,} new transactions...")
+        fact_rows = transformer.create_fact_chunk(new_transactions, self.dim_client)
+        writer.append_to_csv(fact_rows, FACT_TRANSACTIONS_FILE)
+        bitmapindex.append_to_index_file(fact_rows, self.dim_client)
+
+        all_dates = pd.concat([self.dim_time['FechaCompleta'], pd.to_datetime(new_transactions['FECHA'])])
+        dim_time = transformer.create_time_dimension(all_dates)
+        if len(dim_time) != len(self.dim_time):
+            self.dim_time = dim_time
+            writer.save_to_csv(self.dim_time, DIM_TIME_FILE)
+
+        # Only the days from the earliest new transaction on are recomputed
+        rollingmetrics.update_rolling_metrics(since=pd.to_datetime(new_transactions['FECHA']).min().normalize())
+        snapshot.publish()
+
+    def refresh_excel(self, force_rebuild=False):
+        """Reloads the Excel file and applies its changes incrementally when possible."""
+        clients_df, transactions_df = loader.load_clients_and_transactions(CLIENTS_EXCEL_FILE)
+        if clients_df.empty or transactions_df.empty:
+            return False
+
+        previous = self.transactions_df
+        clients_changed = self.clients_df is None or not clients_df.equals(self.clients_df)
+        append_only = (
+            previous is not None
+            and not clients_changed
+            and len(transactions_df) > len(previous)
+            and transactions_df.iloc[:len(previous)].reset_index(drop=True).equals(previous.reset_index(drop=True))
+        )
+        transactions_changed = previous is None or not transactions_df.equals(previous)
+        self.clients_df, self.transactions_df = clients_df, transactions_df
+
+        if append_only and not force_rebuild:
+            self.append_transactions(transactions_df.iloc[len(previous):])
+        elif force_rebuild or clients_changed or transactions_changed:
+            self.rebuild()
+        return True
+
+
+# Function to wait until a burst of writes is over
+def _debounce(watcher, changed):
+    """Collects further events until the directory has been quiet for a moment."""
+    while True:
+        more = watcher.wait(timeout=WATCH_DEBOUNCE_SECONDS)
+        if not more:
+            return changed
+        changed |= more
+
+# Function to run the watch mode
+def watch():
+    """Keeps the star schema warm and refreshes it whenever a raw file changes."""
+    print(f"--- Starting ETL watch mode on {RAW_DATA_DIR} ---")
+    state = WarmStarSchema()
+    if not state.load_recommendations() or not state.refresh_excel():
+        print("ETL watch mode halted due to missing input data.")
+        return
+
+    watcher = create_watcher(RAW_DATA_DIR)
+    try:
+        while True:
+            changed = watcher.wait()
+            if not changed:
+                continue
+            changed = _debounce(watcher, changed)
+            started = time.perf_counter()
+            print(f"Change detected in: {', '.join(sorted(changed))}")
+            try:
+                reco_changed = RECOMMENDATIONS_JSON_FILE.name in changed and state.load_recommendations()
+                if CLIENTS_EXCEL_FILE.name in changed:
+                    state.refresh_excel(force_rebuild=reco_changed)
+                elif reco_changed:
+                    state.rebuild()
+                else:
+                    continue
+            except Exception as e:
+                print(f"ERROR refreshing the star schema: {e}")
+                continue
+            print(f"--- Star schema refreshed in {time.perf_counter() - started:.2f}s ---")
+    except KeyboardInterrupt:
+        print("\n--- ETL watch mode stopped ---")
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    watch()
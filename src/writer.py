@@ -1,7 +1,7 @@
 # src/writer.py
 #----------------------------------------------------------------
 # This module contains functions to save transformed 
-# data to CSV files.
+# data to CSV files, either in one go or chunk by chunk.
 #
 # author: ekastel
 # date: 2025-06-27
@@ -13,4 +13,34 @@ def save_to_csv(dataframe, file_path):
     # Ensure the directory exists
     file_path.parent.mkdir(parents=True, exist_ok=True)
     dataframe.to_csv(file_path, index=False)
-    print("Save complete.")
\ No newline at end of file
+    print("Save complete.")
+
+def save_chunks_to_csv(chunks, file_path):
+    """Appends an iterable of DataFrames to a single CSV file and returns the row count.
+
+    The file is written under a temporary name and renamed at the end, so a
+    failure never leaves a partial CSV in place of the previous one.
+    """
+    print(f"Saving data to {file_path} in chunks...")
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = file_path.with_name(file_path.name + ".tmp")
+    total_rows = 0
+    try:
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            for position, chunk in enumerate(chunks):
+                chunk.to_csv(f, index=False, header=(position == 0))
+                total_rows += len(chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    tmp_path.replace(file_path)
+    print(f"Save complete ({total_rows:,} rows).")
+    return total_rows
+
+def append_to_csv(dataframe, file_path):
+    """Appends a pandas DataFrame to a CSV file, writing the header only if the file is new."""
+    print(f"Appending data to {file_path}...")
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    write_header = not file_path.exists() or file_path.stat().st_size == 0
+    dataframe.to_csv(file_path, mode='a', index=False, header=write_header)
+    print("Save complete.")
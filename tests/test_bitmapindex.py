@@ -0,0 +1,190 @@
+# tests/test_bitmapindex.py
+#--------------------------------------------------------------------------------
+# Tests of the fact bitmap indexes (src/bitmapindex.py): the rows matched by a
+# filter are checked against a boolean mask over the same attributes, for an
+# index built in memory, saved and extended with appended segments, and through
+# the filtered facts of the report data layer (src/reportdata.py).
+# Run them with:  python -m unittest discover tests  (or python -m pytest tests)
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+import bitmapindex
+import reportdata
+
+# Filters covering sparse and dense containers, lists of values, values that
+# match no row and rows whose client is missing from the client dimension
+FILTERS = [
+    {'recommended': True},
+    {'recommended': False, 'category': 'Oro'},
+    {'category': ['Oro', 'Platino']},
+    {'distributor': 7},
+    {'distributor': [1, 7, 40], 'year': 2024},
+    {'distributor': 1, 'month': [1, 2, 3], 'recommended': True},
+    {'year': 2023, 'month': 12, 'category': ['Cobre', 'Plata']},
+    {'distributor': 999},
+    {'category': 'Diamante', 'year': 2024},
+]
+
+
+def make_fixture(seed=11, num_rows=3000, num_clients=300):
+    """Returns (fact_df, client_dim_df): one frequent distributor, many rare ones,
+    two years of days, and a few facts of clients without a dimension row."""
+    rng = np.random.default_rng(seed)
+    client_dim_df = pd.DataFrame({
+        'IDCLIENTE': np.arange(num_clients),
+        'IDDISTRIBUIDOR': rng.integers(1, 60, num_clients),
+        'CategoriaCliente': pd.Series(rng.choice(['Cobre', 'Plata', 'Oro', 'Platino'], num_clients), dtype='string'),
+        'EsRecomendado': rng.random(num_clients) < 0.3
+    })
+    days = pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 730, num_rows), unit='D')
+    fact_df = pd.DataFrame({
+        'IDTiempo': days.strftime('%Y%m%d').astype('int64'),
+        'IDCLIENTE': rng.integers(0, num_clients + 5, num_rows),
+        'IDDISTRIBUIDOR': pd.array(np.where(rng.random(num_rows) < 0.5, 1, rng.integers(2, 60, num_rows)), dtype='Int64'),
+        'MontoPrestamo': rng.integers(100, 5000, num_rows).astype('float64'),
+        'CantidadTransacciones': rng.integers(1, 4, num_rows).astype('int32')
+    })
+    return fact_df, client_dim_df
+
+
+def expected_rows(fact_df, client_dim_df, where):
+    """Returns the positions of the rows matching every filter, with a boolean mask."""
+    attributes = bitmapindex.fact_attributes(fact_df, client_dim_df)
+    mask = np.ones(len(fact_df), dtype=bool)
+    for attribute, values in where.items():
+        values = values if isinstance(values, list) else [values]
+        mask &= attributes[attribute].isin(values).to_numpy()
+    return np.flatnonzero(mask)
+
+
+class BitmapIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fact_df, self.client_dim_df = make_fixture()
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.index_dir = self.tmp_dir / "fact_bitmaps"
+        self.fact_file = self.tmp_dir / "fact_transactions.csv"
+        self.fact_df.to_csv(self.fact_file, index=False)
+
+    def assert_matches_mask(self, index, fact_df=None):
+        fact_df = self.fact_df if fact_df is None else fact_df
+        for where in FILTERS:
+            with self.subTest(where=where):
+                expected = expected_rows(fact_df, self.client_dim_df, where)
+                np.testing.assert_array_equal(index.rows(**where), expected)
+                self.assertEqual(index.count(**where), len(expected))
+
+    def test_rows_match_a_boolean_mask(self):
+        index = bitmapindex.BitmapIndex.build(self.fact_df, self.client_dim_df)
+        # The fixture exercises both kinds of containers
+        kinds = {container.dtype == np.uint8 for container in index.containers['distributor'].values()}
+        self.assertEqual(kinds, {True, False})
+        self.assert_matches_mask(index)
+        np.testing.assert_array_equal(index.rows(), np.arange(len(self.fact_df)))
+
+    def test_saved_and_appended_segments_match_a_boolean_mask(self):
+        batches = np.array_split(np.arange(len(self.fact_df)), 6)
+        bitmapindex.build_index_file(self.fact_df.iloc[batches[0]], self.client_dim_df, self.index_dir, self.fact_file)
+        with mock.patch.object(bitmapindex, 'BITMAP_MAX_SEGMENTS', 3):
+            for batch in batches[1:]:
+                bitmapindex.append_to_index_file(self.fact_df.iloc[batch].reset_index(drop=True),
+                                                 self.client_dim_df, self.index_dir, self.fact_file)
+                segments = bitmapindex._read_manifest(self.index_dir)['segments']
+                self.assertLessEqual(len(segments), 3)
+        self.assert_matches_mask(bitmapindex.read_index(self.index_dir))
+
+    def test_stale_index_is_rebuilt(self):
+        client_file = self.tmp_dir / "dim_client.csv"
+        self.client_dim_df.to_csv(client_file, index=False)
+        fewer = self.fact_df.iloc[:1000]
+        bitmapindex.build_index_file(fewer, self.client_dim_df, self.index_dir, self.fact_file)
+        with mock.patch.object(bitmapindex, 'DIM_CLIENT_FILE', client_file):
+            index = bitmapindex.load_index(len(self.fact_df), self.index_dir, self.fact_file)
+        self.assertEqual(index.num_rows, len(self.fact_df))
+        self.assert_matches_mask(index)
+
+    def test_concurrent_rebuilds_leave_a_complete_index(self):
+        errors = []
+
+        def rebuild():
+            try:
+                bitmapindex.build_index_file(self.fact_df, self.client_dim_df, self.index_dir, self.fact_file)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=rebuild) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(list(self.index_dir.glob("*.tmp")), [])
+        self.assert_matches_mask(bitmapindex.load_index(len(self.fact_df), self.index_dir, self.fact_file))
+
+
+class FilteredFactsTest(unittest.TestCase):
+    """reportdata.filtered_facts() over processed tables written to a temporary folder."""
+
+    def setUp(self):
+        self.fact_df, self.client_dim_df = make_fixture()
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        dates = pd.to_datetime(self.fact_df['IDTiempo'].drop_duplicates().astype(str), format='%Y%m%d')
+        tables = {
+            'dim_client': self.client_dim_df,
+            'dim_distributor': pd.DataFrame({'IDDISTRIBUIDOR': np.arange(1, 60),
+                                             'NombreDistribuidor': [f"D{i}" for i in range(1, 60)],
+                                             'Telefono': "5512345678"}),
+            'dim_time': pd.DataFrame({'FechaCompleta': dates.dt.strftime('%Y-%m-%d'),
+                                      'IDTiempo': dates.dt.strftime('%Y%m%d').astype('int64'),
+                                      'Año': dates.dt.year, 'Mes': dates.dt.month, 'Dia': dates.dt.day}),
+            'fact_transactions': self.fact_df,
+        }
+        patched_tables = {}
+        for name, (_, read_options) in reportdata.TABLES.items():
+            file_path = self.tmp_dir / f"{name}.csv"
+            tables[name].to_csv(file_path, index=False)
+            patched_tables[name] = (file_path, read_options)
+        fact_file = patched_tables['fact_transactions'][0]
+        index_dir = self.tmp_dir / "fact_bitmaps"
+        load_index = bitmapindex.load_index
+        patches = [
+            mock.patch.object(reportdata, 'TABLES', patched_tables),
+            mock.patch.object(bitmapindex, 'DIM_CLIENT_FILE', patched_tables['dim_client'][0]),
+            mock.patch.object(bitmapindex, 'load_index',
+                              lambda num_rows: load_index(num_rows, index_dir, fact_file)),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        reportdata.clear_cache()
+        self.addCleanup(reportdata.clear_cache)
+
+    def test_filtered_facts_equal_a_boolean_mask_filter(self):
+        facts = reportdata.facts_full()
+        for where in FILTERS:
+            with self.subTest(where=where):
+                mask = np.zeros(len(facts), dtype=bool)
+                mask[expected_rows(self.fact_df, self.client_dim_df, where)] = True
+                pd.testing.assert_frame_equal(reportdata.filtered_facts(**where),
+                                              facts[mask].reset_index(drop=True))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
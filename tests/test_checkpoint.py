@@ -0,0 +1,133 @@
+# tests/test_checkpoint.py
+#--------------------------------------------------------------------------------
+# Tests of the ETL stage checkpoints (src/checkpoint.py) and of resuming a failed
+# run of the pipeline (src/main.py) from its first incomplete stage. The stages
+# are replaced by small fakes, so no raw data is read.
+# Run them with:  python -m unittest discover tests  (or python -m pytest tests)
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+import checkpoint
+import main
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        patcher = mock.patch.object(checkpoint, 'CHECKPOINT_DIR', self.tmp_dir / "checkpoints")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_stage_outputs_round_trip(self):
+        frames = {'dim_client': pd.DataFrame({'IDCLIENTE': [1, 2], 'EsRecomendado': [True, False]})}
+        checkpoint.save_stage('20250101_000000', 'transform', frames)
+        loaded = checkpoint.load_stage('20250101_000000', 'transform')
+        self.assertEqual(list(loaded), ['dim_client'])
+        pd.testing.assert_frame_equal(loaded['dim_client'], frames['dim_client'])
+        self.assertEqual(checkpoint.load_state('20250101_000000')['completed_stages'], ['transform'])
+
+    def test_finds_the_latest_run_that_did_not_complete(self):
+        self.assertIsNone(checkpoint.find_resumable_run())
+        for run_id, status in [('20250101_000000', 'failed'), ('20250102_000000', 'failed'),
+                               ('20250103_000000', 'completed')]:
+            checkpoint.save_stage(run_id, 'extract', {})
+            checkpoint.mark_run(run_id, status)
+        self.assertEqual(checkpoint.find_resumable_run(), '20250102_000000')
+
+    def test_cleanup_keeps_the_latest_runs(self):
+        run_ids = [f"2025010{day}_000000" for day in range(1, 6)]
+        for run_id in run_ids:
+            checkpoint.save_stage(run_id, 'extract', {})
+        # The oldest run is also past the maximum age
+        old = time.time() - (checkpoint.CHECKPOINT_MAX_AGE_DAYS + 1) * 24 * 3600
+        os.utime(checkpoint.CHECKPOINT_DIR / run_ids[0], (old, old))
+        with mock.patch.object(checkpoint, 'CHECKPOINT_RETENTION_RUNS', 2):
+            checkpoint.cleanup_checkpoints(keep_run_id=run_ids[1])
+        remaining = sorted(path.name for path in checkpoint.CHECKPOINT_DIR.iterdir())
+        self.assertEqual(remaining, [run_ids[1], run_ids[3], run_ids[4]])
+
+
+class ResumeTest(unittest.TestCase):
+    """Runs main.main() over fake stages, the transform failing on its first call."""
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.calls = []
+        self.transform_fails = True
+        patches = [
+            mock.patch.object(checkpoint, 'CHECKPOINT_DIR', self.tmp_dir / "checkpoints"),
+            mock.patch.object(main, 'extract', self.fake_extract),
+            mock.patch.object(main, 'transform', self.fake_transform),
+            mock.patch.object(main, 'load', self.fake_load),
+            mock.patch.object(main, 'publish', self.fake_publish),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def fake_extract(self, chunked=None):
+        self.calls.append('extract')
+        return {'clients': pd.DataFrame({'IDCLIENTE': [1, 2, 3]})}
+
+    def fake_transform(self, extracted, workers):
+        self.calls.append('transform')
+        if self.transform_fails:
+            raise RuntimeError("transform failed")
+        self.transformed_input = extracted
+        return {'dim_client': extracted['clients'].assign(EsRecomendado=True)}
+
+    def fake_load(self, tables):
+        self.calls.append('load')
+        self.loaded_input = tables
+        return {}
+
+    def fake_publish(self, run_id):
+        self.calls.append('publish')
+        return {}
+
+    def test_resume_skips_the_completed_stages(self):
+        with self.assertRaises(RuntimeError):
+            main.main(run_id='20250101_000000')
+        self.assertEqual(self.calls, ['extract', 'transform'])
+        state = checkpoint.load_state('20250101_000000')
+        self.assertEqual((state['status'], state['completed_stages']), ('failed', ['extract']))
+
+        self.calls.clear()
+        self.transform_fails = False
+        self.assertTrue(main.main(resume=True))
+        self.assertEqual(self.calls, ['transform', 'load', 'publish'])
+        # The transform got the extract outputs from the checkpoint, and fed the load stage
+        pd.testing.assert_frame_equal(self.transformed_input['clients'], pd.DataFrame({'IDCLIENTE': [1, 2, 3]}))
+        self.assertEqual(list(self.loaded_input), ['dim_client'])
+        state = checkpoint.load_state('20250101_000000')
+        self.assertEqual(state['status'], 'completed')
+        self.assertEqual(state['completed_stages'], main.STAGES)
+
+    def test_completed_run_is_not_resumed(self):
+        self.transform_fails = False
+        self.assertTrue(main.main(run_id='20250101_000000'))
+        self.calls.clear()
+        self.assertTrue(main.main(resume=True))
+        # A new run starts from the first stage
+        self.assertEqual(self.calls, ['extract', 'transform', 'load', 'publish'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# tests/test_excelstream.py
+#--------------------------------------------------------------------------------
+# Tests of the streaming Excel writer (src/excelstream.py): values of every
+# column dtype, missing values written as empty cells, and the rollover to a new
+# sheet at the row limit. The workbooks are read back with openpyxl.
+# Run them with:  python -m unittest discover tests  (or python -m pytest tests)
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import openpyxl
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+import excelstream
+
+
+class ExcelStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def write(self, df, max_rows=excelstream.EXCEL_MAX_ROWS):
+        """Writes df and returns {sheet name: rows read back}."""
+        file_path = self.tmp_dir / "frame.xlsx"
+        workbook = excelstream.open_streaming_workbook(file_path)
+        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+        specs = [(12, date_format if pd.api.types.is_datetime64_any_dtype(df[column]) else None) for column in df]
+        sheet_names = excelstream.write_frame_streaming(workbook, 'Data', df, specs, max_rows=max_rows)
+        workbook.close()
+        book = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            return {name: [list(row) for row in book[name].iter_rows(values_only=True)] for name in sheet_names}
+        finally:
+            book.close()
+
+    def test_missing_values_are_empty_cells(self):
+        df = pd.DataFrame({
+            'ID': [1, 2],
+            'Name': pd.array(['PETSO', pd.NA], dtype='string'),
+            'Label': pd.Series(['Oro', None], dtype=object),
+            'Category': pd.Categorical(['Cobre', None]),
+            'Amount': [1.5, float('nan')],
+            'Count': pd.array([3, pd.NA], dtype='Int64'),
+            'Flag': pd.array([True, pd.NA], dtype='boolean'),
+            'Date': pd.to_datetime(['2024-11-02', None]),
+            'Month': pd.Series([pd.Period('2024-11', freq='M'), pd.NaT]),
+        })
+        rows = self.write(df)['Data']
+        self.assertEqual(rows[0], list(df.columns))
+        self.assertEqual(rows[1], [1, 'PETSO', 'Oro', 'Cobre', 1.5, 3, True, datetime(2024, 11, 2), '2024-11'])
+        self.assertEqual(rows[2], [2] + [None] * (len(df.columns) - 1))
+
+    def test_rows_roll_over_to_new_sheets(self):
+        df = pd.DataFrame({'ID': range(7)})
+        sheets = self.write(df, max_rows=4)
+        self.assertEqual(list(sheets), ['Data', 'Data (2)', 'Data (3)'])
+        self.assertEqual([[row[0] for row in rows[1:]] for rows in sheets.values()], [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertTrue(all(rows[0] == ['ID'] for rows in sheets.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+# tests/test_mailer.py
+#--------------------------------------------------------------------------------
+# Tests of the pooled SMTP session (src/mailer.py) against a stub SMTP server
+# running in-process on localhost, so no mail server is needed.
+# Run them with:  python -m unittest discover tests  (or python -m pytest tests)
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import socketserver
+import sys
+import threading
+import time
+import unittest
+from email.message import EmailMessage
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+import mailer
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib: EHLO, MAIL, RCPT, DATA, NOOP, RSET and QUIT."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            session = len(server.sessions)
+            server.sessions.append({'messages': 0, 'closed_by_client': False})
+        self.reply("220 stub ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                server.sessions[session]['closed_by_client'] = True
+                return
+            command = line.decode('ascii', 'replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply("250 stub")
+            elif command.startswith(('MAIL', 'RCPT', 'NOOP', 'RSET')):
+                self.reply("250 OK")
+            elif command == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with server.lock:
+                    reject = server.reject_next_with_421
+                    server.reject_next_with_421 = False
+                    if not reject:
+                        server.sessions[session]['messages'] += 1
+                        server.received.append(time.monotonic())
+                if reject:
+                    # Keep the socket open: the client is the one who has to drop it
+                    self.reply("421 Too many messages, closing the session")
+                else:
+                    self.reply("250 Queued")
+            elif command == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('localhost', 0), StubSMTPHandler)
+        self.lock = threading.Lock()
+        self.sessions = []
+        self.received = []
+        self.reject_next_with_421 = False
+
+
+def make_message(number):
+    message = EmailMessage()
+    message['From'] = "reports@example.com"
+    message['To'] = "boss@example.com"
+    message['Subject'] = f"Report {number}"
+    message.set_content("Please find the report attached.")
+    return message
+
+
+class MailerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubSMTPServer()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_mailer(self, rate_per_minute=0):
+        return mailer.Mailer('localhost', self.port, "reports@example.com", starttls=False,
+                             rate_per_minute=rate_per_minute, timeout=5)
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_messages_share_one_session(self):
+        with self.make_mailer() as session:
+            sent, failed = session.send_many([make_message(number) for number in range(5)])
+        self.assertEqual((len(sent), failed), (5, []))
+        self.assertEqual(len(self.server.sessions), 1)
+        self.assertEqual(self.server.sessions[0]['messages'], 5)
+
+    def test_sends_are_spaced_by_the_rate_limit(self):
+        # 600 messages per minute: at least 0.1s between two sends
+        with self.make_mailer(rate_per_minute=600) as session:
+            session.send_many([make_message(number) for number in range(4)])
+        gaps = [later - earlier for earlier, later in zip(self.server.received, self.server.received[1:])]
+        self.assertEqual(len(gaps), 3)
+        self.assertTrue(all(gap >= 0.09 for gap in gaps), gaps)
+
+    def test_reconnects_and_resends_after_421(self):
+        with self.make_mailer() as session:
+            session.send(make_message(1))
+            self.server.reject_next_with_421 = True
+            session.send(make_message(2))
+            session.send(make_message(3))
+            self.assertEqual(session.sent_count, 3)
+
+        self.assertEqual(len(self.server.sessions), 2)
+        self.assertEqual([s['messages'] for s in self.server.sessions], [1, 2])
+        # The rejected session was closed by the client, not left open
+        self.assertTrue(self.wait_for(lambda: self.server.sessions[0]['closed_by_client']))
+
+    def test_gives_up_after_the_retries(self):
+        with self.make_mailer() as session:
+            self.server.reject_next_with_421 = True
+            original_retries, mailer.MAIL_SEND_RETRIES = mailer.MAIL_SEND_RETRIES, 0
+            try:
+                sent, failed = session.send_many([make_message(1)])
+            finally:
+                mailer.MAIL_SEND_RETRIES = original_retries
+        self.assertEqual((sent, len(failed)), ([], 1))
+        self.assertEqual(failed[0][1].smtp_code, 421)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+# tests/test_outbox.py
+#--------------------------------------------------------------------------------
+# Tests of the durable outbox (src/outbox.py): delivery to the stub SMTP server
+# of tests/test_mailer.py, journal replay and compaction, retries with
+# exponential backoff, the maximum number of attempts, the delivery lock, and
+# that waiting for the journal lock does not stall the event loop.
+# Run them with:  python -m unittest discover tests  (or python -m pytest tests)
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import asyncio
+import json
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import mailer
+import outbox
+from test_mailer import StubSMTPServer, make_message
+
+
+def unused_port():
+    """Returns a local port nothing listens on, so connecting to it is refused."""
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubSMTPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.port = self.server.server_address[1]
+
+        outbox_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, outbox_dir)
+        patches = [
+            mock.patch.object(outbox, 'OUTBOX_DIR', outbox_dir),
+            mock.patch.object(outbox, 'SPOOL_DIR', outbox_dir / "spool"),
+            mock.patch.object(outbox, 'JOURNAL_FILE', outbox_dir / "journal.jsonl"),
+            mock.patch.object(outbox, 'JOURNAL_LOCK_FILE', outbox_dir / "journal.lock"),
+            mock.patch.object(outbox, 'DELIVERY_LOCK_FILE', outbox_dir / "delivery.lock"),
+            mock.patch.object(outbox, 'OUTBOX_BACKOFF_SECONDS', 30),
+            mock.patch.object(outbox, 'OUTBOX_MAX_BACKOFF_SECONDS', 100),
+            mock.patch.object(outbox, 'OUTBOX_MAX_ATTEMPTS', 3),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def create_mailer(self, rate_per_minute, port=None):
+        return mailer.Mailer('localhost', port or self.port, "reports@example.com", starttls=False,
+                             rate_per_minute=rate_per_minute, timeout=5)
+
+    def deliver(self, port=None, connections=2):
+        return asyncio.run(outbox.deliver_due(lambda rate: self.create_mailer(rate, port),
+                                              connections=connections, rate_per_minute=0))
+
+    def enqueue(self, number):
+        return outbox.enqueue(make_message(number), f"<report-{number}@example.com>")
+
+    def make_due(self):
+        """Moves the next attempt of every retried message to now."""
+        for record in outbox.load_state().values():
+            if record['state'] == 'retry':
+                outbox._journal(record['id'], 'retry', next_attempt=time.time())
+
+    def test_delivers_the_queued_messages_once(self):
+        for number in range(5):
+            self.assertTrue(self.enqueue(number))
+        self.assertFalse(self.enqueue(0))
+
+        self.assertEqual(self.deliver(), {'sent': 5, 'retry': 0, 'failed': 0})
+        self.assertEqual(sum(session['messages'] for session in self.server.sessions), 5)
+        self.assertEqual(list(outbox.SPOOL_DIR.glob("*.eml")), [])
+        self.assertEqual({record['state'] for record in outbox.load_state().values()}, {'sent'})
+
+        # A sent message is neither queued nor delivered again
+        self.assertFalse(self.enqueue(0))
+        self.assertEqual(self.deliver(), {'sent': 0, 'retry': 0, 'failed': 0})
+
+    def test_journal_replay_merges_records_and_skips_a_torn_line(self):
+        outbox.OUTBOX_DIR.mkdir(parents=True, exist_ok=True)
+        with open(outbox.JOURNAL_FILE, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'id': 'a', 'state': 'queued', 'to': 'boss@example.com', 'attempts': 0}) + "\n")
+            f.write(json.dumps({'id': 'b', 'state': 'queued', 'attempts': 0}) + "\n")
+            f.write(json.dumps({'id': 'a', 'state': 'retry', 'attempts': 1, 'next_attempt': 5}) + "\n")
+            f.write('{"id": "b", "state": "se')
+        state = outbox.load_state()
+        self.assertEqual(state['a'], {'id': 'a', 'state': 'retry', 'to': 'boss@example.com',
+                                      'attempts': 1, 'next_attempt': 5})
+        self.assertEqual(state['b']['state'], 'queued')
+        self.assertEqual([record['id'] for record in outbox.due_messages(now=10)], ['a', 'b'])
+        self.assertEqual([record['id'] for record in outbox.due_messages(now=1)], ['b'])
+
+        outbox.compact_journal()
+        self.assertEqual(outbox.load_state(), state)
+        self.assertEqual(len(outbox.JOURNAL_FILE.read_text(encoding='utf-8').splitlines()), 2)
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        self.assertEqual([outbox.backoff_delay(attempts) for attempts in range(1, 6)], [30, 60, 100, 100, 100])
+
+    def test_failed_delivery_is_retried_after_the_backoff(self):
+        self.enqueue(1)
+        started = time.time()
+        self.assertEqual(self.deliver(port=unused_port()), {'sent': 0, 'retry': 1, 'failed': 0})
+        record = outbox.load_state()['<report-1@example.com>']
+        self.assertEqual((record['state'], record['attempts']), ('retry', 1))
+        self.assertGreaterEqual(record['next_attempt'], started + 30)
+        self.assertTrue(outbox._spool_path(record['id']).exists())
+
+        # Not due yet: nothing is attempted
+        self.assertEqual(self.deliver(), {'sent': 0, 'retry': 0, 'failed': 0})
+        self.make_due()
+        self.assertEqual(self.deliver(), {'sent': 1, 'retry': 0, 'failed': 0})
+        record = outbox.load_state()['<report-1@example.com>']
+        self.assertEqual((record['state'], record['attempts']), ('sent', 2))
+
+    def test_message_fails_after_the_maximum_attempts(self):
+        self.enqueue(1)
+        dead_port = unused_port()
+        outcomes = []
+        for _ in range(4):
+            outcomes.append(self.deliver(port=dead_port))
+            self.make_due()
+        self.assertEqual(outcomes, [{'sent': 0, 'retry': 1, 'failed': 0}, {'sent': 0, 'retry': 1, 'failed': 0},
+                                    {'sent': 0, 'retry': 0, 'failed': 1}, {'sent': 0, 'retry': 0, 'failed': 0}])
+        record = outbox.load_state()['<report-1@example.com>']
+        self.assertEqual((record['state'], record['attempts']), ('failed', 3))
+        # A failed message is not delivered once the server is back
+        self.assertEqual(self.deliver(), {'sent': 0, 'retry': 0, 'failed': 0})
+        self.assertEqual(self.server.sessions, [])
+
+    def test_nothing_is_sent_while_another_process_delivers(self):
+        self.enqueue(1)
+        with outbox._locked(outbox.DELIVERY_LOCK_FILE) as acquired:
+            self.assertTrue(acquired)
+            self.assertEqual(self.deliver(), {'sent': 0, 'retry': 0, 'failed': 0})
+        self.assertEqual(self.deliver(), {'sent': 1, 'retry': 0, 'failed': 0})
+
+    def test_waiting_for_the_journal_lock_does_not_stall_the_event_loop(self):
+        for number in range(3):
+            self.enqueue(number)
+        lock_held = threading.Event()
+
+        def hold_journal_lock():
+            with outbox._locked(outbox.JOURNAL_LOCK_FILE):
+                lock_held.set()
+                time.sleep(0.5)
+
+        async def deliver_and_tick():
+            delivery = asyncio.ensure_future(outbox.deliver_due(self.create_mailer, connections=2, rate_per_minute=0))
+            gaps, last = [], time.monotonic()
+            while not delivery.done():
+                await asyncio.sleep(0.02)
+                gaps.append(time.monotonic() - last)
+                last = time.monotonic()
+            return await delivery, max(gaps)
+
+        holder = threading.Thread(target=hold_journal_lock)
+        holder.start()
+        lock_held.wait()
+        results, longest_gap = asyncio.run(deliver_and_tick())
+        holder.join()
+        self.assertEqual(results, {'sent': 3, 'retry': 0, 'failed': 0})
+        self.assertLess(longest_gap, 0.3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+# tests/test_rollingmetrics.py
+#--------------------------------------------------------------------------------
+# Tests of the rolling distributor metrics (src/rollingmetrics.py): the
+# cumulative-sum windows, the distinct recommended clients and the incremental
+# updates are checked against a brute-force rolling computation over a small
+# generated fact table.
+# Run them with:  python -m unittest discover tests  (or python -m pytest tests)
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+import rollingmetrics
+
+WINDOWS = [1, 3, 7]
+FIRST_DAY = pd.Timestamp('2024-01-01')
+
+
+def make_fixture(seed=7, num_days=40, num_facts=150):
+    """Returns (facts, dim_client): a few distributors and clients over num_days,
+    with idle days and a distributor idle for longer than the largest window."""
+    rng = np.random.default_rng(seed)
+    dim_client = pd.DataFrame({
+        'IDCLIENTE': np.arange(100, 112),
+        'IDDISTRIBUIDOR': np.arange(12) % 3 + 1,
+        'CategoriaCliente': 'Oro',
+        'EsRecomendado': np.arange(12) % 2 == 0
+    })
+    clients = rng.choice(dim_client['IDCLIENTE'], num_facts)
+    days = rng.integers(0, num_days, num_facts)
+    facts = pd.DataFrame({
+        'Fecha': FIRST_DAY + pd.to_timedelta(days, unit='D'),
+        'IDCLIENTE': clients,
+        'IDDISTRIBUIDOR': rng.integers(1, 4, num_facts),
+        'MontoPrestamo': rng.integers(100, 5000, num_facts).astype('float64'),
+        'CantidadTransacciones': rng.integers(1, 4, num_facts).astype('int32')
+    })
+    # Distributor 3 is idle from day 10 to day 25, longer than every window
+    facts = facts[~((facts['IDDISTRIBUIDOR'] == 3) & (days >= 10) & (days <= 25))]
+    # No activity at all on day 30
+    facts = facts[facts['Fecha'] != FIRST_DAY + pd.Timedelta(days=30)]
+    return facts.reset_index(drop=True), dim_client
+
+
+def with_recommended(facts, dim_client):
+    """Adds EsRecomendado to the facts, as load_rolling_inputs does."""
+    return facts.merge(dim_client[['IDCLIENTE', 'EsRecomendado']], on='IDCLIENTE', how='left')
+
+
+def brute_force(facts, windows=WINDOWS):
+    """Returns the rolling metrics by filtering the facts of every day and distributor window."""
+    rows = []
+    days = pd.date_range(facts['Fecha'].min(), facts['Fecha'].max(), freq='D')
+    for day in days:
+        for distributor in sorted(facts['IDDISTRIBUIDOR'].unique()):
+            row = {'Fecha': day, 'IDDISTRIBUIDOR': distributor}
+            for window in windows:
+                in_window = facts[(facts['IDDISTRIBUIDOR'] == distributor)
+                                  & (facts['Fecha'] > day - pd.Timedelta(days=window))
+                                  & (facts['Fecha'] <= day)]
+                row[f'LoanAmount_{window}d'] = in_window['MontoPrestamo'].sum()
+                row[f'Transactions_{window}d'] = in_window['CantidadTransacciones'].sum()
+                row[f'ActiveRecommendedClients_{window}d'] = in_window.loc[in_window['EsRecomendado'], 'IDCLIENTE'].nunique()
+            rows.append(row)
+    table = pd.DataFrame(rows)
+    return table[table[f'Transactions_{max(windows)}d'] > 0].reset_index(drop=True)
+
+
+class RollingMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.facts, self.dim_client = make_fixture()
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.original_files = (rollingmetrics.FACT_TRANSACTIONS_FILE, rollingmetrics.DIM_CLIENT_FILE,
+                               rollingmetrics.ROLLING_METRICS_FILE)
+        rollingmetrics.FACT_TRANSACTIONS_FILE = self.tmp_dir / "fact_transactions.csv"
+        rollingmetrics.DIM_CLIENT_FILE = self.tmp_dir / "dim_client.csv"
+        rollingmetrics.ROLLING_METRICS_FILE = self.tmp_dir / "agg_distributor_rolling.csv"
+        self.dim_client.to_csv(rollingmetrics.DIM_CLIENT_FILE, index=False)
+
+    def tearDown(self):
+        (rollingmetrics.FACT_TRANSACTIONS_FILE, rollingmetrics.DIM_CLIENT_FILE,
+         rollingmetrics.ROLLING_METRICS_FILE) = self.original_files
+        shutil.rmtree(self.tmp_dir)
+
+    def write_facts(self, facts):
+        facts = facts.assign(IDTiempo=facts['Fecha'].dt.strftime('%Y%m%d').astype('int64'))
+        facts[['IDTiempo', 'IDCLIENTE', 'IDDISTRIBUIDOR', 'MontoPrestamo', 'CantidadTransacciones']].to_csv(
+            rollingmetrics.FACT_TRANSACTIONS_FILE, index=False
+        )
+
+    def read_table(self):
+        return pd.read_csv(rollingmetrics.ROLLING_METRICS_FILE, parse_dates=['Fecha'])
+
+    def assert_same_metrics(self, table, expected):
+        columns = list(expected.columns)
+        table = table[columns].sort_values(['Fecha', 'IDDISTRIBUIDOR']).reset_index(drop=True)
+        expected = expected.sort_values(['Fecha', 'IDDISTRIBUIDOR']).reset_index(drop=True)
+        pd.testing.assert_frame_equal(table, expected, check_dtype=False)
+
+    def test_full_computation_matches_brute_force(self):
+        facts = with_recommended(self.facts, self.dim_client)
+        table = rollingmetrics.compute_rolling_metrics(facts, windows=WINDOWS)
+        self.assert_same_metrics(table, brute_force(facts))
+
+    def test_idle_distributor_rows_are_left_out(self):
+        facts = with_recommended(self.facts, self.dim_client)
+        table = rollingmetrics.compute_rolling_metrics(facts, windows=WINDOWS)
+        idle_days = table[(table['IDDISTRIBUIDOR'] == 3) & (table['Fecha'] >= FIRST_DAY + pd.Timedelta(days=17))
+                          & (table['Fecha'] <= FIRST_DAY + pd.Timedelta(days=25))]
+        self.assertTrue(idle_days.empty)
+
+    def test_incremental_update_matches_full_rebuild(self):
+        split_day = FIRST_DAY + pd.Timedelta(days=20)
+        self.write_facts(self.facts[self.facts['Fecha'] < split_day])
+        rollingmetrics.update_rolling_metrics(full=True, windows=WINDOWS)
+
+        self.write_facts(self.facts)
+        rollingmetrics.update_rolling_metrics(windows=WINDOWS)
+        self.assert_same_metrics(self.read_table(), brute_force(with_recommended(self.facts, self.dim_client)))
+
+    def test_update_without_new_facts_keeps_the_table(self):
+        self.write_facts(self.facts)
+        rows = rollingmetrics.update_rolling_metrics(full=True, windows=WINDOWS)
+        self.assertEqual(rollingmetrics.update_rolling_metrics(windows=WINDOWS), 0)
+        self.assertEqual(len(self.read_table()), rows)
+
+    def test_update_since_picks_up_late_facts(self):
+        self.write_facts(self.facts)
+        rollingmetrics.update_rolling_metrics(full=True, windows=WINDOWS)
+
+        # A late transaction of a recommended client on an already materialized day
+        late_day = FIRST_DAY + pd.Timedelta(days=12)
+        late = pd.DataFrame({'Fecha': [late_day], 'IDCLIENTE': [100], 'IDDISTRIBUIDOR': [2],
+                             'MontoPrestamo': [999.0], 'CantidadTransacciones': [1]})
+        facts = pd.concat([self.facts, late], ignore_index=True)
+        self.write_facts(facts)
+        rollingmetrics.update_rolling_metrics(since=late_day, windows=WINDOWS)
+        self.assert_same_metrics(self.read_table(), brute_force(with_recommended(facts, self.dim_client)))
+
+
+if __name__ == '__main__':
+    unittest.main()
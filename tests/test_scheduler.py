@@ -0,0 +1,192 @@
+# tests/test_scheduler.py
+#--------------------------------------------------------------------------------
+# Tests of the built-in scheduler (src/scheduler.py): cron expression parsing and
+# matching, the job graph, the order in which run_graph() starts the jobs, the
+# outputs passed on to the dependent jobs, skipping the dependents of a failed
+# job, and the run lock. The jobs are replaced by a fake that logs when it ran.
+# Run them with:  python -m unittest discover tests  (or python -m pytest tests)
+#
+# author: ekastel
+# date: 2025-06-27
+#--------------------------------------------------------------------------------
+
+import json
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+import reportregistry
+import scheduler
+
+# Folder where the fake jobs log their runs; set before the worker processes start
+JOB_LOG_DIR = None
+
+
+def fake_run_job(job, inputs=None):
+    """Stands in for scheduler._run_job: logs the run, fails the jobs named fail*."""
+    started = time.time()
+    time.sleep(0.05)
+    if job.startswith('fail'):
+        raise RuntimeError(f"{job} failed")
+    ended = time.time()
+    with open(Path(JOB_LOG_DIR) / f"{job}.json", 'w', encoding='utf-8') as f:
+        json.dump({'started': started, 'ended': ended, 'inputs': inputs}, f)
+    return ended - started, [f"{job}.out"]
+
+
+def jobs_graph(**edges):
+    """Builds a job graph from job=('requires', 'after') strings of space-separated names."""
+    return {job: {'requires': requires.split(), 'after': after.split()} for job, (requires, after) in edges.items()}
+
+
+class CronTriggerTest(unittest.TestCase):
+
+    def fires(self, expression, *moments):
+        trigger = scheduler.CronTrigger(expression)
+        return [trigger.matches(datetime.fromisoformat(moment)) for moment in moments]
+
+    def test_every_field_accepts_lists_ranges_and_steps(self):
+        trigger = scheduler.CronTrigger("*/15 8-10,20 1,15 1-12/3 *")
+        minutes, hours, days, months, weekdays = trigger.allowed
+        self.assertEqual(minutes, {0, 15, 30, 45})
+        self.assertEqual(hours, {8, 9, 10, 20})
+        self.assertEqual(days, {1, 15})
+        self.assertEqual(months, {1, 4, 7, 10})
+        self.assertEqual(weekdays, set(range(8)))
+        self.assertEqual(scheduler.CronTrigger("5/20 6-18/6 * * *").allowed[:2], [{5, 25, 45}, {6, 12, 18}])
+
+    def test_weekday_mornings(self):
+        # 2025-06-27 is a Friday
+        self.assertEqual(self.fires("0 6 * * 1-5", "2025-06-27 06:00", "2025-06-27 06:01",
+                                    "2025-06-28 06:00", "2025-06-30 06:00"),
+                         [True, False, False, True])
+
+    def test_seven_is_sunday(self):
+        self.assertEqual(self.fires("30 9 * * 7", "2025-06-29 09:30", "2025-06-30 09:30"), [True, False])
+        self.assertEqual(self.fires("30 9 * * 0", "2025-06-29 09:30"), [True])
+
+    def test_day_of_month_and_day_of_week(self):
+        # Both restricted: either one matches, as in cron
+        self.assertEqual(self.fires("0 0 13 * 5", "2025-06-13 00:00", "2025-06-20 00:00", "2025-07-13 00:00",
+                                    "2025-07-14 00:00"),
+                         [True, True, True, False])
+        # Only the day of month restricted: the day of week does not widen it
+        self.assertEqual(self.fires("0 0 13 * *", "2025-06-13 00:00", "2025-06-20 00:00"), [True, False])
+
+    def test_invalid_expressions_are_rejected(self):
+        for expression in ("0 6 * *", "60 * * * *", "* 24 * * *", "* * 0 * *", "* * * 13 *",
+                           "* * * * 8", "5-1 * * * *"):
+            with self.subTest(expression=expression):
+                with self.assertRaises(ValueError):
+                    scheduler.CronTrigger(expression)
+
+
+class JobGraphTest(unittest.TestCase):
+
+    def test_email_requires_the_required_reports_and_waits_for_the_others(self):
+        jobs = scheduler.build_jobs()
+        reports = reportregistry.REPORT_OPTIONS
+        required = {scheduler.REPORT_JOB_PREFIX + name for name, options in reports.items() if options['required']}
+        optional = {scheduler.REPORT_JOB_PREFIX + name for name, options in reports.items() if not options['required']}
+        self.assertEqual(set(jobs['email']['requires']), required or {'etl'})
+        self.assertEqual(set(jobs['email']['after']), optional)
+        for name in reports:
+            self.assertEqual(jobs[scheduler.REPORT_JOB_PREFIX + name]['requires'], ['etl'])
+
+    def test_required_jobs_selects_the_targets_dependencies(self):
+        jobs = jobs_graph(a=('', ''), b=('a', ''), c=('', 'b'), d=('a', ''))
+        self.assertEqual(scheduler.required_jobs(jobs, ['c']),
+                         jobs_graph(a=('', ''), b=('a', ''), c=('', 'b')))
+        self.assertEqual(list(scheduler.required_jobs(jobs, ['d'])), ['a', 'd'])
+        with self.assertRaises(KeyError):
+            scheduler.required_jobs(jobs, ['missing'])
+
+
+class RunGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        global JOB_LOG_DIR
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        JOB_LOG_DIR = self.tmp_dir
+        patches = [
+            mock.patch.object(scheduler, '_run_job', fake_run_job),
+            mock.patch.object(scheduler, 'SCHEDULER_HISTORY_FILE', self.tmp_dir / "history.jsonl"),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def runs(self):
+        return {path.stem: json.loads(path.read_text(encoding='utf-8')) for path in self.tmp_dir.glob("*.json")}
+
+    def assert_started_after(self, runs, job, others):
+        for other in others:
+            self.assertGreaterEqual(runs[job]['started'], runs[other]['ended'], f"{job} started before {other} ended")
+
+    def test_jobs_start_after_their_dependencies_with_their_outputs(self):
+        jobs = jobs_graph(etl=('', ''), report_a=('etl', ''), report_b=('etl', ''),
+                          email=('report_a', 'report_b'), bi_export=('etl', ''), cleanup=('', 'email bi_export'))
+        status = scheduler.run_graph(jobs, workers=3)
+        self.assertEqual(status, {job: 'ok' for job in jobs})
+
+        runs = self.runs()
+        for job, edges in jobs.items():
+            self.assert_started_after(runs, job, edges['requires'] + edges['after'])
+        self.assertEqual(runs['email']['inputs'], {'report_a': ['report_a.out'], 'report_b': ['report_b.out']})
+        self.assertEqual(runs['etl']['inputs'], {})
+        # The independent jobs ran concurrently
+        self.assertLess(runs['report_a']['started'], runs['report_b']['ended'])
+        self.assertLess(runs['report_b']['started'], runs['report_a']['ended'])
+
+        history = [json.loads(line) for line in (self.tmp_dir / "history.jsonl").read_text().splitlines()]
+        self.assertEqual(sorted(record['job'] for record in history), sorted(jobs))
+
+    def test_dependents_of_a_failed_job_are_skipped(self):
+        jobs = jobs_graph(etl=('', ''), fail_report=('etl', ''), report_b=('etl', ''),
+                          email=('report_b', 'fail_report'), deliver=('email', ''),
+                          summary=('fail_report', ''), after_summary=('summary', ''),
+                          cleanup=('', 'deliver after_summary'))
+        status = scheduler.run_graph(jobs, workers=2)
+        self.assertEqual(status, {
+            'etl': 'ok', 'fail_report': 'failed', 'report_b': 'ok', 'email': 'ok', 'deliver': 'ok',
+            'summary': 'skipped', 'after_summary': 'skipped', 'cleanup': 'ok'
+        })
+        runs = self.runs()
+        # A job waiting 'after' a failed one still runs, without its outputs
+        self.assertEqual(runs['email']['inputs'], {'report_b': ['report_b.out']})
+        self.assertNotIn('summary', runs)
+        self.assertNotIn('after_summary', runs)
+
+        history = [json.loads(line) for line in (self.tmp_dir / "history.jsonl").read_text().splitlines()]
+        failed = [record for record in history if record['status'] == 'failed']
+        self.assertEqual([(record['job'], record['error']) for record in failed], [('fail_report', "fail_report failed")])
+
+    def test_a_cycle_is_reported(self):
+        jobs = jobs_graph(a=('', 'b'), b=('', 'a'))
+        with self.assertRaises(ValueError):
+            scheduler.run_graph(jobs, workers=1)
+
+
+class RunLockTest(unittest.TestCase):
+
+    def test_a_second_run_does_not_get_the_lock(self):
+        tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        lock_file = tmp_dir / "scheduler.lock"
+        with scheduler.RunLock(lock_file) as acquired:
+            self.assertTrue(acquired)
+            with scheduler.RunLock(lock_file) as second:
+                self.assertFalse(second)
+        with scheduler.RunLock(lock_file) as acquired:
+            self.assertTrue(acquired)
+
+
+if __name__ == '__main__':
+    unittest.main()